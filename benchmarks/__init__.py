@@ -0,0 +1,7 @@
+'''File: __init__.py
+
+Module: ``benchmarks``
+
+Benchmarks for the ``scrapers`` package. Each ``bench_*.py`` script may be run directly from the
+root of the repository, for example ``python -m benchmarks.bench_fetcher``.
+'''
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+'''Daemon benchmark: run many small scrape jobs, each of one page of a synthetic site served
+locally, once with a fresh `scraper.py` process per job, and once submitted to a daemon started
+with option --daemon, one job after the other and then --concurrency jobs at a time. Reports jobs
+per second and the median and 95th percentile latency of a job.
+
+   usage:
+       $ python -m benchmarks.bench_daemon [--jobs 50] [--images-per-page 4]
+                                           [--image-size 4k] [--latency 0]
+                                           [--concurrency 8]
+'''
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent import futures
+
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.site_generator import generate_site, parse_size
+from scrapers.Daemon import parse_daemon_address, submit
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def job_args(server, work_dir, index, pages):
+    '''Return the options and URI of the job `index`: a page of the site of `server`, saved to
+    a data directory of its own so that every job downloads its images.
+    '''
+    return ['-nd', '-od', work_dir, '-dd', os.path.join(work_dir, 'job-{}'.format(index)),
+            server.url('/index.html' if index % pages == 0 else
+                       '/p{}/index.html'.format(index % pages))]
+
+
+def run_process(args):
+    '''Run a job in a fresh `scraper.py` process. Returns its latency in seconds.'''
+    start = time.monotonic()
+    subprocess.run([sys.executable, 'scraper.py', 'generic'] + args, cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.monotonic() - start
+
+
+def run_submitted(address, args):
+    '''Submit a job to the daemon at `address`. Returns its latency in seconds.'''
+    start = time.monotonic()
+    for event in submit(address, args):
+        if event['type'] == 'error':
+            raise RuntimeError('job failed: {}'.format(event['error']))
+    return time.monotonic() - start
+
+
+def report(name, latencies, elapsed):
+    '''Print a row of results for the latencies of the jobs of a run that took `elapsed`.'''
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print('{:<20}{:>10.1f}{:>12.1f}{:>12.1f}'.format(
+        name, len(latencies) / elapsed, statistics.median(latencies) * 1000, p95 * 1000))
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=50, help='Number of jobs of each run.')
+    parser.add_argument('--images-per-page', type=int, default=4, help='Images per page.')
+    parser.add_argument('--image-size', type=parse_size, default='4k',
+                        help='Size of each image, such as 16k or 1m.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Server latency per request, in seconds.')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Jobs submitted to the daemon at a time in the concurrent run.')
+    options = parser.parse_args()
+    
+    site = generate_site(pages=10, fanout=3, images_per_page=options.images_per_page,
+                         image_size=options.image_size)
+    print('{} jobs of 1 page and {} images each'.format(options.jobs, options.images_per_page))
+    print('{:<20}{:>10}{:>12}{:>12}'.format('mode', 'jobs/s', 'median ms', 'p95 ms'))
+    work_dir = tempfile.mkdtemp(prefix='bench-daemon-')
+    daemon = None
+    try:
+        with FixtureServer(site.resources, latency=options.latency) as server:
+            run_dir = os.path.join(work_dir, 'process')
+            start = time.monotonic()
+            latencies = [run_process(job_args(server, run_dir, index, site.pages))
+                         for index in range(options.jobs)]
+            report('process per job', latencies, time.monotonic() - start)
+            
+            socket_path = os.path.join(work_dir, 'scraper.sock')
+            daemon = subprocess.Popen([sys.executable, 'scraper.py', 'generic', '--daemon',
+                                       socket_path],
+                                      cwd=ROOT, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL, text=True)
+            if not daemon.stdout.readline().startswith('Daemon listening on '):
+                raise RuntimeError('the daemon did not start')
+            address = parse_daemon_address(socket_path)
+            
+            run_dir = os.path.join(work_dir, 'daemon')
+            start = time.monotonic()
+            latencies = [run_submitted(address, job_args(server, run_dir, index, site.pages))
+                         for index in range(options.jobs)]
+            report('daemon', latencies, time.monotonic() - start)
+            
+            run_dir = os.path.join(work_dir, 'concurrent')
+            start = time.monotonic()
+            with futures.ThreadPoolExecutor(options.concurrency) as executor:
+                latencies = list(executor.map(
+                    lambda index: run_submitted(address, job_args(server, run_dir, index,
+                                                                  site.pages)),
+                    range(options.jobs)))
+            report('daemon x{}'.format(options.concurrency), latencies,
+                   time.monotonic() - start)
+    finally:
+        if daemon is not None:
+            daemon.terminate()
+            daemon.communicate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
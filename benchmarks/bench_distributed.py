@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+'''Distributed crawl benchmark: generate a synthetic site, serve it from a local fixture server
+with some latency, and crawl it with `scraper.py generic --coordinator` and 1, 2, 4... local
+`--worker` processes. Reports the time of each crawl, pages/s, images/s, and the speedup and
+efficiency against a single worker, taking the median of --runs runs.
+
+   usage:
+       $ python -m benchmarks.bench_distributed [--pages 200] [--fanout 8]
+                                                [--images-per-page 5] [--image-size 4k]
+                                                [--latency 0.05] [--workers 1 2 4]
+                                                [--num-resources 8] [--runs 1]
+'''
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.site_generator import generate_site, parse_size
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def count_files(path):
+    '''Return the number of files under the directory `path`.'''
+    return sum(len(files) for _, _, files in os.walk(path))
+
+
+def run_crawl(server, workers, options):
+    '''Crawl the site of `server` once with a coordinator and `workers` worker processes.
+    Returns the elapsed time, in seconds, and the number of images saved.
+    '''
+    work_dir = tempfile.mkdtemp(prefix='bench-distributed-')
+    processes = []
+    try:
+        start = time.monotonic()
+        coordinator = subprocess.Popen(
+            [sys.executable, 'scraper.py', 'generic', '--coordinator', '0', '-od', work_dir,
+             server.url('/index.html')],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        processes.append(coordinator)
+        line = coordinator.stdout.readline()
+        if not line.startswith('Coordinating crawl on '):
+            raise RuntimeError('the coordinator did not start: {!r}'.format(line))
+        address = line.split()[-1]
+        for index in range(workers):
+            data_dir = os.path.join(work_dir, 'worker-{}'.format(index))
+            processes.append(subprocess.Popen(
+                [sys.executable, 'scraper.py', 'generic', '--worker', address,
+                 '-R', str(options.num_resources), '-od', data_dir, '-dd', data_dir],
+                cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        for process in processes:
+            if process.wait() != 0:
+                raise RuntimeError('{} exited with status {}'.format(' '.join(process.args),
+                                                                     process.returncode))
+        elapsed = time.monotonic() - start
+        saved = sum(count_files(os.path.join(work_dir, 'worker-{}'.format(index)))
+                    for index in range(workers))
+        return elapsed, saved
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            if process.stdout is not None:
+                process.stdout.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--pages', type=int, default=200, help='Number of pages.')
+    parser.add_argument('--fanout', type=int, default=8, help='Links to child pages per page.')
+    parser.add_argument('--images-per-page', type=int, default=5, help='Images per page.')
+    parser.add_argument('--image-size', type=parse_size, default='4k',
+                        help='Size of each image, such as 16k or 1m.')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Server latency per request, in seconds.')
+    parser.add_argument('--num-resources', type=int, default=8,
+                        help='Option -R of each worker.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='Numbers of worker processes to run the crawl with.')
+    parser.add_argument('--runs', type=int, default=1, help='Runs with each number of workers.')
+    options = parser.parse_args()
+    
+    site = generate_site(pages=options.pages, fanout=options.fanout,
+                         images_per_page=options.images_per_page,
+                         image_size=options.image_size)
+    print('Site: {} pages, {} images, {:.1f} MB, {:.0f} ms latency'.format(
+        site.pages, site.images, site.image_bytes / 2 ** 20, options.latency * 1000))
+    print('{:>8}{:>10}{:>10}{:>10}{:>10}{:>12}'.format('workers', 'seconds', 'pages/s',
+                                                       'images/s', 'speedup', 'efficiency'))
+    base = None
+    with FixtureServer(site.resources, latency=options.latency) as server:
+        for workers in options.workers:
+            runs = [run_crawl(server, workers, options) for _ in range(options.runs)]
+            elapsed = statistics.median(run[0] for run in runs)
+            saved = min(run[1] for run in runs)
+            if saved < site.images:
+                print('warning: {} workers saved {} of {} images'.format(workers, saved,
+                                                                         site.images),
+                      file=sys.stderr)
+            if base is None:
+                base = elapsed * workers
+            speedup = base / elapsed
+            print('{:>8}{:>10.2f}{:>10.1f}{:>10.1f}{:>10.2f}{:>12.0%}'.format(
+                workers, elapsed, site.pages / elapsed, site.images / elapsed, speedup,
+                speedup / workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+'''End-to-end benchmark: generate a synthetic site, serve it from a local fixture server, and
+crawl it with `scraper.py <scraper> -r` in a fresh interpreter for each of the `generic`, `tumblr`
+and `twitter` scrapers. Reports pages/s, images/s, MB/s, peak RSS, and startup time (from the
+launch of the process to its first request), taking the median of --runs runs.
+
+With --save-baseline, the results are written to a baseline file. With --baseline, they are
+compared against that file instead, and the benchmark exits with status 1 if any of them is
+worse than the baseline by more than --threshold.
+
+   usage:
+       $ python -m benchmarks.bench_e2e [--pages 200] [--fanout 4] [--images-per-page 10]
+                                        [--image-size 16k] [--formats png gif jpg bmp]
+                                        [--latency 0] [--scrapers generic tumblr twitter]
+                                        [--runs 3] [--save-baseline FILE | --baseline FILE]
+                                        [--threshold 0.2]
+'''
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.site_generator import FORMATS, generate_site, parse_size
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metric name, column title, and whether higher is better.
+METRICS = (
+    ('pages_per_s', 'pages/s', True),
+    ('images_per_s', 'images/s', True),
+    ('mb_per_s', 'MB/s', True),
+    ('peak_rss_mb', 'RSS MB', False),
+    ('startup_ms', 'startup ms', False),
+)
+
+
+def run_scraper(server, scraper, site, options):
+    '''Crawl the site of `server` once with `scraper` in a fresh interpreter. Returns a dict of
+    the metrics of the run.
+    '''
+    work_dir = tempfile.mkdtemp(prefix='bench-e2e-')
+    data_dir = os.path.join(work_dir, 'data')
+    stats_file = os.path.join(work_dir, 'stats.json')
+    args = [sys.executable, 'scraper.py', scraper, '-r', '-R', str(options.num_resources),
+            '-od', work_dir, '-dd', data_dir, '--stats-file', stats_file,
+            server.url('/index.html')]
+    try:
+        server.first_request = None
+        start = time.monotonic()
+        with open(os.path.join(work_dir, 'stderr.txt'), 'w+b') as errors:
+            process = subprocess.Popen(args, cwd=ROOT, stdout=subprocess.DEVNULL,
+                                       stderr=errors)
+            _, status, usage = os.wait4(process.pid, 0)
+            elapsed = time.monotonic() - start
+            process.returncode = os.waitstatus_to_exitcode(status)
+            if process.returncode != 0:
+                errors.seek(0)
+                raise RuntimeError('{} failed:\n{}'.format(
+                    ' '.join(args), errors.read().decode('utf-8', errors='replace')))
+        with open(stats_file, encoding='utf-8') as fd:
+            stats = json.load(fd)
+        received = sum(counter['value'] for counter in stats['counters']
+                       if counter['name'] == 'bytes')
+        saved = sum(counter['value'] for counter in stats['counters']
+                    if counter['name'] == 'results' and counter['reason'] in ('saved', 'linked'))
+        if saved != site.images:
+            print('warning: {} saved {} of {} images'.format(scraper, saved, site.images),
+                  file=sys.stderr)
+        startup = (server.first_request or start) - start
+        return {
+            'pages_per_s': site.pages / elapsed,
+            'images_per_s': saved / elapsed,
+            'mb_per_s': received / elapsed / 2 ** 20,
+            'peak_rss_mb': usage.ru_maxrss / 1024,
+            'startup_ms': startup * 1000,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def median_results(runs):
+    '''Return the median of each metric over the list of result dicts `runs`.'''
+    return {name: statistics.median(run[name] for run in runs) for name, _, _ in METRICS}
+
+
+def compare(results, baseline, threshold):
+    '''Return a list of messages for the metrics of `results` that are worse than those of
+    `baseline` by more than the fraction `threshold`.
+    '''
+    regressions = []
+    for scraper, metrics in results.items():
+        for name, title, higher_is_better in METRICS:
+            expected = baseline.get(scraper, {}).get(name)
+            if not expected:
+                continue
+            change = (metrics[name] - expected) / expected
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append('{} {}: {:.1f} vs baseline {:.1f} ({:+.1%})'.format(
+                    scraper, title, metrics[name], expected, change))
+    return regressions
+
+
+def main():
+    '''Run the benchmark, print a table of results, and check or save the baseline.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--pages', type=int, default=200, help='Number of pages.')
+    parser.add_argument('--fanout', type=int, default=4, help='Links to child pages per page.')
+    parser.add_argument('--images-per-page', type=int, default=10, help='Images per page.')
+    parser.add_argument('--image-size', type=parse_size, default='16k',
+                        help='Size of each image, such as 16k or 1m.')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS),
+                        help='Image formats, used in turn.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Server latency per request, in seconds.')
+    parser.add_argument('--num-resources', type=int, default=16,
+                        help='Option -R of the scraper.')
+    parser.add_argument('--scrapers', nargs='+', default=['generic', 'tumblr', 'twitter'])
+    parser.add_argument('--runs', type=int, default=3, help='Runs of each scraper.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Fraction by which a metric may be worse than the baseline.')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--baseline', metavar='FILE', help='Baseline file to compare against.')
+    group.add_argument('--save-baseline', metavar='FILE', help='Write the results to FILE.')
+    options = parser.parse_args()
+    
+    site = generate_site(pages=options.pages, fanout=options.fanout,
+                         images_per_page=options.images_per_page,
+                         image_size=options.image_size, formats=options.formats)
+    print('Site: {} pages, {} images, {:.1f} MB'.format(site.pages, site.images,
+                                                        site.image_bytes / 2 ** 20))
+    print('{:<10}'.format('scraper') + ''.join('{:>12}'.format(title)
+                                               for _, title, _ in METRICS))
+    results = {}
+    with FixtureServer(site.resources, latency=options.latency) as server:
+        for scraper in options.scrapers:
+            runs = [run_scraper(server, scraper, site, options) for _ in range(options.runs)]
+            results[scraper] = median_results(runs)
+            print('{:<10}'.format(scraper) + ''.join('{:>12.1f}'.format(results[scraper][name])
+                                                     for name, _, _ in METRICS))
+    
+    if options.save_baseline:
+        with open(options.save_baseline, 'w', encoding='utf-8') as fd:
+            json.dump({'site': {'pages': site.pages, 'images': site.images,
+                                'image_bytes': site.image_bytes},
+                       'results': results}, fd, indent=2)
+        print('Saved baseline to {}'.format(options.save_baseline))
+    elif options.baseline:
+        with open(options.baseline, encoding='utf-8') as fd:
+            baseline = json.load(fd)
+        if baseline['site'] != {'pages': site.pages, 'images': site.images,
+                                'image_bytes': site.image_bytes}:
+            print('warning: the baseline was measured on a different site: {}'.format(
+                baseline['site']), file=sys.stderr)
+        regressions = compare(results, baseline['results'], options.threshold)
+        for regression in regressions:
+            print('REGRESSION {}'.format(regression))
+        if regressions:
+            sys.exit(1)
+        print('No regressions past {:.0%} against {}'.format(options.threshold, options.baseline))
+
+
+if __name__ == '__main__':
+    main()
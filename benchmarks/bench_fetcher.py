@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+'''Benchmark the asyncio download engine against a local fixture server with artificial latency,
+comparing 1, 10 and 200 resources in flight. With --metrics, each run is repeated with the
+metrics of option --stats recorded, to show their overhead.
+
+   usage:
+       $ python -m benchmarks.bench_fetcher [--count 400] [--latency 0.02] [--size 16384]
+                                            [--metrics]
+'''
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.fixture_server import FixtureServer
+from scrapers.Fetcher import Fetcher
+from scrapers.Metrics import Metrics
+
+
+async def fetch_all(urls, num_resources, metrics=None):
+    '''Download every one of `urls` with at most `num_resources` in flight. Returns the total
+    number of bytes read and the number of connections opened.'''
+    fetcher = Fetcher(num_resources=num_resources, metrics=metrics)
+    total = 0
+    
+    async def fetch(url):
+        nonlocal total
+        async with fetcher.slot:
+            response = await fetcher.get(url)
+            total += len(await response.read())
+    
+    await asyncio.gather(*(fetch(url) for url in urls))
+    connections = sum(len(idle) for idle in fetcher.pool.idle.values())
+    await fetcher.close()
+    return total, connections
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--count', type=int, default=400, help='Number of resources.')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Server latency per request, in seconds.')
+    parser.add_argument('--size', type=int, default=16384, help='Resource size in bytes.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 200])
+    parser.add_argument('--metrics', action='store_true',
+                        help='Repeat each run with metrics recorded.')
+    options = parser.parse_args()
+    
+    body = os.urandom(options.size)
+    resources = {'/img{}.png'.format(i): body for i in range(options.count)}
+    with FixtureServer(resources, latency=options.latency) as server:
+        urls = [server.url(path) for path in resources]
+        print('{:>6} {:>8} {:>10} {:>12} {:>10} {:>12}'.format('R', 'metrics', 'seconds',
+                                                                'resources/s', 'MB/s',
+                                                                'connections'))
+        for num_resources in options.concurrency:
+            for metrics in ((None, Metrics()) if options.metrics else (None,)):
+                start = time.perf_counter()
+                total, connections = asyncio.run(fetch_all(urls, num_resources, metrics))
+                elapsed = time.perf_counter() - start
+                print('{:>6} {:>8} {:>10.3f} {:>12.1f} {:>10.2f} {:>12}'.format(
+                    num_resources, 'on' if metrics else 'off', elapsed, len(urls) / elapsed,
+                    total / elapsed / 2**20, connections))
+
+
+if __name__ == '__main__':
+    main()
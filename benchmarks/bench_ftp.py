@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+'''FTP benchmark: serve a tree of generated files from a local FTP fixture server with some
+latency per command, and download it once with a naive walk over a single connection (NLST, then
+CWD, SIZE, and MDTM for every entry, then RETR), and once with `scraper.py generic` for each
+number of connections of option -R, listing with MLSD. The largest -R is run again against a
+server without MLSD, to measure the LIST fallback. Reports the time of each run, files/s, and the
+connections and commands the server saw.
+
+   usage:
+       $ python -m benchmarks.bench_ftp [--dirs 20] [--files-per-dir 25] [--size 16k]
+                                        [--latency 0.005] [--num-resources 1 4 16]
+'''
+
+import argparse
+import ftplib
+import os
+import posixpath
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.ftp_server import FtpFixtureServer
+from benchmarks.site_generator import parse_size
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def count_files(path):
+    '''Return the number of files under the directory `path`, leaving out the metadata file.'''
+    return sum(1 for _, _, names in os.walk(path) for name in names
+               if not name.endswith('.sqlite'))
+
+
+def naive_walk(server, work_dir):
+    '''Download the tree of `server` over a single connection, one command at a time.'''
+    ftp = ftplib.FTP()
+    ftp.connect('127.0.0.1', server.server.server_address[1])
+    ftp.login()
+    stack = ['/pub']
+    index = 0
+    while stack:
+        directory = stack.pop()
+        for name in ftp.nlst(directory):
+            path = posixpath.join(directory, posixpath.basename(name))
+            try:
+                ftp.cwd(path)
+                stack.append(path)
+                continue
+            except ftplib.error_perm:
+                pass
+            ftp.size(path)
+            ftp.sendcmd('MDTM {}'.format(path))
+            index += 1
+            with open(os.path.join(work_dir, str(index)), 'wb') as fd:
+                ftp.retrbinary('RETR {}'.format(path), fd.write)
+    ftp.quit()
+
+
+def run_scraper(server, work_dir, num_resources):
+    '''Download the tree of `server` with `scraper.py generic -R num_resources`.'''
+    subprocess.run([sys.executable, 'scraper.py', 'generic', '-R', str(num_resources),
+                    '-od', work_dir, '-dd', work_dir, server.url('/pub/')],
+                   cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run(name, server, function, *args):
+    '''Run `function(server, work_dir, *args)` in a fresh directory and print a row of results.'''
+    work_dir = tempfile.mkdtemp(prefix='bench-ftp-')
+    connections = server.connections
+    commands = sum(server.commands.values())
+    try:
+        start = time.monotonic()
+        function(server, work_dir, *args)
+        elapsed = time.monotonic() - start
+        saved = count_files(work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if saved < len(server.resources):
+        print('warning: {} saved {} of {} files'.format(name, saved, len(server.resources)),
+              file=sys.stderr)
+    print('{:<20}{:>10.2f}{:>10.1f}{:>13}{:>10}'.format(
+        name, elapsed, saved / elapsed, server.connections - connections,
+        sum(server.commands.values()) - commands))
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--dirs', type=int, default=20, help='Number of directories.')
+    parser.add_argument('--files-per-dir', type=int, default=25, help='Files per directory.')
+    parser.add_argument('--size', type=parse_size, default='16k',
+                        help='Size of each file, such as 16k or 1m.')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='Server latency per command, in seconds.')
+    parser.add_argument('--num-resources', type=int, nargs='+', default=[1, 4, 16],
+                        help='Options -R to run the scraper with.')
+    options = parser.parse_args()
+    
+    body = os.urandom(options.size)
+    resources = {'/pub/{:03}/{:03}.jpg'.format(directory, index): body
+                 for directory in range(options.dirs) for index in range(options.files_per_dir)}
+    print('Tree: {} directories, {} files, {:.1f} MB, {:.0f} ms latency per command'.format(
+        options.dirs, len(resources), len(resources) * options.size / 2 ** 20,
+        options.latency * 1000))
+    print('{:<20}{:>10}{:>10}{:>13}{:>10}'.format('client', 'seconds', 'files/s', 'connections',
+                                                  'commands'))
+    with FtpFixtureServer(resources, latency=options.latency) as server:
+        run('naive', server, naive_walk)
+        for num_resources in options.num_resources:
+            run('scraper -R {}'.format(num_resources), server, run_scraper, num_resources)
+    with FtpFixtureServer(resources, latency=options.latency, mlsd=False) as server:
+        num_resources = max(options.num_resources)
+        run('LIST -R {}'.format(num_resources), server, run_scraper, num_resources)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+'''HTTP/2 benchmark: download many small images from local HTTPS fixture servers with some
+latency, once from an HTTP/1.1 server without and with option --http2 (which falls back to
+HTTP/1.1 there), and once from an HTTP/2 server with --http2, for each number of resources in
+flight. Reports resources per second and the connections opened. Requires h2 and the openssl
+command, which makes a self-signed certificate for the servers.
+
+   usage:
+       $ python -m benchmarks.bench_http2 [--count 1000] [--latency 0.02] [--size 4096]
+                                          [--concurrency 10 100 500]
+'''
+
+import argparse
+import asyncio
+import os
+import shutil
+import ssl
+import tempfile
+import time
+
+from benchmarks.fixture_server import FixtureServer, Http2FixtureServer, make_certificate
+from scrapers.Fetcher import ConnectionPool, Fetcher
+
+
+async def fetch_all(urls, num_resources, ca_file, http2):
+    '''Download every one of `urls` with at most `num_resources` in flight, trusting the
+    certificate in `ca_file`. Returns the total number of bytes read and the number of
+    connections opened.
+    '''
+    pool = ConnectionPool(ssl_context=ssl.create_default_context(cafile=ca_file), http2=http2)
+    fetcher = Fetcher(num_resources=num_resources, pool=pool)
+    total = 0
+    
+    async def fetch(url):
+        nonlocal total
+        async with fetcher.slot:
+            response = await fetcher.get(url)
+            body = await response.read()
+        total += len(body)
+    
+    await asyncio.gather(*(fetch(url) for url in urls))
+    connections = sum(len(idle) for idle in pool.idle.values()) + len(pool.multiplexed)
+    pool.close()
+    return total, connections
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000, help='Number of resources.')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Server latency per request, in seconds.')
+    parser.add_argument('--size', type=int, default=4096, help='Resource size in bytes.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 500])
+    options = parser.parse_args()
+    
+    body = os.urandom(options.size)
+    resources = {'/thumb{}.jpg'.format(i): body for i in range(options.count)}
+    cert_dir = tempfile.mkdtemp(prefix='bench-http2-')
+    try:
+        cert_file, key_file = make_certificate(cert_dir)
+        http1 = FixtureServer(resources, latency=options.latency, cert_file=cert_file,
+                              key_file=key_file)
+        http2 = Http2FixtureServer(resources, cert_file, key_file, latency=options.latency)
+        with http1, http2:
+            runs = [('HTTP/1.1', http1, False), ('HTTP/1.1 --http2', http1, True),
+                    ('HTTP/2 --http2', http2, True)]
+            print('{:<18}{:>6}{:>10}{:>14}{:>10}{:>13}'.format('server', 'R', 'seconds',
+                                                               'resources/s', 'MB/s',
+                                                               'connections'))
+            for num_resources in options.concurrency:
+                for name, server, enabled in runs:
+                    urls = [server.url(path) for path in resources]
+                    start = time.perf_counter()
+                    total, connections = asyncio.run(fetch_all(urls, num_resources, cert_file,
+                                                               enabled))
+                    elapsed = time.perf_counter() - start
+                    print('{:<18}{:>6}{:>10.3f}{:>14.1f}{:>10.2f}{:>13}'.format(
+                        name, num_resources, elapsed, len(urls) / elapsed,
+                        total / elapsed / 2**20, connections))
+    finally:
+        shutil.rmtree(cert_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+'''Benchmark option -rl/--rate-limit: download large resources from a local fixture server over
+many parallel streams and compare the throughput achieved with the rate configured, then time the
+bookkeeping cost of `RateLimiter.consume` itself.
+
+   usage:
+       $ python -m benchmarks.bench_rate_limit [--rate 4m] [--streams 1 10 100] [--seconds 5]
+'''
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.fixture_server import FixtureServer
+from scrapers.Fetcher import Fetcher
+from scrapers.RateLimiter import RateLimiter, parse_rate
+
+
+async def fetch_all(urls, rate, host_rate):
+    '''Download every one of `urls` at once under the given limits. Returns the number of bytes
+    read.'''
+    fetcher = Fetcher(num_resources=len(urls), limiter=RateLimiter(rate, host_rate))
+    total = 0
+    
+    async def fetch(url):
+        nonlocal total
+        async with fetcher.slot:
+            response = await fetcher.get(url)
+            async for chunk in response.iter_chunks():
+                total += len(chunk)
+    
+    await asyncio.gather(*(fetch(url) for url in urls))
+    await fetcher.close()
+    return total
+
+
+async def consume_overhead(streams, chunks):
+    '''Return the mean cost in microseconds of a `consume` call that does not need to sleep,
+    spread over `streams` hosts.'''
+    limiter = RateLimiter(float(2**50), float(2**50))
+    hosts = ['host{}'.format(i) for i in range(streams)]
+    start = time.perf_counter()
+    for i in range(chunks):
+        await limiter.consume(hosts[i % streams], 65536)
+    return (time.perf_counter() - start) / chunks * 1e6
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--rate', default='4m', help='Overall rate limit, as for option -rl.')
+    parser.add_argument('--host-rate', default=None,
+                        help='Per-host rate limit, as for option -hrl.')
+    parser.add_argument('--streams', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--seconds', type=float, default=5.0,
+                        help='Expected duration of each run at the configured rate.')
+    options = parser.parse_args()
+    
+    rate = parse_rate(options.rate)
+    host_rate = parse_rate(options.host_rate)
+    effective = min(r for r in (rate, host_rate) if r)
+    print('{:>8} {:>10} {:>14} {:>14} {:>10}'.format('streams', 'seconds', 'limit KB/s',
+                                                     'achieved KB/s', 'deviation'))
+    for streams in options.streams:
+        size = max(1, int(effective * options.seconds / streams))
+        body = os.urandom(size)
+        resources = {'/big{}.png'.format(i): body for i in range(streams)}
+        with FixtureServer(resources) as server:
+            urls = [server.url(path) for path in resources]
+            start = time.perf_counter()
+            total = asyncio.run(fetch_all(urls, rate, host_rate))
+            elapsed = time.perf_counter() - start
+        achieved = total / elapsed
+        print('{:>8} {:>10.3f} {:>14.1f} {:>14.1f} {:>9.2f}%'.format(
+            streams, elapsed, effective / 1024, achieved / 1024,
+            (achieved - effective) / effective * 100))
+    
+    print()
+    print('{:>8} {:>18}'.format('hosts', 'consume() us/call'))
+    for streams in (1, 1000, 10000):
+        overhead = asyncio.run(consume_overhead(streams, 200000))
+        print('{:>8} {:>18.3f}'.format(streams, overhead))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+'''Benchmark the option -re resize stage: resize a set of generated JPEGs through the process pool
+of `Resizer` with an increasing number of worker processes, with and without draft-mode decoding.
+Requires Pillow.
+
+   usage:
+       $ python -m benchmarks.bench_resize [--count 64] [--source 3000x2000] [--size 640x480]
+'''
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from scrapers.Resizer import Resizer, parse_size
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def make_sources(directory, count, size):
+    '''Write one noisy JPEG of `size` into `directory` and return `count` copies of its bytes
+    under distinct names.'''
+    image = Image.effect_noise(size, 64).convert('RGB')
+    path = os.path.join(directory, 'source.jpg')
+    image.save(path, quality=90)
+    with open(path, 'rb') as fd:
+        data = fd.read()
+    return data, ['img{}.jpg'.format(i) for i in range(count)]
+
+
+async def resize_all(paths, size, workers, draft):
+    '''Resize every one of `paths` with `workers` processes. Returns the number resized.'''
+    done = 0
+    
+    def on_done(path, sizes, error):
+        nonlocal done
+        if error is not None:
+            raise error
+        done += 1
+    
+    resizer = Resizer(size, workers=workers, draft=draft, on_done=on_done)
+    try:
+        for path in paths:
+            await resizer.submit(path)
+        await resizer.join()
+    finally:
+        resizer.close()
+    return done
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--count', type=int, default=64, help='Number of images.')
+    parser.add_argument('--source', default='3000x2000', help='Size of the source images.')
+    parser.add_argument('--size', default='640x480', help='Target size, as for option -re.')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    options = parser.parse_args()
+    if Image is None:
+        sys.exit('Pillow is required to run this benchmark.')
+    
+    directory = tempfile.mkdtemp(prefix='bench-resize-')
+    try:
+        data, names = make_sources(directory, options.count, parse_size(options.source))
+        paths = [os.path.join(directory, name) for name in names]
+        print('{:>8} {:>6} {:>10} {:>10}'.format('workers', 'draft', 'seconds', 'images/s'))
+        for workers in options.workers:
+            for draft in (True, False):
+                for path in paths:
+                    with open(path, 'wb') as fd:
+                        fd.write(data)
+                start = time.perf_counter()
+                done = asyncio.run(resize_all(paths, parse_size(options.size), workers, draft))
+                elapsed = time.perf_counter() - start
+                print('{:>8} {:>6} {:>10.3f} {:>10.1f}'.format(workers, 'yes' if draft else 'no',
+                                                              elapsed, done / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
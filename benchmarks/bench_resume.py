@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+'''Resume benchmark: serve large generated images from a local fixture server that cuts off a
+share of the response bodies partway, like a flaky link, and run `scraper.py generic` on them
+again and again until every image is saved. This is done once with the `.part` files the scraper
+leaves behind, which later runs resume with Range requests, and once with the parts thrown away
+after every run, so that each image starts over from zero. Reports the runs, the bytes the server
+sent, and how many times the total size of the images that is.
+
+   usage:
+       $ python -m benchmarks.bench_resume [--images 8] [--size 8m] [--drop 0.5]
+                                           [--max-runs 50]
+'''
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.site_generator import make_image, parse_size
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def count_images(path):
+    '''Return the number of images saved in the directory `path`.'''
+    return sum(1 for name in os.listdir(path) if name.endswith('.png'))
+
+
+def run(name, resources, options, resume):
+    '''Scrape `resources` until all are saved, or `options.max_runs` runs, and print a row of
+    results. Without `resume`, the parts left by each run are removed before the next one.
+    '''
+    work_dir = tempfile.mkdtemp(prefix='bench-resume-')
+    data_dir = os.path.join(work_dir, 'data')
+    total = sum(len(body) for body in resources.values())
+    try:
+        with FixtureServer(resources, drop=options.drop, seed=options.seed) as server:
+            uris = [server.url(path) for path in sorted(resources)]
+            start = time.monotonic()
+            runs = 0
+            while runs < options.max_runs:
+                runs += 1
+                subprocess.run([sys.executable, 'scraper.py', 'generic', '-R', '4', '-nd',
+                                '-od', work_dir, '-dd', data_dir] + uris,
+                               cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                if count_images(data_dir) >= len(resources):
+                    break
+                if not resume:
+                    for part_name in os.listdir(data_dir):
+                        if part_name.endswith(('.part', '.part.json')):
+                            os.unlink(os.path.join(data_dir, part_name))
+            elapsed = time.monotonic() - start
+            saved = count_images(data_dir)
+            sent = server.sent
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if saved < len(resources):
+        print('warning: {} saved {} of {} images'.format(name, saved, len(resources)),
+              file=sys.stderr)
+    print('{:<12}{:>6}{:>10.2f}{:>12.1f}{:>10.2f}'.format(
+        name, runs, elapsed, sent / 2 ** 20, sent / total))
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--images', type=int, default=8, help='Number of images.')
+    parser.add_argument('--size', type=parse_size, default='8m',
+                        help='Size of each image, such as 16k or 1m.')
+    parser.add_argument('--drop', type=float, default=0.5,
+                        help='Share of the response bodies cut off partway.')
+    parser.add_argument('--max-runs', type=int, default=50, help='Runs before giving up.')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the cut offs.')
+    options = parser.parse_args()
+    
+    rng = random.Random(options.seed)
+    resources = {'/img/{:03}.png'.format(index): make_image('png', 1600, 1200, options.size, rng)
+                 for index in range(options.images)}
+    print('{} images of {:.1f} MB, {:.0%} of the responses cut off'.format(
+        options.images, options.size / 2 ** 20, options.drop))
+    print('{:<12}{:>6}{:>10}{:>12}{:>10}'.format('mode', 'runs', 'seconds', 'sent MB', 'x size'))
+    run('restart', resources, options, resume=False)
+    run('resume', resources, options, resume=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+'''SFTP benchmark: serve a tree of generated files from a local SSH fixture server with some
+network latency, and download it once with a naive client that opens and authenticates a fresh
+SSH connection for every file and reads it one request at a time, and once with `scraper.py
+generic -r` for each number of channels of option -R, over one SSH session with pipelined reads.
+Reports the time of each run, files/s, MB/s, and the connections, logins, and channels the server
+saw. Requires paramiko.
+
+   usage:
+       $ python -m benchmarks.bench_sftp [--dirs 10] [--files-per-dir 20] [--size 256k]
+                                         [--latency 0.005] [--num-resources 1 4 16]
+'''
+
+import argparse
+import os
+import posixpath
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+import paramiko
+
+from benchmarks.sftp_server import SftpFixtureServer
+from benchmarks.site_generator import parse_size
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER = 'bench'
+PASSWORD = 'secret'
+
+
+def count_files(path):
+    '''Return the number of files under the directory `path`, leaving out the metadata file.'''
+    return sum(1 for _, _, names in os.walk(path) for name in names
+               if not name.endswith('.sqlite'))
+
+
+def connect(server, home):
+    '''Return a new SSH client logged in to `server`, trusting the known hosts of `home`.'''
+    client = paramiko.SSHClient()
+    client.load_host_keys(os.path.join(home, '.ssh', 'known_hosts'))
+    client.connect('127.0.0.1', server.listener.getsockname()[1], username=USER,
+                   password=PASSWORD, allow_agent=False, look_for_keys=False)
+    return client
+
+
+def naive_walk(server, home, work_dir):
+    '''Download the tree of `server`, listing it over one connection, and opening a connection
+    per file to read it without pipelining.
+    '''
+    client = connect(server, home)
+    sftp = client.open_sftp()
+    files = []
+    stack = ['/srv']
+    while stack:
+        directory = stack.pop()
+        for attributes in sftp.listdir_attr(directory):
+            path = posixpath.join(directory, attributes.filename)
+            if stat.S_ISDIR(attributes.st_mode):
+                stack.append(path)
+            else:
+                files.append(path)
+    client.close()
+    for index, path in enumerate(files):
+        client = connect(server, home)
+        sftp = client.open_sftp()
+        with sftp.open(path, 'rb') as remote, \
+                open(os.path.join(work_dir, str(index)), 'wb') as fd:
+            fd.write(remote.read())
+        client.close()
+
+
+def run_scraper(server, home, work_dir, num_resources):
+    '''Download the tree of `server` with `scraper.py generic -r -R num_resources`.'''
+    subprocess.run([sys.executable, 'scraper.py', 'generic', '-r', '-R', str(num_resources),
+                    '-un', USER, '-pw', PASSWORD, '-od', work_dir, '-dd', work_dir,
+                    server.url('/srv/')],
+                   cwd=ROOT, env=dict(os.environ, HOME=home), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run(name, server, home, function, *args):
+    '''Run `function(server, home, work_dir, *args)` in a fresh directory and print a row of
+    results.
+    '''
+    work_dir = tempfile.mkdtemp(prefix='bench-sftp-')
+    before = (server.connections, server.logins, server.channels)
+    size = sum(len(body) for body in server.resources.values())
+    try:
+        start = time.monotonic()
+        function(server, home, work_dir, *args)
+        elapsed = time.monotonic() - start
+        saved = count_files(work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if saved < len(server.resources):
+        print('warning: {} saved {} of {} files'.format(name, saved, len(server.resources)),
+              file=sys.stderr)
+    connections, logins, channels = (after - start for after, start in
+                                     zip((server.connections, server.logins, server.channels),
+                                         before))
+    print('{:<20}{:>10.2f}{:>10.1f}{:>8.1f}{:>13}{:>8}{:>10}'.format(
+        name, elapsed, saved / elapsed, size / 2 ** 20 / elapsed, connections, logins,
+        channels))
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--dirs', type=int, default=10, help='Number of directories.')
+    parser.add_argument('--files-per-dir', type=int, default=20, help='Files per directory.')
+    parser.add_argument('--size', type=parse_size, default='256k',
+                        help='Size of each file, such as 16k or 1m.')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='Network latency each way, in seconds.')
+    parser.add_argument('--num-resources', type=int, nargs='+', default=[1, 4, 16],
+                        help='Options -R to run the scraper with.')
+    options = parser.parse_args()
+    
+    body = os.urandom(options.size)
+    resources = {'/srv/{:03}/{:03}.jpg'.format(directory, index): body
+                 for directory in range(options.dirs) for index in range(options.files_per_dir)}
+    print('Tree: {} directories, {} files, {:.1f} MB, {:.0f} ms latency each way'.format(
+        options.dirs, len(resources), len(resources) * options.size / 2 ** 20,
+        options.latency * 1000))
+    print('{:<20}{:>10}{:>10}{:>8}{:>13}{:>8}{:>10}'.format(
+        'client', 'seconds', 'files/s', 'MB/s', 'connections', 'logins', 'channels'))
+    home = tempfile.mkdtemp(prefix='bench-sftp-home-')
+    try:
+        os.makedirs(os.path.join(home, '.ssh'))
+        with SftpFixtureServer(resources, latency=options.latency,
+                               users={USER: PASSWORD}) as server:
+            server.write_known_hosts(os.path.join(home, '.ssh', 'known_hosts'))
+            run('naive', server, home, naive_walk)
+            for num_resources in options.num_resources:
+                run('scraper -R {}'.format(num_resources), server, home, run_scraper,
+                    num_resources)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+'''Benchmark the cold-start time of `scraper.py`: run each command line many times in a fresh
+interpreter and report the best and median wall time, next to the time of an empty interpreter.
+With --imports, also list the slowest imports of each command line (`python -X importtime`).
+
+   usage:
+       $ python -m benchmarks.bench_startup [--runs 20] [--imports]
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = (
+    ('python', ['-c', 'pass']),
+    ('scraper.py --help', ['scraper.py', '--help']),
+    ('scraper.py generic --help', ['scraper.py', 'generic', '--help']),
+    ('scraper.py twitter --help', ['scraper.py', 'twitter', '--help']),
+)
+
+
+def time_command(args, runs):
+    '''Run `python args` `runs` times. Returns the list of wall times in milliseconds.'''
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def slowest_imports(args, count=8):
+    '''Return the `count` slowest imports of `python args` as (cumulative us, module) tuples.'''
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False,
+                            universal_newlines=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    '''Run the benchmark and print a table of results.'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20, help='Runs of each command line.')
+    parser.add_argument('--imports', action='store_true',
+                        help='List the slowest imports of each command line.')
+    options = parser.parse_args()
+    
+    print('{:<28} {:>10} {:>10}'.format('command', 'best ms', 'median ms'))
+    for name, args in COMMANDS:
+        times = time_command(args, options.runs)
+        print('{:<28} {:>10.1f} {:>10.1f}'.format(name, min(times), statistics.median(times)))
+    if options.imports:
+        for name, args in COMMANDS[1:]:
+            print()
+            print(name)
+            for cumulative, module in slowest_imports(args):
+                print('{:>10.1f} ms {}'.format(cumulative / 1000, module))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+'''Local HTTP fixture server used by the benchmarks. Serves generated resources from memory over
+HTTP/1.1 keep-alive connections, with an optional artificial latency per request so that
+latency-bound workloads can be reproduced on a single box. Range requests (with If-Range) and ETag
+revalidation are supported and may each be turned off. A flaky link may be simulated by cutting
+off a share of the response bodies partway. Given a certificate, it serves HTTPS instead, and
+`Http2FixtureServer` serves the same resources over HTTP/2 (which requires h2).
+
+   usage:
+       >>> from benchmarks.fixture_server import FixtureServer
+       >>> with FixtureServer({'/a.png': b'...'}, latency=0.02) as server:
+       >>>     print(server.url('/a.png'))
+'''
+
+import asyncio
+import hashlib
+import os
+import random
+import socket
+import ssl
+import subprocess
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Request handler serving the resources of its `FixtureServer`."""
+    
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    
+    def do_GET(self):  # pylint: disable=invalid-name
+        '''Serve a resource, honouring a single `Range: bytes=N-M` header, unless an If-Range
+        header names another version of the resource.
+        '''
+        self.respond(head=False)
+    
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        '''Serve the headers of a resource.'''
+        self.respond(head=True)
+    
+    def respond(self, head):
+        '''Send the resource at `self.path`, or a 404.'''
+        fixture = self.server.fixture
+        if fixture.first_request is None:
+            fixture.first_request = time.monotonic()
+        if fixture.latency:
+            time.sleep(fixture.latency)
+        fixture.requests += 1
+        resource = fixture.resources.get(self.path.split('?', 1)[0])
+        if resource is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body, content_type = resource
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+        if fixture.validators and self.headers.get('If-None-Match') == etag:
+            fixture.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        status = 200
+        start, end = 0, len(body)
+        range_header = self.headers.get('Range', '')
+        if_range = self.headers.get('If-Range')
+        if if_range is not None and if_range not in (etag, fixture.last_modified):
+            range_header = ''
+        if range_header.startswith('bytes=') and fixture.ranges:
+            first, _, last = range_header[6:].partition('-')
+            start = int(first or 0)
+            end = min(int(last) + 1, len(body)) if last else len(body)
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes' if fixture.ranges else 'none')
+        if fixture.validators:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', fixture.last_modified)
+        if status == 206:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end - 1, len(body)))
+        self.end_headers()
+        if not head:
+            cut = end
+            if fixture.drop and end > start:
+                with fixture.lock:
+                    if fixture.random.random() < fixture.drop:
+                        cut = fixture.random.randrange(start, end)
+            try:
+                self.wfile.write(body[start:cut])
+                with fixture.lock:
+                    fixture.sent += cut - start
+                if cut < end:
+                    self.wfile.flush()
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    self.close_connection = True
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+    
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        '''Keep the benchmark output quiet.'''
+
+
+class FixtureServer:
+    """Threaded HTTP server serving `resources`, a dict of path to bytes (or to a tuple of bytes
+    and content type), on a free port of 127.0.0.1. With `drop`, that share of the response
+    bodies is cut off at a random point, closing the connection, as a flaky link would."""
+    
+    def __init__(self, resources, latency=0.0, ranges=True, validators=True, cert_file=None,
+                 key_file=None, drop=0.0, seed=None):
+        self.resources = typed_resources(resources)
+        self.latency = latency
+        self.ranges = ranges
+        self.validators = validators
+        self.drop = drop
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.last_modified = formatdate(time.time(), usegmt=True)
+        self.requests = 0
+        self.not_modified = 0
+        self.first_request = None
+        ThreadingHTTPServer.request_queue_size = 1024
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = lambda request, client_address: None
+        self.httpd.fixture = self
+        self.scheme = 'http'
+        if cert_file:
+            context = server_context(cert_file, key_file, ['http/1.1'])
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True,
+                                                    do_handshake_on_connect=False)
+            self.scheme = 'https'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+    
+    def url(self, path=''):
+        '''Return the absolute URL of `path` on this server.'''
+        return '{}://127.0.0.1:{}{}'.format(self.scheme, self.httpd.server_address[1], path)
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Http2FixtureServer:
+    """HTTP/2 server over TLS serving `resources` like `FixtureServer`, from an asyncio event loop
+    in a thread of its own, on a free port of 127.0.0.1. Each request sleeps `latency` seconds
+    without holding up the other streams of its connection. Requires h2.
+    """
+    
+    def __init__(self, resources, cert_file, key_file, latency=0.0):
+        self.resources = typed_resources(resources)
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self.context = server_context(cert_file, key_file, ['h2'])
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+    
+    def url(self, path=''):
+        '''Return the absolute URL of `path` on this server.'''
+        return 'https://127.0.0.1:{}{}'.format(self.server.sockets[0].getsockname()[1], path)
+    
+    def __enter__(self):
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.serve, '127.0.0.1', 0, ssl=self.context, backlog=1024),
+            self.loop).result()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+    
+    async def serve(self, reader, writer):
+        '''Answer the requests of a connection, each on a task of its own.'''
+        import h2.config
+        import h2.connection
+        import h2.events
+        import h2.exceptions
+        self.connections += 1
+        config = h2.config.H2Configuration(client_side=False, header_encoding='utf-8')
+        conn = h2.connection.H2Connection(config=config)
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        window = asyncio.Event()
+        tasks = set()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        task = asyncio.ensure_future(self.respond(conn, writer, window,
+                                                                  event.stream_id,
+                                                                  dict(event.headers)))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    elif isinstance(event, (h2.events.WindowUpdated,
+                                            h2.events.RemoteSettingsChanged)):
+                        window.set()
+                writer.write(conn.data_to_send())
+        except (OSError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+    
+    async def respond(self, conn, writer, window, stream_id, headers):
+        '''Send the resource at the path of `headers` on the stream `stream_id`, or a 404.'''
+        import h2.exceptions
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.requests += 1
+        resource = self.resources.get(headers.get(':path', '').split('?', 1)[0])
+        try:
+            if resource is None:
+                conn.send_headers(stream_id, [(':status', '404'), ('content-length', '0')],
+                                  end_stream=True)
+                writer.write(conn.data_to_send())
+                return
+            body, content_type = resource
+            conn.send_headers(stream_id, [(':status', '200'), ('content-type', content_type),
+                                          ('content-length', str(len(body))),
+                                          ('accept-ranges', 'none')],
+                              end_stream=headers.get(':method') == 'HEAD')
+            if headers.get(':method') == 'HEAD':
+                writer.write(conn.data_to_send())
+                return
+            view = memoryview(body)
+            while view:
+                size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size,
+                           len(view))
+                if size <= 0:
+                    window.clear()
+                    await window.wait()
+                    continue
+                conn.send_data(stream_id, view[:size].tobytes(), end_stream=size == len(view))
+                view = view[size:]
+                writer.write(conn.data_to_send())
+        except h2.exceptions.ProtocolError:
+            pass
+
+
+def typed_resources(resources):
+    '''Return `resources`, a dict of path to bytes or to a tuple of bytes and content type, with
+    the content type of each resource guessed where it was not given.
+    '''
+    typed = {}
+    for path, resource in resources.items():
+        if isinstance(resource, bytes):
+            resource = (resource, guess_type(path))
+        typed[path] = resource
+    return typed
+
+
+def server_context(cert_file, key_file, protocols):
+    '''Return a TLS context presenting the certificate `cert_file`, offering the ALPN
+    `protocols`.
+    '''
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_file, key_file)
+    context.set_alpn_protocols(protocols)
+    return context
+
+
+def make_certificate(directory):
+    '''Write a self-signed certificate for 127.0.0.1 and its key to `directory` with the openssl
+    command. Returns the paths of the certificate and of the key.
+    '''
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                    '-keyout', key_file, '-out', cert_file],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert_file, key_file
+
+
+def guess_type(path):
+    '''Return a content type for `path` based on its extension.'''
+    ext = path.rsplit('.', 1)[-1].lower()
+    return {
+        'html': 'text/html; charset=utf-8',
+        'css': 'text/css',
+        'png': 'image/png',
+        'gif': 'image/gif',
+        'jpg': 'image/jpeg',
+        'jpeg': 'image/jpeg',
+        'bmp': 'image/bmp',
+        'svg': 'image/svg+xml',
+        'psd': 'image/vnd.adobe.photoshop',
+    }.get(ext, 'application/octet-stream')
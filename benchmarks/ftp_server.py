@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+'''Local FTP fixture server used by the benchmarks. Serves generated resources from memory to
+any number of control connections, one thread each, with passive mode data connections. The
+directory tree is implied by the paths of the resources. An artificial latency may be added to
+every command so that round trips count as they do against a remote server. MLSD may be turned off
+to exercise the LIST fallback of clients, and with a certificate the server speaks explicit
+(AUTH TLS) or implicit FTPS.
+
+   usage:
+       >>> from benchmarks.ftp_server import FtpFixtureServer
+       >>> with FtpFixtureServer({'/pub/a.png': b'...'}, latency=0.005) as server:
+       >>>     print(server.url('/pub/'))
+'''
+
+import collections
+import posixpath
+import socket
+import socketserver
+import ssl
+import threading
+import time
+
+
+class FtpHandler(socketserver.BaseRequestHandler):
+    """Control connection of a client of the `FtpFixtureServer`."""
+    
+    def setup(self):
+        self.fixture = self.server.fixture
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = self.request
+        self.reader = None
+        self.cwd = '/'
+        self.user = None
+        self.logged_in = False
+        self.protect = False
+        self.passive = None
+    
+    def handle(self):
+        '''Answer the commands of the client until it quits or hangs up.'''
+        fixture = self.fixture
+        with fixture.lock:
+            fixture.connections += 1
+        try:
+            if fixture.tls == 'implicit':
+                self.sock = fixture.context.wrap_socket(self.sock, server_side=True)
+            self.reader = self.sock.makefile('rb')
+            self.reply('220 Fixture FTP server ready')
+            while True:
+                line = self.reader.readline()
+                if not line:
+                    break
+                command, _, arg = line.decode('utf-8').rstrip('\r\n').partition(' ')
+                command = command.upper()
+                if fixture.latency:
+                    time.sleep(fixture.latency)
+                with fixture.lock:
+                    fixture.commands[command] += 1
+                method = getattr(self, 'ftp_' + command.lower(), None)
+                if method is None:
+                    self.reply('502 Command not implemented')
+                elif not self.logged_in and command not in ('USER', 'PASS', 'AUTH', 'PBSZ',
+                                                            'PROT', 'FEAT', 'QUIT'):
+                    self.reply('530 Not logged in')
+                elif method(arg) is False:
+                    break
+        except (OSError, UnicodeDecodeError):
+            pass
+        finally:
+            if self.passive is not None:
+                self.passive.close()
+    
+    def reply(self, line):
+        '''Send the reply `line` to the client.'''
+        self.sock.sendall(line.encode('utf-8') + b'\r\n')
+    
+    def resolve(self, arg):
+        '''Return the absolute path of the argument `arg` of a command.'''
+        return posixpath.normpath(posixpath.join(self.cwd, arg or '.'))
+    
+    def transfer(self, data):
+        '''Send `data` on the passive data connection opened by the client.'''
+        if self.passive is None:
+            self.reply('425 Use PASV or EPSV first')
+            return
+        self.reply('150 Opening data connection')
+        listener, self.passive = self.passive, None
+        try:
+            listener.settimeout(10)
+            conn, _ = listener.accept()
+        except OSError:
+            self.reply('425 Can not open data connection')
+            return
+        finally:
+            listener.close()
+        try:
+            if self.protect:
+                conn = self.fixture.context.wrap_socket(conn, server_side=True)
+            conn.sendall(data)
+        except OSError:
+            conn.close()
+            self.reply('426 Transfer aborted')
+            return
+        if self.protect:
+            try:
+                conn = conn.unwrap()
+            except OSError:
+                pass
+        conn.close()
+        self.reply('226 Transfer complete')
+    
+    def ftp_user(self, arg):
+        '''USER: take the name of the user.'''
+        self.user = arg
+        self.reply('331 Password required')
+    
+    def ftp_pass(self, arg):
+        '''PASS: log in, if the credentials are accepted.'''
+        users = self.fixture.users
+        if users is None or users.get(self.user) == arg:
+            self.logged_in = True
+            with self.fixture.lock:
+                self.fixture.logins += 1
+            self.reply('230 Logged in')
+        else:
+            self.reply('530 Login incorrect')
+    
+    def ftp_auth(self, arg):
+        '''AUTH TLS: upgrade the control connection to TLS.'''
+        if self.fixture.tls != 'explicit' or arg.upper() not in ('TLS', 'SSL'):
+            self.reply('502 Command not implemented')
+            return
+        self.reply('234 Proceed with negotiation')
+        self.sock = self.fixture.context.wrap_socket(self.sock, server_side=True)
+        self.reader = self.sock.makefile('rb')
+    
+    def ftp_pbsz(self, arg):
+        '''PBSZ: nothing to buffer.'''
+        self.reply('200 PBSZ=0')
+    
+    def ftp_prot(self, arg):
+        '''PROT: protect the data connections with TLS, or not.'''
+        self.protect = arg.upper() == 'P'
+        self.reply('200 Protection level set')
+    
+    def ftp_feat(self, arg):
+        '''FEAT: list the extensions of the server.'''
+        features = ['SIZE', 'MDTM', 'EPSV', 'PASV']
+        if self.fixture.mlsd:
+            features.append('MLST type*;size*;modify*;')
+        self.sock.sendall(('211-Features:\r\n' + ''.join(' {}\r\n'.format(feature)
+                                                         for feature in features)
+                           + '211 End\r\n').encode('utf-8'))
+    
+    def ftp_opts(self, arg):
+        '''OPTS: accept any option.'''
+        self.reply('200 OK')
+    
+    def ftp_syst(self, arg):
+        '''SYST: pretend to be a Unix server.'''
+        self.reply('215 UNIX Type: L8')
+    
+    def ftp_type(self, arg):
+        '''TYPE: every transfer is binary anyway.'''
+        self.reply('200 Type set to {}'.format(arg))
+    
+    def ftp_noop(self, arg):
+        '''NOOP: do nothing.'''
+        self.reply('200 OK')
+    
+    def ftp_pwd(self, arg):
+        '''PWD: print the working directory.'''
+        self.reply('257 "{}"'.format(self.cwd))
+    
+    def ftp_cwd(self, arg):
+        '''CWD: change the working directory.'''
+        path = self.resolve(arg)
+        if path not in self.fixture.directories:
+            self.reply('550 No such directory')
+            return
+        self.cwd = path
+        self.reply('250 OK')
+    
+    def ftp_pasv(self, arg):
+        '''PASV: listen for the data connection of the next transfer.'''
+        self.open_passive()
+        port = self.passive.getsockname()[1]
+        self.reply('227 Entering Passive Mode (127,0,0,1,{},{})'.format(port >> 8, port & 0xFF))
+    
+    def ftp_epsv(self, arg):
+        '''EPSV: listen for the data connection of the next transfer.'''
+        self.open_passive()
+        self.reply('229 Entering Extended Passive Mode (|||{}|)'.format(
+            self.passive.getsockname()[1]))
+    
+    def open_passive(self):
+        '''Open the listening socket of a passive data connection.'''
+        if self.passive is not None:
+            self.passive.close()
+        self.passive = socket.create_server(('127.0.0.1', 0))
+    
+    def ftp_mlsd(self, arg):
+        '''MLSD: list a directory with machine readable facts.'''
+        if not self.fixture.mlsd:
+            self.reply('500 Unknown command')
+            return
+        path = self.resolve(arg)
+        if path not in self.fixture.directories:
+            self.reply('550 No such directory')
+            return
+        modify = time.strftime('%Y%m%d%H%M%S', time.gmtime(self.fixture.modified))
+        lines = []
+        for name, size in self.fixture.children(path):
+            if size is None:
+                lines.append('type=dir;modify={}; {}'.format(modify, name))
+            else:
+                lines.append('type=file;size={};modify={}; {}'.format(size, modify, name))
+        self.transfer(''.join(line + '\r\n' for line in lines).encode('utf-8'))
+    
+    def ftp_list(self, arg):
+        '''LIST: list a directory in the format of ls -l.'''
+        path = self.resolve(arg if arg and not arg.startswith('-') else '')
+        if path not in self.fixture.directories:
+            self.reply('550 No such directory')
+            return
+        date = time.strftime('%b %d %H:%M', time.gmtime(self.fixture.modified))
+        lines = []
+        for name, size in self.fixture.children(path):
+            mode = 'drwxr-xr-x' if size is None else '-rw-r--r--'
+            lines.append('{} 1 ftp ftp {:>10} {} {}'.format(mode, size or 0, date, name))
+        self.transfer(''.join(line + '\r\n' for line in lines).encode('utf-8'))
+    
+    def ftp_retr(self, arg):
+        '''RETR: send a file.'''
+        body = self.fixture.resources.get(self.resolve(arg))
+        if body is None:
+            self.reply('550 No such file')
+            return
+        with self.fixture.lock:
+            self.fixture.retrieved += 1
+        self.transfer(body)
+    
+    def ftp_size(self, arg):
+        '''SIZE: the size of a file.'''
+        body = self.fixture.resources.get(self.resolve(arg))
+        if body is None:
+            self.reply('550 No such file')
+            return
+        self.reply('213 {}'.format(len(body)))
+    
+    def ftp_mdtm(self, arg):
+        '''MDTM: the modification time of a file.'''
+        if self.resolve(arg) not in self.fixture.resources:
+            self.reply('550 No such file')
+            return
+        self.reply('213 ' + time.strftime('%Y%m%d%H%M%S', time.gmtime(self.fixture.modified)))
+    
+    def ftp_nlst(self, arg):
+        '''NLST: list the names in a directory.'''
+        path = self.resolve(arg)
+        if path not in self.fixture.directories:
+            self.reply('550 No such directory')
+            return
+        self.transfer(''.join(name + '\r\n'
+                              for name, _ in self.fixture.children(path)).encode('utf-8'))
+    
+    def ftp_abor(self, arg):
+        '''ABOR: nothing is transferred in the background.'''
+        self.reply('226 Nothing to abort')
+    
+    def ftp_quit(self, arg):
+        '''QUIT: say goodbye and hang up.'''
+        self.reply('221 Goodbye')
+        return False
+
+
+class FtpServer(socketserver.ThreadingTCPServer):
+    """Threaded TCP server of the `FtpFixtureServer`."""
+    
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class FtpFixtureServer:
+    """Threaded FTP server serving `resources`, a dict of absolute path to bytes, on a free port of
+    127.0.0.1. With `users`, a dict of user name to password, only those users may log in. `tls`
+    is None, 'explicit', or 'implicit', and needs `cert_file` and `key_file`.
+    """
+    
+    def __init__(self, resources, latency=0.0, mlsd=True, users=None, tls=None, cert_file=None,
+                 key_file=None):
+        self.resources = resources
+        self.latency = latency
+        self.mlsd = mlsd
+        self.users = users
+        self.tls = tls
+        self.context = None
+        if tls:
+            self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.context.load_cert_chain(cert_file, key_file)
+        self.modified = time.time() - 3600
+        self.directories = {'/'}
+        self.entries = collections.defaultdict(dict)
+        for path, body in resources.items():
+            parent, name = posixpath.split(path)
+            self.entries[parent][name] = len(body)
+            while parent != '/':
+                self.directories.add(parent)
+                parent, name = posixpath.split(parent)
+                self.entries[parent][name] = None
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.logins = 0
+        self.retrieved = 0
+        self.commands = collections.Counter()
+        self.server = FtpServer(('127.0.0.1', 0), FtpHandler)
+        self.server.fixture = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    
+    def children(self, directory):
+        '''Return the (name, size) of the entries of `directory`, with a size of None for the
+        subdirectories.
+        '''
+        return sorted(self.entries.get(directory, {}).items())
+    
+    def url(self, path='/'):
+        '''Return the absolute URL of `path` on this server.'''
+        return '{}://127.0.0.1:{}{}'.format('ftps' if self.tls else 'ftp',
+                                            self.server.server_address[1], path)
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+'''Local SSH fixture server used by the benchmarks. Serves generated resources from memory over
+SFTP to any number of SSH connections, with paramiko. The directory tree is implied by the paths
+of the resources. Users log in with a password, or with one of the given public keys, and each
+connection accepts up to `max_sessions` channels, like the MaxSessions of OpenSSH. An artificial
+latency may be added to the network: every byte is relayed in both directions after a delay, so
+that round trips count as they do against a remote server while requests in flight at once
+overlap as they would. Requires paramiko.
+
+   usage:
+       >>> from benchmarks.sftp_server import SftpFixtureServer
+       >>> with SftpFixtureServer({'/srv/a.png': b'...'}, latency=0.005) as server:
+       >>>     server.write_known_hosts('known_hosts')
+       >>>     print(server.url('/srv/'))
+'''
+
+import collections
+import os
+import posixpath
+import queue
+import socket
+import stat
+import threading
+import time
+
+import paramiko
+
+
+class FixtureHandle(paramiko.SFTPHandle):
+    """Handle of a file opened on the `SftpFixtureServer`."""
+    
+    def __init__(self, fixture, body, attributes):
+        super().__init__()
+        self.fixture = fixture
+        self.body = body
+        self.attributes = attributes
+    
+    def read(self, offset, length):
+        '''Return `length` bytes of the file from `offset`.'''
+        with self.fixture.lock:
+            self.fixture.reads += 1
+        return self.body[offset:offset + length]
+    
+    def stat(self):
+        '''Return the attributes of the file.'''
+        return self.attributes
+
+
+class FixtureSftp(paramiko.SFTPServerInterface):
+    """SFTP subsystem of a channel of the `SftpFixtureServer`, serving its resources."""
+    
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.fixture = server.fixture
+    
+    def list_folder(self, path):
+        '''List the entries of the directory `path`.'''
+        path = posixpath.normpath(path)
+        if path not in self.fixture.directories:
+            return paramiko.SFTP_NO_SUCH_FILE
+        with self.fixture.lock:
+            self.fixture.listings += 1
+        return [self.fixture.attributes(posixpath.join(path, name), name)
+                for name in sorted(self.fixture.entries.get(path, ()))]
+    
+    def stat(self, path):
+        '''Return the attributes of `path`.'''
+        path = posixpath.normpath(path)
+        if path not in self.fixture.directories and path not in self.fixture.resources:
+            return paramiko.SFTP_NO_SUCH_FILE
+        return self.fixture.attributes(path, posixpath.basename(path))
+    
+    lstat = stat
+    
+    def open(self, path, flags, attr):
+        '''Open the file at `path` for reading.'''
+        path = posixpath.normpath(path)
+        body = self.fixture.resources.get(path)
+        if body is None:
+            return paramiko.SFTP_NO_SUCH_FILE
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            return paramiko.SFTP_PERMISSION_DENIED
+        with self.fixture.lock:
+            self.fixture.opened += 1
+        return FixtureHandle(self.fixture, body, self.fixture.attributes(
+            path, posixpath.basename(path)))
+
+
+class FixtureInterface(paramiko.ServerInterface):
+    """Authentication and channel policy of an SSH connection to the `SftpFixtureServer`."""
+    
+    def __init__(self, fixture):
+        self.fixture = fixture
+        self.channels = 0
+    
+    def get_allowed_auths(self, username):
+        return 'password,publickey'
+    
+    def check_auth_password(self, username, password):
+        users = self.fixture.users
+        if users is not None and users.get(username) != password:
+            return paramiko.AUTH_FAILED
+        return self.logged_in()
+    
+    def check_auth_publickey(self, username, key):
+        if key not in self.fixture.keys:
+            return paramiko.AUTH_FAILED
+        return self.logged_in()
+    
+    def logged_in(self):
+        '''Count a successful login.'''
+        with self.fixture.lock:
+            self.fixture.logins += 1
+        return paramiko.AUTH_SUCCESSFUL
+    
+    def check_channel_request(self, kind, chanid):
+        if kind != 'session' or self.channels >= self.fixture.max_sessions:
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+        self.channels += 1
+        with self.fixture.lock:
+            self.fixture.channels += 1
+        return paramiko.OPEN_SUCCEEDED
+
+
+class DelayLine:
+    """Relay of the bytes of a socket to another after a fixed delay, in order."""
+    
+    def __init__(self, source, target, latency):
+        self.source = source
+        self.target = target
+        self.latency = latency
+        self.queue = queue.Queue()
+        threading.Thread(target=self.receive, daemon=True).start()
+        threading.Thread(target=self.send, daemon=True).start()
+    
+    def receive(self):
+        '''Queue the bytes read from the source with the time they are due.'''
+        try:
+            while True:
+                data = self.source.recv(65536)
+                if not data:
+                    break
+                self.queue.put((time.monotonic() + self.latency, data))
+        except OSError:
+            pass
+        self.queue.put((time.monotonic() + self.latency, b''))
+    
+    def send(self):
+        '''Write the queued bytes to the target once they are due.'''
+        try:
+            while True:
+                due, data = self.queue.get()
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if not data:
+                    self.target.shutdown(socket.SHUT_WR)
+                    break
+                self.target.sendall(data)
+        except OSError:
+            pass
+
+
+class SftpFixtureServer:
+    """SSH server serving `resources`, a dict of absolute path to bytes, over SFTP on a free port
+    of 127.0.0.1. With `users`, a dict of user name to password, only those users may log in with
+    a password; any user may log in with one of the paramiko public `keys`.
+    """
+    
+    def __init__(self, resources, latency=0.0, users=None, keys=(), max_sessions=10):
+        self.resources = resources
+        self.latency = latency
+        self.users = users
+        self.keys = list(keys)
+        self.max_sessions = max_sessions
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.modified = int(time.time()) - 3600
+        self.directories = {'/'}
+        self.entries = collections.defaultdict(set)
+        for path in resources:
+            parent, name = posixpath.split(path)
+            self.entries[parent].add(name)
+            while parent != '/':
+                self.directories.add(parent)
+                parent, name = posixpath.split(parent)
+                self.entries[parent].add(name)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.logins = 0
+        self.channels = 0
+        self.listings = 0
+        self.opened = 0
+        self.reads = 0
+        self.transports = []
+        self.listener = socket.create_server(('127.0.0.1', 0), backlog=1024)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+    
+    def attributes(self, path, name):
+        '''Return the `SFTPAttributes` of the file or directory `path`, named `name`.'''
+        attributes = paramiko.SFTPAttributes()
+        attributes.filename = name
+        if path in self.directories:
+            attributes.st_mode = stat.S_IFDIR | 0o755
+            attributes.st_size = 0
+        else:
+            attributes.st_mode = stat.S_IFREG | 0o644
+            attributes.st_size = len(self.resources[path])
+        attributes.st_mtime = attributes.st_atime = self.modified
+        attributes.st_uid = attributes.st_gid = 0
+        return attributes
+    
+    def serve(self):
+        '''Accept connections until the server is closed.'''
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.connections += 1
+            if self.latency:
+                client, server = socket.socketpair()
+                DelayLine(sock, server, self.latency)
+                DelayLine(server, sock, self.latency)
+                sock = client
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(self.host_key)
+            # The subsystem of each channel reaches the fixture through the server interface.
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, FixtureSftp)
+            # With an event, the key exchange runs on the thread of the transport rather than
+            # holding up the connections that follow.
+            transport.start_server(event=threading.Event(), server=FixtureInterface(self))
+            self.transports.append(transport)
+    
+    def write_known_hosts(self, path):
+        '''Write a known_hosts file trusting the host key of this server to `path`.'''
+        with open(path, 'w') as fd:
+            fd.write('[127.0.0.1]:{} {} {}\n'.format(self.listener.getsockname()[1],
+                                                     self.host_key.get_name(),
+                                                     self.host_key.get_base64()))
+    
+    def url(self, path='/', scheme='sftp'):
+        '''Return the absolute URL of `path` on this server.'''
+        return '{}://127.0.0.1:{}{}'.format(scheme, self.listener.getsockname()[1], path)
+    
+    def __enter__(self):
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.listener.close()
+        for transport in self.transports:
+            transport.close()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+'''Synthetic site generator used by the end-to-end benchmark. Builds a tree of HTML pages, each
+linking to `fanout` child pages and embedding `images_per_page` images, as a dict of path to bytes
+that `FixtureServer` serves from memory. Images are random bytes behind a valid header of their
+format (PNG, GIF, JPEG, or BMP) with random dimensions, so that they pass the candidate filter and
+the dimension probe of the scrapers, padded to the requested size. The same seed always generates
+the same site.
+
+   usage:
+       >>> from benchmarks.site_generator import generate_site
+       >>> site = generate_site(pages=100, fanout=4, images_per_page=10, image_size=16384)
+       >>> site.resources['/index.html']
+       >>> site.pages, site.images, site.image_bytes
+'''
+
+import random
+import re
+import struct
+import zlib
+
+
+FORMATS = ('png', 'gif', 'jpg', 'bmp')
+
+SIZE = re.compile(r'^\s*(\d+)\s*([kKmM]?)\s*$')
+
+
+def parse_size(value):
+    '''Parse a size in bytes such as `16384`, `64k`, or `2m`.'''
+    match = SIZE.match(str(value))
+    if match is None:
+        raise ValueError('Invalid size: {!r}'.format(value))
+    return int(match.group(1)) * {'': 1, 'k': 1024, 'm': 1024 ** 2}[match.group(2).lower()]
+
+
+def png_header(width, height):
+    '''Return the signature and IHDR chunk of a PNG of `width` x `height`.'''
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr +
+            struct.pack('>I', zlib.crc32(b'IHDR' + ihdr)))
+
+
+def gif_header(width, height):
+    '''Return the header and logical screen descriptor of a GIF of `width` x `height`.'''
+    return b'GIF89a' + struct.pack('<HHBBB', width, height, 0, 0, 0)
+
+
+def jpg_header(width, height):
+    '''Return the start of image marker and a baseline SOF0 segment of a JPEG of `width` x
+    `height`.
+    '''
+    return (b'\xff\xd8\xff\xc0' + struct.pack('>HBHHB', 17, 8, height, width, 3) +
+            b'\x01\x22\x00\x02\x11\x01\x03\x11\x01')
+
+
+def bmp_header(width, height):
+    '''Return the file header and BITMAPINFOHEADER of a 24-bit BMP of `width` x `height`.'''
+    return (b'BM' + struct.pack('<IHHI', 0, 0, 0, 54) +
+            struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, 0, 2835, 2835, 0, 0))
+
+
+HEADERS = {'png': png_header, 'gif': gif_header, 'jpg': jpg_header, 'bmp': bmp_header}
+
+
+def make_image(image_format, width, height, size, rng):
+    '''Return the bytes of an image of `image_format` with the given dimensions, padded with
+    random bytes from `rng` to `size` bytes.
+    '''
+    header = HEADERS[image_format](width, height)
+    return header + rng.getrandbits(8 * max(0, size - len(header))).to_bytes(
+        max(0, size - len(header)), 'little')
+
+
+class Site:
+    """A generated site: its resources and what a full crawl of it should find."""
+    
+    def __init__(self):
+        self.resources = {}
+        self.pages = 0
+        self.images = 0
+        self.image_bytes = 0
+
+
+def generate_site(pages=100, fanout=4, images_per_page=10, image_size=16384, formats=FORMATS,
+                  seed=0):
+    '''Generate a site of `pages` pages in a tree of branching factor `fanout`, rooted at
+    `/index.html`, each embedding `images_per_page` distinct images of `image_size` bytes in
+    the given `formats`, used in turn. Returns a `Site`.
+    '''
+    rng = random.Random(seed)
+    site = Site()
+    paths = ['/index.html'] + ['/p{}/index.html'.format(index) for index in range(1, pages)]
+    for index, path in enumerate(paths):
+        children = paths[index * fanout + 1:index * fanout + 1 + fanout]
+        body = ['<!DOCTYPE html>\n<html><head><title>Page {}</title></head><body>'.format(index)]
+        body.extend('<a href="{}">Page</a>'.format(child) for child in children)
+        for number in range(images_per_page):
+            image_format = formats[(index * images_per_page + number) % len(formats)]
+            image_path = '/img/{}/{}.{}'.format(index, number, image_format)
+            data = make_image(image_format, rng.randint(64, 2048), rng.randint(64, 2048),
+                              image_size, rng)
+            site.resources[image_path] = data
+            site.images += 1
+            site.image_bytes += len(data)
+            body.append('<p>Image {}</p><img src="{}" alt="">'.format(number, image_path))
+        body.append('</body></html>\n')
+        site.resources[path] = ''.join(body).encode('utf-8')
+        site.pages += 1
+    return site
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+'''BatchRunner implements option -b/--batch. URIs are streamed from a file, or from stdin, one
+per line, each optionally followed by overrides of the scraper and of option -l for that URI:
+
+    https://example.com/gallery/
+    cars scraper=tumblr limit=50
+    {"uri": "/srv/photos", "scraper": "generic", "limit": 10}
+
+Blank lines and lines starting with `#` are skipped. The URIs are grouped into shards of option
+-bs URIs and handed to option -bw worker processes. Each worker runs the scrapers with the options
+of the batch job, and scrapes one shard at a time with its own asyncio download engine. When any
+of the options -w, -s, or -hrl is set, every URI of a host goes to the same worker, so that the
+delays and limits of the host still hold; otherwise each shard goes to the least busy worker. The
+result counts, filter counts, and metrics of every shard are sent back and merged into one report.
+
+   usage:
+       >>> from scrapers.BatchRunner import BatchRunner, read_batch
+       >>> runner = BatchRunner(scraper, workers=8, batch_size=32)
+       >>> runner.run(read_batch(open('uris.txt', encoding='utf-8'), runner.reject))
+       >>> print('\\n'.join(runner.summary(elapsed=60.0)))
+'''
+
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import zlib
+from urllib.parse import urlsplit
+
+try:
+    from scrapers.Logger import LOGGER
+    from scrapers.RateLimiter import parse_rate
+    from scrapers.Scraper import load_scraper
+    from scrapers.ScraperDriver import ScraperDriver
+except ImportError:
+    from Logger import LOGGER
+    from RateLimiter import parse_rate
+    from Scraper import load_scraper
+    from ScraperDriver import ScraperDriver
+
+
+BatchItem = collections.namedtuple('BatchItem', 'uri scraper limit')
+
+ShardResult = collections.namedtuple('ShardResult',
+                                     'shard counts metrics rejected checked error')
+
+OVERRIDES = ('scraper', 'limit')
+
+# Options that hold per host, and so need every URI of a host in the same worker.
+HOST_OPTIONS = ('wait', 'sleep', 'host_rate_limit')
+
+
+def parse_line(line):
+    '''Parse a line of a batch file into a `BatchItem`, or None for a blank line or a comment.
+    Raises ValueError for a malformed line.
+    '''
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        fields = json.loads(line)
+        if not isinstance(fields, dict):
+            raise ValueError('expected a JSON object')
+        uri = fields.pop('uri', None)
+    else:
+        uri, *pairs = line.split()
+        fields = {}
+        for pair in pairs:
+            key, separator, value = pair.partition('=')
+            if not separator:
+                raise ValueError('expected key=value, got {!r}'.format(pair))
+            fields[key] = value
+    unknown = sorted(set(fields) - set(OVERRIDES))
+    if unknown:
+        raise ValueError('unknown override {!r}'.format(unknown[0]))
+    if not isinstance(uri, str) or not uri:
+        raise ValueError('missing URI')
+    limit = fields.get('limit')
+    if limit is not None:
+        limit = int(limit)
+    return BatchItem(uri, fields.get('scraper') or None, limit)
+
+
+def read_batch(stream, on_error=None):
+    '''Iterate over the `BatchItem` of each line of `stream`, reading it as it goes. Malformed
+    lines are skipped, after calling `on_error` with a message naming the line, if given.
+    '''
+    for number, line in enumerate(stream, 1):
+        try:
+            item = parse_line(line)
+        except ValueError as error:
+            if on_error is not None:
+                on_error('line {}: {}'.format(number, error))
+            continue
+        if item is not None:
+            yield item
+
+
+def load_batch_scraper(name, options):
+    '''Return a new scraper of the type registered as `name`, with the parsed command line
+    `options` of the batch job. Raises KeyError for an unknown name.
+    '''
+    scraper_class = load_scraper(name)
+    args = ['scraper.py', name] + (['--debug'] if options.get('debug') else [])
+    scraper = scraper_class(ScraperDriver(*args))
+    scraper.options.update(options)
+    LOGGER.configure(path=options.get('output_log'), json_lines=options.get('log_json'))
+    return scraper
+
+
+def run_worker(options, tasks, done):
+    '''Body of a worker process: scrape the shards taken from the queue `tasks` until None is
+    taken, putting a `ShardResult` for each on the queue `done`. Interrupts are left to the
+    parent process, which stops the workers itself.
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    scrapers = {}
+    try:
+        for shard, name, items in iter(tasks.get, None):
+            try:
+                if name not in scrapers:
+                    scrapers[name] = load_batch_scraper(name, options)
+                    scrapers[name].batch_worker = True
+                    scrapers[name].resize_workers = 1
+                done.put(ShardResult(shard, *scrapers[name].scrape_shard(items), None))
+            except Exception as error:  # pylint: disable=broad-except
+                done.put(ShardResult(shard, None, None, None, None,
+                                     '{}: {}'.format(type(error).__name__, error)))
+    finally:
+        LOGGER.close()
+
+
+class Worker:
+    """A worker process of a batch job and the queue of shards handed to it."""
+    
+    def __init__(self, context, index, options, done):
+        self.index = index
+        self.tasks = context.Queue()
+        self.shards = {}
+        self.process = context.Process(target=run_worker, args=(options, self.tasks, done),
+                                       name='scraper-batch-{}'.format(index))
+        self.process.start()
+    
+    @property
+    def load(self):
+        '''The number of URIs handed to the worker and not done yet.'''
+        return sum(len(items) for _, items in self.shards.values())
+
+
+class BatchRunner:
+    """Shards the URIs of a batch job across worker processes and merges their results."""
+    
+    max_shards = 2
+    poll_interval = 1.0
+    
+    def __init__(self, scraper, workers=None, batch_size=32):
+        self.scraper = scraper
+        self.size = workers or os.cpu_count() or 1
+        self.batch_size = max(1, batch_size or 1)
+        self.by_host = any(scraper.options.get(name) for name in HOST_OPTIONS)
+        self.options = self.get_worker_options()
+        self.context = multiprocessing.get_context('spawn')
+        self.done = None
+        self.workers = []
+        self.pending = {}
+        self.shards = {}
+        self.sequence = itertools.count(1)
+        self.scrapers = {scraper.name: scraper}
+        self.counts = collections.Counter()
+        self.uris = 0
+        self.dispatched = 0
+        self.invalid = 0
+        self.failed = 0
+        self.dumped = time.monotonic()
+    
+    def get_worker_options(self):
+        '''Return the options the workers run with: those of the batch job, with the overall
+        rate limit of option -rl shared out between the workers. Raises ValueError for an
+        invalid rate.
+        '''
+        options = dict(self.scraper.options, batch=None, uri=[], profile=None)
+        rate = parse_rate(options.get('rate_limit'))
+        if rate is not None:
+            options['rate_limit'] = str(rate / self.size)
+        return options
+    
+    def reject(self, message):
+        '''Count and report a line of the batch that could not be scraped.'''
+        self.invalid += 1
+        self.scraper.write('Error: batch {}'.format(message))
+    
+    def run(self, items):
+        '''Scrape every `BatchItem` of the iterable `items`, blocking until all of them are done.
+        Shards are handed out while `items` is still being read.
+        '''
+        self.done = self.context.Queue()
+        try:
+            self.workers = [Worker(self.context, index, self.options, self.done)
+                            for index in range(self.size)]
+            for item in items:
+                self.add(item)
+            for key in list(self.pending):
+                self.dispatch(key)
+            while self.shards:
+                self.collect()
+            for worker in self.workers:
+                worker.tasks.put(None)
+            for worker in self.workers:
+                worker.process.join()
+        except BaseException:
+            for worker in self.workers:
+                worker.process.terminate()
+            raise
+    
+    def add(self, item):
+        '''Resolve the URI of `item` with its scraper and add it to a pending shard, handing the
+        shard out once it is full.
+        '''
+        name = item.scraper or self.scraper.name
+        try:
+            if name not in self.scrapers:
+                self.scrapers[name] = load_batch_scraper(name, self.options)
+        except KeyError:
+            self.reject('unknown scraper {!r} for {}'.format(name, item.uri))
+            return
+        uri = self.scrapers[name].resolve_uri(item.uri)
+        index = None
+        if self.by_host:
+            host = urlsplit(uri).hostname or ''
+            index = zlib.crc32(host.encode('utf-8')) % self.size
+        key = (index, name)
+        shard = self.pending.setdefault(key, [])
+        shard.append((uri, item.limit))
+        self.uris += 1
+        if len(shard) >= self.batch_size:
+            self.dispatch(key)
+    
+    def dispatch(self, key):
+        '''Hand the pending shard `key`, an (index of the worker or None, scraper name) tuple, to
+        its worker, or to the least busy worker if the index is None. Waits for results while the
+        worker, or every worker, already has `max_shards` shards queued.
+        '''
+        items = self.pending.pop(key)
+        index, name = key
+        while True:
+            if index is None:
+                worker = min(self.workers, key=lambda worker: worker.load)
+            else:
+                worker = self.workers[index]
+            if len(worker.shards) < self.max_shards:
+                break
+            self.collect()
+        shard = next(self.sequence)
+        worker.shards[shard] = (name, items)
+        self.shards[shard] = worker
+        self.dispatched += 1
+        worker.tasks.put((shard, name, items))
+    
+    def collect(self):
+        '''Wait up to `poll_interval` seconds for the result of a shard and merge it. Writes the
+        file of option --stats-file when due, and gives up on the shards of workers that died.
+        '''
+        try:
+            self.merge(self.done.get(timeout=self.poll_interval))
+        except queue.Empty:
+            self.check_workers()
+        self.dump_stats()
+    
+    def merge(self, result):
+        '''Merge the `ShardResult` `result` into the report of the batch.'''
+        worker = self.shards.pop(result.shard, None)
+        if worker is None:
+            return
+        _, items = worker.shards.pop(result.shard)
+        if result.error is not None:
+            self.fail(items, result.error)
+            return
+        self.counts.update(result.counts)
+        if result.metrics is not None and self.scraper.metrics is not None:
+            self.scraper.metrics.merge(result.metrics)
+        candidates = self.scraper.get_candidates()
+        candidates.rejected.update(result.rejected)
+        candidates.checked.update(result.checked)
+    
+    def fail(self, items, error):
+        '''Count and report the URIs of a shard that failed with `error`.'''
+        self.failed += len(items)
+        for uri, _ in items:
+            self.scraper.write('Error: batch shard failed for {}: {}'.format(uri, error))
+    
+    def check_workers(self):
+        '''Replace the workers that died, failing the shards they were handed, after merging
+        any result they sent before dying.
+        '''
+        for worker in list(self.workers):
+            if worker.process.exitcode is None:
+                continue
+            while True:
+                try:
+                    self.merge(self.done.get_nowait())
+                except queue.Empty:
+                    break
+            error = 'worker exited with code {}'.format(worker.process.exitcode)
+            for shard, (_, items) in list(worker.shards.items()):
+                del self.shards[shard]
+                self.fail(items, error)
+            self.workers[worker.index] = Worker(self.context, worker.index, self.options,
+                                                self.done)
+    
+    def dump_stats(self):
+        '''Write the merged metrics to the file of option --stats-file every --stats-interval
+        seconds.
+        '''
+        options = self.scraper.options
+        interval = options.get('stats_interval') or 10.0
+        if self.scraper.metrics is None or not options.get('stats_file') or \
+                time.monotonic() - self.dumped < interval:
+            return
+        self.dumped = time.monotonic()
+        try:
+            self.scraper.metrics.dump(options['stats_file'], options.get('stats_format'))
+        except OSError as error:
+            self.scraper.write('Error: could not write stats: {}'.format(error))
+    
+    def summary(self, elapsed):
+        '''Return the lines of the report of the batch, which took `elapsed` seconds.'''
+        results = ', '.join('{} {}'.format(status, count)
+                            for status, count in sorted(self.counts.items()))
+        lines = ['Batch: {} URIs in {} shards on {} workers, {:.1f}s: {}'.format(
+            self.uris, self.dispatched, self.size, elapsed, results or 'no results')]
+        if self.invalid or self.failed:
+            lines.append('Batch: {} invalid lines, {} URIs failed'.format(self.invalid,
+                                                                         self.failed))
+        return lines
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+'''CandidateFilter compiles options -e/--extensions and -n/--names once and checks every image
+candidate against them in three stages, cheapest first:
+
+    1. url: the extension and basename of the URL, before any connection is opened.
+    2. headers: the Content-Type and Content-Length of the response, before the body is read.
+    3. content: the magic bytes at the start of the body, so that a mislabeled file is dropped
+       after its first chunk rather than once it has been downloaded.
+
+Each stage counts the candidates it checked and rejected.
+
+   usage:
+       >>> from scrapers.CandidateFilter import CandidateFilter
+       >>> candidates = CandidateFilter(extensions='jpg,png', names='^img')
+       >>> candidates.check_url('http://example.com/img1.gif')
+       False
+       >>> candidates.summary()
+       'url 1/1, headers 0/0, content 0/0'
+'''
+
+import collections
+import os
+import re
+from urllib.parse import unquote, urlsplit
+
+
+URL = 'url'
+HEADERS = 'headers'
+CONTENT = 'content'
+STAGES = (URL, HEADERS, CONTENT)
+
+FORMATS = {'bmp': 'bmp', 'gif': 'gif', 'jpg': 'jpeg', 'jpeg': 'jpeg', 'png': 'png', 'svg': 'svg',
+           'psd': 'psd', 'xcf': 'xcf', 'webp': 'webp'}
+
+CONTENT_TYPES = {'image/bmp': 'bmp', 'image/x-bmp': 'bmp', 'image/x-ms-bmp': 'bmp',
+                 'image/gif': 'gif', 'image/jpeg': 'jpeg', 'image/pjpeg': 'jpeg',
+                 'image/png': 'png', 'image/svg+xml': 'svg', 'image/vnd.adobe.photoshop': 'psd',
+                 'image/x-photoshop': 'psd', 'image/x-xcf': 'xcf', 'image/webp': 'webp'}
+
+GENERIC_TYPES = ('', 'application/octet-stream', 'binary/octet-stream',
+                 'application/x-download', 'text/plain', 'text/xml', 'application/xml')
+
+MAGIC = ((b'\x89PNG\r\n\x1a\n', 'png'), (b'GIF87a', 'gif'), (b'GIF89a', 'gif'),
+         (b'\xff\xd8\xff', 'jpeg'), (b'BM', 'bmp'), (b'8BPS', 'psd'), (b'gimp xcf', 'xcf'))
+
+SVG = re.compile(rb'^(?:\xef\xbb\xbf)?\s*(?:<\?xml[^>]*>\s*)?(?:<!--.*?-->\s*|<!DOCTYPE[^>]*>\s*)*'
+                 rb'<svg\b', re.IGNORECASE | re.DOTALL)
+
+
+def sniff(data):
+    '''Return the image format whose magic bytes start `data`, or None.'''
+    for magic, image_format in MAGIC:
+        if data.startswith(magic):
+            return image_format
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    if SVG.match(data):
+        return 'svg'
+    return None
+
+
+class CandidateFilter:
+    """Staged filter of image candidates for options -e and -n, with per-stage counters."""
+    
+    sniff_size = 512
+    
+    def __init__(self, extensions=None, names=None):
+        if extensions:
+            extensions = [ext.strip().lstrip('.').lower() for ext in extensions.split(',')]
+            self.extensions = frozenset(ext for ext in extensions if ext)
+        else:
+            self.extensions = frozenset(FORMATS)
+        self.formats = frozenset(FORMATS.get(ext, ext) for ext in self.extensions)
+        self.names = re.compile(names) if names else None
+        self.checked = collections.Counter()
+        self.rejected = collections.Counter()
+    
+    def count(self, stage, accepted):
+        '''Count a candidate checked at `stage`. Returns `accepted`.'''
+        self.checked[stage] += 1
+        if not accepted:
+            self.rejected[stage] += 1
+        return accepted
+    
+    def accept_name(self, name):
+        '''Return True if the filename `name` passes options -e and -n. A file must have one of
+        the extensions to pass. Used on local files, where the name is all there is to go on.
+        '''
+        root, ext = os.path.splitext(name)
+        return self.count(URL, ext[1:].lower() in self.extensions and
+                          (self.names is None or self.names.search(root) is not None))
+    
+    def check_url(self, url):
+        '''Stage 1: return False if the URL of an image candidate shows that it fails option -e
+        or -n. A URL without an image extension, such as `/media?id=1`, passes the extension
+        check and is left to the later stages.
+        '''
+        name = os.path.basename(unquote(urlsplit(url).path))
+        root, ext = os.path.splitext(name)
+        ext = ext[1:].lower()
+        accepted = not (ext in FORMATS and ext not in self.extensions)
+        if accepted and self.names is not None:
+            accepted = self.names.search(root if ext in FORMATS else name) is not None
+        return self.count(URL, accepted)
+    
+    def check_headers(self, url, response):
+        '''Stage 2: return False if the headers of `response` show that it is not an image of
+        the allowed formats, or that its body is empty. A generic or missing Content-Type passes
+        unless the URL has an image extension that is not allowed, leaving it to stage 3.
+        '''
+        content_type = response.content_type
+        image_format = CONTENT_TYPES.get(content_type)
+        if image_format is not None:
+            accepted = image_format in self.formats
+        elif content_type in GENERIC_TYPES:
+            ext = os.path.splitext(urlsplit(url).path)[1][1:].lower()
+            accepted = not (ext in FORMATS and ext not in self.extensions)
+        else:
+            accepted = content_type.startswith('image/') and content_type[6:] in self.extensions
+        if response.status == 200 and response.content_length == 0:
+            accepted = False
+        return self.count(HEADERS, accepted)
+    
+    def check_content(self, data):
+        '''Stage 3: return False if the leading bytes `data` of the body are not the magic bytes
+        of an image of the allowed formats. Unrecognised bytes pass only if option -e names a
+        format that cannot be sniffed.
+        '''
+        image_format = sniff(data)
+        if image_format is None:
+            return self.count(CONTENT, not self.formats <= frozenset(FORMATS.values()))
+        return self.count(CONTENT, image_format in self.formats)
+    
+    def summary(self):
+        '''Return the rejected/checked counts of each stage as a string.'''
+        return ', '.join('{} {}/{}'.format(stage, self.rejected[stage], self.checked[stage])
+                         for stage in STAGES)
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+
+'''Coordinator implements options --coordinator and --worker, which spread a recursive crawl over
+several processes, on one or more machines. The coordinator owns the crawl: the `Frontier`, which
+dedupes the URLs found, and the `Scheduler`, which applies options -s, -w, and -l. It hands out
+leases of up to --lease-size frontier items to the workers that connect to it over TCP, and takes
+back the links found and the items done, which the workers send in batches.
+
+A worker renews its leases with a heartbeat every third of --lease-timeout. A lease that is not
+renewed in time, or whose worker disconnects, is requeued and handed to another worker. The
+download limit of option -l is counted by the coordinator as results come in, so workers that
+are busy with a URI resource when it reaches the limit may go over it by a few downloads.
+
+Each worker crawls its leases with its own download engine and options, such as -R, -dd, -rl,
+and -rf. The options that decide what is crawled and kept, such as -e, -n, and the dimension
+filters, are taken from the coordinator so that every worker applies the same ones. The protocol
+is one JSON object per line, each request answered by one reply. It is not authenticated, so the
+coordinator listens on 127.0.0.1 unless given another address on a trusted network.
+
+   usage:
+       >>> from scrapers.Coordinator import Coordinator, CrawlWorker, parse_address
+       >>> coordinator = Coordinator(scraper, uris, parse_address('0.0.0.0:8765'))
+       >>> await coordinator.run()
+       >>> worker = CrawlWorker(scraper, parse_address('coordinator.example.com:8765'))
+       >>> await worker.run()
+'''
+
+import asyncio
+import collections
+import itertools
+import json
+import os
+import socket
+import time
+
+try:
+    from scrapers.Frontier import FrontierItem
+    from scrapers.ResourceExtractor import IMAGE
+    from scrapers.Scheduler import Scheduler
+except ImportError:
+    from Frontier import FrontierItem
+    from ResourceExtractor import IMAGE
+    from Scheduler import Scheduler
+
+
+DEFAULT_HOST = '127.0.0.1'
+
+MAX_LINE = 2 ** 24
+
+# Options of the coordinator that every worker uses instead of its own.
+SHARED_OPTIONS = ('user_agent', 'extensions', 'names', 'incremental', 'min_width', 'max_width',
+                  'min_height', 'max_height', 'no_follow', 'output_filename', 'resize',
+                  'no_ratio')
+
+
+def parse_address(value, default_host=DEFAULT_HOST):
+    '''Parse an address such as `8765`, `host:8765`, or `[::1]:8765` into a (host, port) tuple.
+    Raises ValueError for an invalid address.
+    '''
+    host, separator, port = (value or '').rpartition(':')
+    if not separator:
+        host = default_host
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError('Invalid address: {!r}'.format(value))
+    if not 0 <= port <= 65535:
+        raise ValueError('Invalid port: {!r}'.format(value))
+    return host.strip('[]') or default_host, port
+
+
+async def send(writer, message):
+    '''Write `message` to the stream `writer` as a JSON line.'''
+    writer.write(json.dumps(message).encode('utf-8') + b'\n')
+    await writer.drain()
+
+
+async def receive(reader):
+    '''Read a JSON object line from the stream `reader`. Raises ConnectionError at the end of the
+    stream, and ValueError if the line is not a JSON object.
+    '''
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError('Connection closed')
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ValueError('Not a JSON object: {!r}'.format(line[:80]))
+    return message
+
+
+class Lease:
+    """Frontier items handed to a worker until they are done, or the lease expires."""
+    
+    def __init__(self, number, connection, items, timeout):
+        self.number = number
+        self.connection = connection
+        self.items = {item.url: item for item in items}
+        self.expires = time.monotonic() + timeout
+
+
+class Coordinator:
+    """Owner of a distributed crawl, leasing frontier items to the workers over TCP."""
+    
+    grace_period = 5.0
+    poll_delay = 0.05
+    
+    def __init__(self, scraper, uris, address, lease_size=64, lease_timeout=30.0):
+        self.scraper = scraper
+        self.uris = uris
+        self.host, self.port = address
+        self.lease_size = lease_size
+        self.lease_timeout = lease_timeout
+        self.frontier = None
+        self.scheduler = None
+        self.server = None
+        self.finished = None
+        self.sequence = itertools.count(1)
+        self.leases = {}
+        self.leased = {}
+        self.connections = {}
+        self.workers = set()
+        self.counts = collections.Counter()
+        self.visited = 0
+        self.requeued = 0
+    
+    async def run(self):
+        '''Serve the workers until every URL of the crawl is done. A crawl that is interrupted is
+        resumed the next time the same job is run.
+        '''
+        scraper = self.scraper
+        self.scheduler = scraper.scheduler = Scheduler(sleep=scraper.options.get('sleep'),
+                                                       wait=scraper.options.get('wait'),
+                                                       limit=scraper.options.get('limit'))
+        self.frontier = scraper.get_frontier(self.uris)
+        if self.frontier.resumed:
+            scraper.write('Resuming crawl from {}'.format(self.frontier.path))
+        else:
+            for uri in self.uris:
+                self.frontier.add(uri, depth=0, root=uri)
+        self.finished = asyncio.Event()
+        complete = False
+        expiry = None
+        try:
+            self.server = await asyncio.start_server(self.serve, self.host, self.port,
+                                                     limit=MAX_LINE)
+            scraper.write('Coordinating crawl on {}:{}'.format(
+                *self.server.sockets[0].getsockname()[:2]))
+            expiry = asyncio.ensure_future(self.expire())
+            await self.finished.wait()
+            complete = True
+            deadline = time.monotonic() + self.grace_period
+            while self.connections and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            if expiry is not None:
+                expiry.cancel()
+            if self.server is not None:
+                self.server.close()
+                # Workers that are still connected may be hung, so their connections are
+                # dropped rather than flushed.
+                handlers = list(self.connections.values())
+                for writer in list(self.connections):
+                    writer.transport.abort()
+                await asyncio.gather(*handlers, return_exceptions=True)
+                await self.server.wait_closed()
+            self.frontier.close(complete=complete)
+    
+    async def serve(self, reader, writer):
+        '''Answer the requests of a worker until it disconnects, then requeue its leases.'''
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                message = await receive(reader)
+                await send(writer, self.handle(writer, message))
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            for lease in [lease for lease in self.leases.values() if lease.connection is writer]:
+                self.requeue(lease)
+            writer.close()
+    
+    def handle(self, connection, message):
+        '''Return the reply to the request `message` of the worker on `connection`.'''
+        kind = message.get('type')
+        if kind == 'hello':
+            self.workers.add(message.get('worker'))
+            return {'type': 'welcome', 'heartbeat': self.lease_timeout / 3,
+                    'options': {name: self.scraper.options.get(name) for name in SHARED_OPTIONS}}
+        if kind in ('results', 'lease'):
+            self.merge(message)
+        if kind in ('results', 'lease', 'heartbeat'):
+            self.renew(connection)
+        if kind == 'lease':
+            return self.lease(connection, message.get('max') or self.lease_size)
+        if kind in ('results', 'heartbeat'):
+            return {'type': 'ok'}
+        return {'type': 'error', 'error': 'Unknown request: {!r}'.format(kind)}
+    
+    def lease(self, connection, size):
+        '''Lease up to `size` frontier items to the worker on `connection`, and return the reply
+        to its request: the lease, a delay to wait for before asking again, or the end of the
+        crawl once nothing is pending, leased, or waiting out a delay of its host.
+        '''
+        items = []
+        while len(items) < min(size, self.lease_size):
+            item = self.scraper.next_crawl_item(self.frontier)
+            if item is None:
+                break
+            items.append(item)
+        if not items:
+            if not self.leases and not self.scheduler.deferred:
+                self.finished.set()
+                return {'type': 'done'}
+            delay = self.scheduler.next_due()
+            delay = self.poll_delay if delay is None else min(self.poll_delay, max(0.01, delay))
+            return {'type': 'wait', 'delay': delay}
+        lease = Lease(next(self.sequence), connection, items, self.lease_timeout)
+        self.leases[lease.number] = lease
+        for item in items:
+            self.leased[item.url] = lease
+        return {'type': 'lease', 'lease': lease.number, 'items': [list(item) for item in items]}
+    
+    def merge(self, message):
+        '''Merge the results a worker sent with `message`: the links it found, the items it is
+        done with, and the number of downloads it saved and its result counts.
+        '''
+        for urls, depth, root, kind, referrer in message.get('links') or ():
+            self.frontier.add_many(urls, depth, root, kind=kind, referrer=referrer)
+        for url in message.get('done') or ():
+            self.frontier.done(url)
+            self.visited += 1
+            lease = self.leased.pop(url, None)
+            if lease is not None:
+                lease.items.pop(url, None)
+                if not lease.items:
+                    self.leases.pop(lease.number, None)
+        for root, saved in (message.get('saved') or {}).items():
+            self.scheduler.saved[root] += saved
+        self.counts.update(message.get('counts') or {})
+    
+    def renew(self, connection):
+        '''Push back the expiry of every lease of the worker on `connection`.'''
+        expires = time.monotonic() + self.lease_timeout
+        for lease in self.leases.values():
+            if lease.connection is connection:
+                lease.expires = expires
+    
+    def requeue(self, lease):
+        '''Give up on `lease`, making its items that are not done pending again.'''
+        self.leases.pop(lease.number, None)
+        items = [item for url, item in lease.items.items() if self.leased.get(url) is lease]
+        for item in items:
+            del self.leased[item.url]
+        self.frontier.requeue(items)
+        self.requeued += 1
+    
+    async def expire(self):
+        '''Coroutine that requeues the leases that were not renewed in time, until cancelled.'''
+        while True:
+            await asyncio.sleep(min(1.0, self.lease_timeout / 3))
+            now = time.monotonic()
+            for lease in [lease for lease in self.leases.values() if lease.expires < now]:
+                self.requeue(lease)
+    
+    def summary(self, elapsed):
+        '''Return the lines of the report of the crawl, which took `elapsed` seconds.'''
+        results = ', '.join('{} {}'.format(status, count)
+                            for status, count in sorted(self.counts.items()))
+        lines = ['Crawl: {} URLs done by {} workers in {:.1f}s: {}'.format(
+            self.visited, len(self.workers), elapsed, results or 'no results')]
+        if self.requeued:
+            lines.append('Crawl: {} leases requeued'.format(self.requeued))
+        return lines
+
+
+class RemoteFrontier:
+    """Stand-in for the `Frontier` on a worker, collecting what it sends to the coordinator."""
+    
+    def __init__(self):
+        self.links = []
+        self.done_urls = []
+        self.saved = collections.Counter()
+        self.size = 0
+    
+    def add_many(self, urls, depth, root, kind='page', referrer=None):
+        '''Collect the links `urls` found at `depth` under the URI resource `root`.'''
+        if urls:
+            self.links.append([list(urls), depth, root, kind, referrer])
+            self.size += len(urls)
+        return len(urls)
+    
+    def done(self, url):
+        '''Collect that the item `url` is done.'''
+        self.done_urls.append(url)
+        self.size += 1
+    
+    def take(self):
+        '''Return the collected links, done items, and saved counts, and start over.'''
+        taken = {'links': self.links, 'done': self.done_urls, 'saved': dict(self.saved)}
+        self.links = []
+        self.done_urls = []
+        self.saved = collections.Counter()
+        self.size = 0
+        return taken
+
+
+class CrawlWorker:
+    """Worker of a distributed crawl, crawling the items leased from a `Coordinator`."""
+    
+    connect_attempts = 10
+    flush_interval = 0.25
+    flush_size = 256
+    
+    def __init__(self, scraper, address):
+        self.scraper = scraper
+        self.host, self.port = address
+        self.reader = None
+        self.writer = None
+        self.lock = None
+        self.frontier = RemoteFrontier()
+        self.queue = None
+        self.wanted = None
+        self.reported = collections.Counter()
+    
+    async def connect(self):
+        '''Connect to the coordinator, retrying for a while in case it is still starting.'''
+        for attempt in range(self.connect_attempts):
+            try:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port,
+                                                                         limit=MAX_LINE)
+                return
+            except OSError:
+                if attempt == self.connect_attempts - 1:
+                    raise
+                await asyncio.sleep(1.0)
+    
+    async def request(self, message):
+        '''Send the request `message` to the coordinator and return its reply.'''
+        async with self.lock:
+            await send(self.writer, message)
+            reply = await receive(self.reader)
+        if reply.get('type') == 'error':
+            raise ConnectionError(reply.get('error'))
+        return reply
+    
+    def results(self):
+        '''Return the results collected since they were last sent, with the result counts.'''
+        taken = self.frontier.take()
+        counts = collections.Counter(self.scraper.results.counts)
+        taken['counts'] = dict(counts - self.reported)
+        self.reported = counts
+        return taken
+    
+    async def run(self):
+        '''Crawl the items leased from the coordinator until it reports the end of the crawl.'''
+        await self.connect()
+        self.lock = asyncio.Lock()
+        try:
+            welcome = await self.request({'type': 'hello', 'worker': '{}:{}'.format(
+                socket.gethostname(), os.getpid())})
+            # Delays and limits are applied by the coordinator, as it hands out the items.
+            self.scraper.options.update(welcome['options'], sleep=None, wait=None, limit=None)
+            async with self.scraper.engine():
+                self.scraper.crawl_changed = asyncio.Condition()
+                await self.crawl(welcome['heartbeat'])
+        finally:
+            self.writer.close()
+    
+    async def crawl(self, heartbeat):
+        '''Run a crawler per download slot on the leased items, until the crawl is over. Raises
+        the error of the first of them that fails, such as when the coordinator is lost.
+        '''
+        size = self.scraper.fetcher.num_resources
+        self.queue = asyncio.Queue()
+        self.wanted = asyncio.Event()
+        work = [asyncio.ensure_future(self.feed(size))]
+        work.extend(asyncio.ensure_future(self.crawler()) for _ in range(size))
+        pending = set(work)
+        pending.add(asyncio.ensure_future(self.send_heartbeats(heartbeat)))
+        pending.add(asyncio.ensure_future(self.send_results()))
+        try:
+            while not all(task.done() for task in work):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                errors = [task.exception() for task in done if task.exception() is not None]
+                if errors:
+                    raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def feed(self, size):
+        '''Lease items into the queue, keeping `size` items ahead of the crawlers, until the
+        coordinator reports the end of the crawl. Then stops the crawlers.
+        '''
+        while True:
+            if self.queue.qsize() >= size:
+                self.wanted.clear()
+                await self.wanted.wait()
+                continue
+            reply = await self.request(dict(self.results(), type='lease', max=size * 2))
+            if reply['type'] == 'done':
+                break
+            if reply['type'] == 'wait':
+                await asyncio.sleep(reply['delay'])
+                continue
+            for item in reply['items']:
+                self.queue.put_nowait(FrontierItem(*item))
+        for _ in range(size):
+            self.queue.put_nowait(None)
+    
+    async def crawler(self):
+        '''Crawl items off the queue until None is taken.'''
+        scraper = self.scraper
+        while True:
+            item = await self.queue.get()
+            self.wanted.set()
+            if item is None:
+                return
+            try:
+                if item.kind == IMAGE:
+                    path = await scraper.download(item.url, referrer=item.referrer,
+                                                  root=item.root)
+                    if path is not None:
+                        self.frontier.saved[item.root] += 1
+                else:
+                    await scraper.crawl_item(self.frontier, item)
+            except Exception:
+                self.frontier.done(item.url)
+                raise
+            # An item cancelled partway is not reported done, so its lease expires and the
+            # coordinator hands it out again.
+            self.frontier.done(item.url)
+            # Links are sent as soon as a page is done, since idle workers may be waiting on them.
+            if self.frontier.size >= self.flush_size or (item.kind != IMAGE and
+                                                         self.frontier.links):
+                await self.request(dict(self.results(), type='results'))
+    
+    async def send_heartbeats(self, interval):
+        '''Coroutine that renews the leases every `interval` seconds until cancelled.'''
+        while True:
+            await asyncio.sleep(interval)
+            await self.request({'type': 'heartbeat'})
+    
+    async def send_results(self):
+        '''Coroutine that sends the collected results every `flush_interval` seconds, so that
+        the links found reach the other workers early, until cancelled.
+        '''
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.frontier.size:
+                await self.request(dict(self.results(), type='results'))
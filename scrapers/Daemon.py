@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+
+'''Daemon implements option --daemon: a long-running process that serves scrape jobs, so that a
+job runner submitting many small scrapes does not pay for the start of a new interpreter, the
+imports, and cold connection pools on every one of them. It listens on a Unix socket, or serves
+HTTP on a local TCP port, and speaks the same minimal HTTP/1.1 on both:
+
+    POST /jobs    Run a job, given as a JSON object such as
+                  {"scraper": "generic", "args": ["-dd", "/srv/images", "https://example.com/"]}
+                  where `args` are the options and URIs of the job, as on the command line, and
+                  `scraper` defaults to the scraper the daemon was started with. The reply streams
+                  JSON lines as the job runs: `accepted`, `started` once one of the `max_jobs`
+                  job slots is free, a `message` per line the scraper writes, a `result` per
+                  resource, then `done` with the result counts, or `error`. Closing the connection
+                  cancels the job. A job with invalid options is rejected with a 400 reply.
+    GET /status   The jobs running and served, and the idle connections kept warm.
+
+Every job is parsed by its own scraper with the option schema of `TemplateScraper`, and runs on
+the event loop of the daemon, next to the other jobs. The jobs share one `ConnectionPool` per
+client certificate, and the `NameIndex`, `DedupStore`, and `Metadata` of the directories given
+with options -dd and -od, which stay open between jobs. Relative paths are relative to the
+working directory of the daemon. Options -b, --coordinator, --daemon, --worker, and --profile are
+not available to jobs, and options -ol and -lj do not apply to them.
+
+Anyone who can connect to the daemon runs jobs with its permissions, so the Unix socket is only
+accessible to its owner, and the HTTP port listens on 127.0.0.1 unless given another host.
+
+   usage:
+       $ python scraper.py generic --daemon /tmp/scraper.sock
+       $ python -m scrapers.Daemon /tmp/scraper.sock generic -dd images https://example.com/
+       $ curl --unix-socket /tmp/scraper.sock http://localhost/jobs \\
+              -d '{"args": ["-dd", "images", "https://example.com/"]}'
+'''
+
+import asyncio
+import collections
+import errno
+import itertools
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+import time
+from urllib.parse import urlsplit
+
+try:
+    from scrapers.Coordinator import parse_address
+    from scrapers.DedupStore import DedupStore
+    from scrapers.Fetcher import create_pool
+    from scrapers.FilenameTemplate import NameIndex
+    from scrapers.Logger import format_args
+    from scrapers.Metadata import Metadata
+    from scrapers.ResultSink import Result, format_text
+    from scrapers.Scraper import load_scraper
+    from scrapers.ScraperDriver import ScraperDriver
+except ImportError:
+    from Coordinator import parse_address
+    from DedupStore import DedupStore
+    from Fetcher import create_pool
+    from FilenameTemplate import NameIndex
+    from Logger import format_args
+    from Metadata import Metadata
+    from ResultSink import Result, format_text
+    from Scraper import load_scraper
+    from ScraperDriver import ScraperDriver
+
+
+UNIX = 'unix'
+TCP = 'tcp'
+
+MAX_BODY = 2 ** 20
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               411: 'Length Required', 413: 'Payload Too Large', 431: 'Header Too Large',
+               503: 'Service Unavailable'}
+
+# Options of a job that would act on the whole daemon, with the flag they are reported by.
+DAEMON_OPTIONS = (('batch', '-b'), ('coordinator', '--coordinator'), ('daemon', '--daemon'),
+                  ('profile', '--profile'), ('worker', '--worker'))
+
+
+class JobError(Exception):
+    """Raised for a job that can not be run, such as one with invalid options."""
+
+
+class RequestError(Exception):
+    """Raised for an HTTP request that can not be served, with the status to reply with."""
+    
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_daemon_address(value):
+    '''Parse the address of option --daemon: [HOST:]PORT to serve HTTP over TCP, or else the path
+    of a Unix socket. Returns a (kind, address) tuple, where kind is UNIX or TCP, and a TCP
+    address is a (host, port) tuple. Raises ValueError for an invalid address.
+    '''
+    if not value:
+        raise ValueError('Invalid address: {!r}'.format(value))
+    try:
+        return TCP, parse_address(value)
+    except ValueError:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise
+    return UNIX, value
+
+
+def check_socket(path):
+    '''Remove the Unix socket left at `path` by a daemon that is gone. Raises OSError if another
+    daemon is still listening on it, or if `path` is not a socket.
+    '''
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, 'Not a socket', path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+            return
+    raise OSError(errno.EADDRINUSE, 'Another daemon is listening', path)
+
+
+async def read_request(reader, writer):
+    '''Read an HTTP request from the stream `reader`, answering `Expect: 100-continue` on
+    `writer`. Returns a (method, path, headers, body) tuple. Raises RequestError for a request
+    that can not be served, and asyncio.IncompleteReadError if the client hangs up.
+    '''
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise RequestError(431, 'Request header too large')
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ')
+    except ValueError:
+        raise RequestError(400, 'Malformed request line: {!r}'.format(lines[0][:80]))
+    headers = {}
+    for line in lines[1:]:
+        name, separator, value = line.partition(':')
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    body = b''
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise RequestError(411, 'A Content-Length is required')
+    if headers.get('content-length'):
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise RequestError(400, 'Invalid Content-Length')
+        if length > MAX_BODY:
+            raise RequestError(413, 'Request body larger than {} bytes'.format(MAX_BODY))
+        if headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        body = await reader.readexactly(length)
+    return method.upper(), urlsplit(target).path, headers, body
+
+
+def response_head(status, content_type='application/json', length=None):
+    '''Return the status line and headers of a reply. The connection is closed after every reply,
+    which ends a streamed body of unknown `length`.
+    '''
+    lines = ['HTTP/1.1 {} {}'.format(status, STATUS_TEXT.get(status, '')),
+             'Content-Type: {}'.format(content_type),
+             'Cache-Control: no-store',
+             'Connection: close']
+    if length is not None:
+        lines.append('Content-Length: {}'.format(length))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def respond(writer, status, payload):
+    '''Reply to a request with `status` and the JSON object `payload`.'''
+    body = json.dumps(payload).encode('utf-8') + b'\n'
+    writer.write(response_head(status, length=len(body)) + body)
+    await writer.drain()
+
+
+class Job:
+    """A scrape job of the daemon, streaming the messages and results of its scraper to the
+    client. Also the result target of the scraper.
+    """
+    
+    def __init__(self, number, writer):
+        self.number = number
+        self.writer = writer
+        self.started = time.monotonic()
+        self.help = None
+    
+    def attach(self, parser):
+        '''Make `parser`, the argument parser of the scraper of the job, raise JobError with its
+        help or errors, instead of printing them and exiting the daemon.
+        '''
+        def print_help(file=None):  # pylint: disable=unused-argument
+            self.help = parser.format_help()
+        
+        parser.print_help = print_help
+        parser.error = self.fail
+        parser.exit = self.exit
+    
+    @staticmethod
+    def fail(message):
+        '''Stand-in for `ArgumentParser.error()`.'''
+        raise JobError(message)
+    
+    def exit(self, status=0, message=None):
+        '''Stand-in for `ArgumentParser.exit()`.'''
+        raise JobError(self.help or message or 'exited with status {}'.format(status))
+    
+    def send(self, event):
+        '''Stream the dict `event` to the client as a JSON line, unless the client is gone.'''
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(event, default=str).encode('utf-8') + b'\n')
+    
+    def message(self, args):
+        '''Stream the message made of `args`, written by the scraper.'''
+        self.send({'type': 'message', 'job': self.number, 'message': format_args(args)})
+    
+    def write_batch(self, results):
+        '''Stream `results`, flushed by the `ResultSink` of the scraper.'''
+        for result in results:
+            self.send(dict(result._asdict(), type='result', job=self.number))
+    
+    def close(self):
+        '''Nothing to close; the connection is closed by the daemon once the job is over.'''
+
+
+class SharedResources:
+    """Connection pools and per-directory files kept open between the jobs of a daemon."""
+    
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self.pools = {}
+        self.names = {}
+        self.stores = {}
+        self.metadata = {}
+    
+    def get_pool(self, cert_file=None, http2=False):
+        '''Return the `ConnectionPool` of the jobs with the client certificate `cert_file`, and
+        option --http2 set or not.
+        '''
+        key = (cert_file, http2)
+        if key not in self.pools:
+            self.pools[key] = create_pool(cert_file, self.timeout, http2)
+        return self.pools[key]
+    
+    def get_names(self, directory):
+        '''Return the `NameIndex` of the data directory `directory`.'''
+        key = os.path.realpath(directory)
+        if key not in self.names:
+            self.names[key] = NameIndex(directory)
+        return self.names[key]
+    
+    def get_store(self, directory):
+        '''Return the `DedupStore` of the data directory `directory`.'''
+        key = os.path.realpath(directory)
+        if key not in self.stores:
+            self.stores[key] = DedupStore(directory)
+        return self.stores[key]
+    
+    def get_metadata(self, path):
+        '''Return the `Metadata` file at `path`.'''
+        key = os.path.realpath(path)
+        if key not in self.metadata:
+            self.metadata[key] = Metadata(path)
+        return self.metadata[key]
+    
+    def holds(self, resource):
+        '''Return True if `resource` is a store or metadata file kept open by the daemon.'''
+        return any(resource is held for held in itertools.chain(self.stores.values(),
+                                                                 self.metadata.values()))
+    
+    def idle_connections(self):
+        '''Return the number of idle connections kept in the pools, counting the multiplexed
+        connections that carry no stream.
+        '''
+        return sum(len(connections) for pool in self.pools.values()
+                   for connections in pool.idle.values()) + \
+            sum(not connection.streams for pool in self.pools.values()
+                for connection in pool.multiplexed.values())
+    
+    def prune(self):
+        '''Close the idle connections that have timed out.'''
+        for pool in self.pools.values():
+            pool.prune()
+    
+    def close(self):
+        '''Close every pool, store, and metadata file.'''
+        for resource in itertools.chain(self.pools.values(), self.stores.values(),
+                                        self.metadata.values()):
+            resource.close()
+        self.pools = {}
+        self.stores = {}
+        self.metadata = {}
+
+
+class Daemon:
+    """Server of scrape jobs over a Unix socket or local HTTP, sharing warm resources."""
+    
+    max_jobs = 16
+    prune_interval = 10.0
+    
+    def __init__(self, scraper, address):
+        self.scraper = scraper
+        self.kind, self.address = address
+        self.shared = SharedResources()
+        self.server = None
+        self.slots = None
+        self.stopping = None
+        self.sequence = itertools.count(1)
+        self.jobs = {}
+        self.connections = {}
+        self.counts = collections.Counter()
+        self.started = time.monotonic()
+    
+    async def run(self):
+        '''Serve jobs until the daemon is stopped by an interrupt or SIGTERM. The jobs running
+        then are left to finish, unless the daemon is stopped again.
+        '''
+        loop = asyncio.get_running_loop()
+        self.slots = asyncio.Semaphore(self.max_jobs)
+        self.stopping = asyncio.Event()
+        signals = []
+        pruner = None
+        try:
+            if self.kind == UNIX:
+                check_socket(self.address)
+                self.server = await asyncio.start_unix_server(self.serve, self.address)
+                os.chmod(self.address, 0o600)
+                where = self.address
+            else:
+                self.server = await asyncio.start_server(self.serve, *self.address)
+                where = 'http://{}:{}/'.format(*self.server.sockets[0].getsockname()[:2])
+            for number in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(number, self.stop)
+                    signals.append(number)
+                except (NotImplementedError, RuntimeError):
+                    pass
+            self.scraper.write('Daemon listening on {}'.format(where))
+            pruner = asyncio.ensure_future(self.prune())
+            await self.stopping.wait()
+            self.server.close()
+            while self.jobs:
+                await asyncio.wait(list(self.jobs.values()))
+        finally:
+            for number in signals:
+                loop.remove_signal_handler(number)
+            if pruner is not None:
+                pruner.cancel()
+            for task in self.jobs.values():
+                task.cancel()
+            await asyncio.gather(*self.jobs.values(), return_exceptions=True)
+            if self.server is not None:
+                self.server.close()
+                # Clients still connected are dropped rather than waited for.
+                handlers = list(self.connections.values())
+                for writer in list(self.connections):
+                    writer.transport.abort()
+                await asyncio.gather(*handlers, return_exceptions=True)
+                await self.server.wait_closed()
+                if self.kind == UNIX and os.path.exists(self.address):
+                    os.unlink(self.address)
+            self.shared.close()
+    
+    def stop(self):
+        '''Stop accepting jobs, letting the running ones finish. When called again, cancel them.'''
+        if self.stopping.is_set():
+            for task in self.jobs.values():
+                task.cancel()
+            return
+        self.stopping.set()
+        if self.jobs:
+            self.scraper.write('Daemon stopping after {} running jobs; interrupt again to cancel '
+                               'them'.format(len(self.jobs)))
+    
+    async def prune(self):
+        '''Coroutine that closes the idle connections that timed out, until cancelled.'''
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            self.shared.prune()
+    
+    async def serve(self, reader, writer):
+        '''Answer the HTTP request of a client, then close the connection.'''
+        self.connections[writer] = asyncio.current_task()
+        try:
+            method, path, _, body = await read_request(reader, writer)
+            if path == '/jobs' and method == 'POST':
+                await self.submit(reader, writer, body)
+            elif path == '/status' and method == 'GET':
+                await respond(writer, 200, self.status())
+            elif path in ('/jobs', '/status'):
+                raise RequestError(405, 'Method not allowed: {}'.format(method))
+            else:
+                raise RequestError(404, 'Not found: {}'.format(path))
+        except RequestError as error:
+            await respond(writer, error.status, {'type': 'error', 'error': str(error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+    
+    async def submit(self, reader, writer, body):
+        '''Run the job of the request `body`, streaming its progress, and cancel it if the client
+        hangs up first.
+        '''
+        if self.stopping.is_set():
+            raise RequestError(503, 'The daemon is stopping')
+        job = Job(next(self.sequence), writer)
+        try:
+            scraper = self.create_scraper(job, body)
+        except JobError as error:
+            self.counts['rejected'] += 1
+            raise RequestError(400, str(error))
+        writer.write(response_head(200, 'application/x-ndjson'))
+        job.send({'type': 'accepted', 'job': job.number})
+        task = asyncio.ensure_future(self.run_job(scraper, job))
+        self.jobs[job.number] = task
+        hangup = asyncio.ensure_future(reader.read())
+        try:
+            await asyncio.wait((task, hangup), return_when=asyncio.FIRST_COMPLETED)
+            if not task.done():
+                task.cancel()
+            await asyncio.wait((task,))
+        finally:
+            hangup.cancel()
+            self.jobs.pop(job.number, None)
+        await writer.drain()
+    
+    def create_scraper(self, job, body):
+        '''Return the scraper of `job`, with the options of the JSON request `body`. Raises
+        JobError for an invalid request.
+        '''
+        try:
+            request = json.loads(body)
+        except ValueError as error:
+            raise JobError('Invalid JSON: {}'.format(error))
+        if not isinstance(request, dict):
+            raise JobError('Expected a JSON object')
+        name = request.get('scraper') or self.scraper.name
+        args = request.get('args') or []
+        if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+            raise JobError('Expected "args" to be a list of strings')
+        try:
+            scraper_class = load_scraper(name)
+        except KeyError:
+            raise JobError('Unknown scraper: {!r}'.format(name))
+        driver = ScraperDriver(self.scraper.args[0], name, *args, job=job, shared=self.shared)
+        scraper = scraper_class(driver)
+        for option, flag in DAEMON_OPTIONS:
+            if scraper.options.get(option):
+                raise JobError('option {} is not available to daemon jobs'.format(flag))
+        if not scraper.options.get('uri'):
+            raise JobError('the following arguments are required: URI')
+        return scraper
+    
+    async def run_job(self, scraper, job):
+        '''Run `job` with `scraper` once a job slot is free, and stream its outcome.'''
+        try:
+            async with self.slots:
+                job.send({'type': 'started', 'job': job.number})
+                await scraper.scrape_uris([scraper.resolve_uri(uri)
+                                           for uri in scraper.options['uri']])
+        except asyncio.CancelledError:
+            self.counts['cancelled'] += 1
+            job.send({'type': 'error', 'job': job.number, 'error': 'Cancelled'})
+            raise
+        except Exception as error:  # pylint: disable=broad-except
+            self.counts['failed'] += 1
+            if not isinstance(error, JobError):
+                error = '{}: {}'.format(type(error).__name__, error)
+            job.send({'type': 'error', 'job': job.number, 'error': str(error)})
+        else:
+            self.counts['done'] += 1
+            job.send({'type': 'done', 'job': job.number, 'counts': dict(scraper.results.counts),
+                      'elapsed': time.monotonic() - job.started})
+    
+    def status(self):
+        '''Return the status of the daemon, for GET /status.'''
+        return {'type': 'status', 'uptime': time.monotonic() - self.started,
+                'running': len(self.jobs), 'max_jobs': self.max_jobs, 'jobs': dict(self.counts),
+                'idle_connections': self.shared.idle_connections()}
+    
+    def summary(self):
+        '''Return the lines of the report of the jobs served.'''
+        results = ', '.join('{} {}'.format(outcome, count)
+                            for outcome, count in sorted(self.counts.items()))
+        return ['Daemon: {} jobs in {:.1f}s: {}'.format(sum(self.counts.values()),
+                                                         time.monotonic() - self.started,
+                                                         results or 'no jobs')]
+
+
+def submit(address, args, scraper=None):
+    '''Submit a job with the options and URIs `args` to the daemon listening on `address`, as
+    returned by `parse_daemon_address()`, to be run by the scraper named `scraper`, or by the
+    scraper of the daemon. Yields every event streamed back, as a dict. Raises OSError if the
+    daemon can not be reached, and JobError if it rejects the job.
+    '''
+    kind, where = address
+    if kind == UNIX:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(where)
+    else:
+        connection = socket.create_connection(where)
+    body = json.dumps({'scraper': scraper, 'args': list(args)}).encode('utf-8')
+    with connection, connection.makefile('rb') as stream:
+        connection.sendall('POST /jobs HTTP/1.1\r\nHost: localhost\r\n'
+                           'Content-Type: application/json\r\nContent-Length: {}\r\n'
+                           'Connection: close\r\n\r\n'.format(len(body)).encode('latin-1') + body)
+        status = stream.readline().split(None, 2)
+        while stream.readline() not in (b'\r\n', b'\n', b''):
+            pass
+        if len(status) < 2 or status[1] != b'200':
+            try:
+                error = json.loads(stream.read()).get('error')
+            except ValueError:
+                error = None
+            raise JobError(error or 'The daemon replied {}'.format(b' '.join(status[1:])))
+        for line in stream:
+            yield json.loads(line)
+
+
+def main(argv=None):
+    '''Submit the job given on the command line, as ADDRESS SCRAPER [OPTIONS] URI [URI ...], and
+    print its messages and results as they come. Returns the exit status: 0 once the job is done.
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] in ('-h', '--help'):
+        print('usage: python -m scrapers.Daemon ADDRESS SCRAPER [OPTIONS] URI [URI ...]',
+              file=sys.stderr)
+        return 2
+    try:
+        for event in submit(parse_daemon_address(argv[0]), argv[2:], scraper=argv[1]):
+            if event['type'] == 'message':
+                print(event['message'], flush=True)
+            elif event['type'] == 'result':
+                print(format_text(Result(*(event.get(field) for field in Result._fields))),
+                      flush=True)
+            elif event['type'] == 'error':
+                print('Error: {}'.format(event['error']), file=sys.stderr)
+                return 1
+            elif event['type'] == 'done':
+                return 0
+    except (OSError, ValueError, JobError) as error:
+        print('Error: {}'.format(error), file=sys.stderr)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
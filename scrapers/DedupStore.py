@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+'''DedupStore is the content-addressed store kept inside the data directory. Bodies are hashed
+while they stream to their `.part` file and kept once per SHA-256 digest under `.objects`; every
+filename a scraper saves is then a reflink or hardlink to that single copy. A persistent index of
+digests and of the URLs they were fetched from, with the validators of those responses, lets later
+runs skip bodies they already hold.
+
+   usage:
+       >>> from scrapers.DedupStore import DedupStore
+       >>> from scrapers.PartFile import PartFile
+       >>> store = DedupStore('images')
+       >>> part = PartFile('images', url)
+       >>> part.open(response)
+       >>> part.write(b'...')
+       >>> digest = part.close()
+       >>> store.adopt(part.path, digest, part.offset)
+       >>> part.remove_sidecar()
+       >>> store.record(url, digest, part.validator)
+       >>> store.link(digest, 'images/img.png')
+'''
+
+import os
+import shutil
+import sqlite3
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+FICLONE = 0x40049409
+
+
+class DedupStore:
+    """Content-addressed store of resource bodies, one copy per digest."""
+    
+    def __init__(self, data_dir):
+        self.root = os.path.join(data_dir, '.objects')
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.reflink = fcntl is not None
+        self.hardlink = True
+        self.umask = os.umask(0)
+        os.umask(self.umask)
+        self.db = sqlite3.connect(os.path.join(self.root, 'index.sqlite'))
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS objects '
+                        '(digest TEXT PRIMARY KEY, size INTEGER NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS urls '
+                        '(url TEXT PRIMARY KEY, digest TEXT NOT NULL, validator TEXT)')
+        try:
+            # Indexes written before validators were recorded lack the column; their URLs are
+            # never matched until fetched again.
+            self.db.execute('ALTER TABLE urls ADD COLUMN validator TEXT')
+        except sqlite3.OperationalError:
+            pass
+        self.db.commit()
+    
+    def object_path(self, digest):
+        '''Return the path of the object with `digest`.'''
+        return os.path.join(self.root, digest[:2], digest[2:])
+    
+    def adopt(self, path, digest, size):
+        '''Move the complete file at `path`, of `size` bytes hashing to `digest`, into the store,
+        unless an object with the same digest is already held, in which case the file is
+        dropped. `path` must be on the filesystem of the data directory.
+        '''
+        object_path = self.object_path(digest)
+        if os.path.exists(object_path):
+            os.unlink(path)
+        else:
+            os.chmod(path, 0o666 & ~self.umask)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(path, object_path)
+        self.add_object(digest, size)
+    
+    def add_object(self, digest, size):
+        '''Record that the store holds an object.'''
+        self.db.execute('INSERT OR IGNORE INTO objects VALUES (?, ?)', (digest, size))
+    
+    def record(self, url, digest, validator=None):
+        '''Record that the body of `url` has `digest`, as sent with `validator`, the strong ETag
+        or the Last-Modified date of the response.
+        '''
+        self.db.execute('INSERT OR REPLACE INTO urls (url, digest, validator) VALUES (?, ?, ?)',
+                        (url, digest, validator))
+        self.db.commit()
+    
+    def lookup(self, url, size, validator):
+        '''Return the digest of the body last fetched from `url` if the store still holds it, the
+        response had the same `validator` and its size matches `size`, else None. Without a
+        validator nothing tells a changed body of the same size apart, so None is returned.
+        '''
+        if not validator or size is None:
+            return None
+        row = self.db.execute('SELECT objects.digest, objects.size, urls.validator FROM urls '
+                              'JOIN objects ON urls.digest = objects.digest WHERE urls.url = ?',
+                              (url,)).fetchone()
+        if row is None or row[1] != size or row[2] != validator:
+            return None
+        if not os.path.exists(self.object_path(row[0])):
+            return None
+        return row[0]
+    
+    def link(self, digest, path):
+        '''Place the object with `digest` at `path`, replacing the empty file that reserved the
+        name if there is one: as a reflink when the filesystem supports it, else as a hardlink,
+        else as a plain copy.
+        '''
+        source = self.object_path(digest)
+        if self.reflink:
+            try:
+                with open(source, 'rb') as src, open(path, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                self.reflink = False
+        if self.hardlink:
+            tmp_path = os.path.join(self.tmp_dir, '{}-{}.link'.format(os.getpid(), digest))
+            try:
+                os.link(source, tmp_path)
+                os.replace(tmp_path, path)
+                return
+            except OSError:
+                if os.path.lexists(tmp_path):
+                    os.unlink(tmp_path)
+                self.hardlink = False
+        shutil.copyfile(source, path)
+    
+    def close(self):
+        '''Commit and close the index.'''
+        self.db.commit()
+        self.db.close()
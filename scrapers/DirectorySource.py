@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+'''DirectorySource scrapes images out of a local (or network mounted) directory tree. Directories
+are listed with `os.scandir` on a pool of threads, so that many listings are in flight at once on
+slow filesystems, and the stat result of each entry is taken once and reused. Filenames are
+filtered while listing, before any file is stat'ed or opened. Files are copied by the kernel: as a
+reflink where the filesystem supports it, else with `copy_file_range` or `sendfile`, so their
+bytes never pass through userspace buffers. A method found unsupported is given up on for that
+pair of devices only. Each copy is written to a `.part` file beside its destination and renamed
+into place once complete, so that a saved name never holds a truncated file.
+
+   usage:
+       >>> from scrapers.DirectorySource import DirectorySource
+       >>> source = DirectorySource(workers=8, accept_name=lambda name: name.endswith('.png'))
+       >>> async for files in source.walk('/usr/share/icons'):
+       >>>     for path, stat in files:
+       >>>         await source.run(source.copy, path, 'images/copy.png', stat.st_size)
+       >>> source.close()
+'''
+
+import asyncio
+import collections
+import errno
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+FICLONE = 0x40049409
+
+UNSUPPORTED = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY,
+               errno.EBADF)
+
+
+class DirectorySource:
+    """Parallel directory walker and kernel-side file copier."""
+    
+    def __init__(self, workers=8, accept_name=None):
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix='scraper-dir')
+        self.accept_name = accept_name
+        self.reflink = fcntl is not None
+        self.copy_range = hasattr(os, 'copy_file_range')
+        self.sendfile = hasattr(os, 'sendfile')
+        self.unsupported = {}
+    
+    async def run(self, function, *args):
+        '''Run `function(*args)` on the thread pool of the source and return its result.'''
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+    
+    async def walk(self, root, recursive=True):
+        '''Asynchronously iterate over the files under `root`, yielding a list of (path, stat)
+        tuples per directory listed. Up to `workers` directories are listed at once; the others
+        wait their turn, so that nothing more is listed once the iterator is closed early.
+        '''
+        loop = asyncio.get_running_loop()
+        directories = collections.deque([root])
+        pending = set()
+        try:
+            while directories or pending:
+                while directories and len(pending) < self.workers:
+                    pending.add(loop.run_in_executor(self.executor, self.scan,
+                                                     directories.popleft()))
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    files, found = future.result()
+                    if recursive:
+                        directories.extend(found)
+                    if files:
+                        yield files
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    def scan(self, directory):
+        '''List `directory`. Returns the (path, stat) tuples of the files whose names pass
+        `accept_name`, and the paths of the subdirectories. Symbolic links to directories are not
+        followed, and unreadable directories are skipped.
+        '''
+        files = []
+        directories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        elif (self.accept_name is None or self.accept_name(entry.name)) and \
+                                entry.is_file():
+                            files.append((entry.path, entry.stat()))
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return files, directories
+    
+    @staticmethod
+    def read_head(path, probe):
+        '''Feed the leading bytes of the file at `path` to the `ImageProbe` `probe` until it can
+        decide. Returns `probe.accepted`.
+        '''
+        with open(path, 'rb', buffering=0) as fd:
+            while True:
+                data = fd.read(16384)
+                if not data:
+                    probe.finish()
+                    break
+                if probe.feed(data):
+                    break
+        return probe.accepted
+    
+    def copy(self, source, path, size):
+        '''Copy the file at `source` to `path`, which should already exist (and be empty) so that
+        its name is reserved. The copy is written to a `.part` file in the same directory, then
+        renamed over `path`, taking on its permissions. The part is removed if the copy fails.
+        '''
+        directory, name = os.path.split(path)
+        prefix = name.encode('utf-8')[:64].decode('utf-8', 'ignore') + '.'
+        fd, tmp_path = tempfile.mkstemp(suffix='.part', prefix=prefix, dir=directory)
+        try:
+            with open(source, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                self.copy_data(src, dst, size)
+            try:
+                os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    def copy_data(self, src, dst, size):
+        '''Copy the `size` bytes of the open file `src` to the empty open file `dst`, trying a
+        reflink, then `copy_file_range`, then `sendfile`. A method that fails as unsupported is
+        not tried again between the devices of the two files.
+        '''
+        devices = (os.fstat(src.fileno()).st_dev, os.fstat(dst.fileno()).st_dev)
+        unsupported = self.unsupported.setdefault(devices, set())
+        if self.reflink and 'reflink' not in unsupported:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError as error:
+                if error.errno not in UNSUPPORTED:
+                    raise
+                unsupported.add('reflink')
+        offset = 0
+        if self.copy_range and 'copy_range' not in unsupported:
+            try:
+                while offset < size:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), size - offset)
+                    if not copied:
+                        return
+                    offset += copied
+                return
+            except OSError as error:
+                if error.errno not in UNSUPPORTED or offset:
+                    raise
+                unsupported.add('copy_range')
+        if self.sendfile and 'sendfile' not in unsupported:
+            try:
+                while offset < size:
+                    sent = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                    if not sent:
+                        return
+                    offset += sent
+                return
+            except OSError as error:
+                if error.errno not in UNSUPPORTED or offset:
+                    raise
+                unsupported.add('sendfile')
+        shutil.copyfileobj(src, dst)
+    
+    def close(self):
+        '''Shut the thread pool down.'''
+        self.executor.shutdown()
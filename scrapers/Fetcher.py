@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+
+'''Fetcher is the asyncio download engine shared by every scraper. It speaks HTTP/1.1 over
+keep-alive connections that are pooled per host, so hundreds of resources may be in flight at once
+without paying for a new TCP (and TLS) handshake on every request. With `http2`, TLS connections
+offer HTTP/2, and hosts that accept it get all of their requests multiplexed over one connection;
+see the module Http2.
+
+   usage:
+       >>> from scrapers.Fetcher import Fetcher
+       >>> fetcher = Fetcher(num_resources=10)
+       >>> async def main():
+       >>>     async with fetcher.slot:
+       >>>         response = await fetcher.get('http://example.com/')
+       >>>         body = await response.read()
+       >>>     await fetcher.close()
+'''
+
+import asyncio
+import ssl
+import time
+from urllib.parse import urljoin, urlsplit
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class FetchError(Exception):
+    """Raised when a resource cannot be fetched."""
+
+
+class Connection:
+    """A single keep-alive connection to a host."""
+    
+    multiplexed = False
+    
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.requests = 0
+        self.idle_since = time.monotonic()
+    
+    @property
+    def closed(self):
+        '''True if this connection can no longer be used.'''
+        return self.writer.is_closing() or self.reader.at_eof()
+    
+    def close(self):
+        '''Close the underlying transport.'''
+        self.writer.close()
+
+
+class ConnectionPool:
+    """Pool of idle keep-alive connections, keyed on (scheme, host, port). With `http2`, TLS
+    connections offer HTTP/2 with ALPN, and the connection to a host that accepts it is kept in
+    `multiplexed` and shared by every request to that host.
+    """
+    
+    idle_timeout = 30.0
+    
+    def __init__(self, ssl_context=None, timeout=None, http2=False):
+        if http2:
+            ssl_context = ssl_context or ssl.create_default_context()
+            ssl_context.set_alpn_protocols(['h2', 'http/1.1'])
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self.http2 = http2
+        self.idle = {}
+        self.multiplexed = {}
+        # Futures of the first connections to hosts not known to speak HTTP/2 or not yet.
+        self.negotiating = {}
+        self.http1 = set()
+    
+    async def acquire(self, scheme, host, port):
+        '''Return the multiplexed connection to the host, an idle connection to it, or a new
+        one. The second item of the returned tuple is True when the connection was already open.
+        While the first TLS connection to a host negotiates its protocol, other requests to the
+        host wait for it rather than opening connections of their own.
+        '''
+        key = (scheme, host, port)
+        connection = self.multiplexed.get(key)
+        if connection is not None and not connection.closed:
+            return connection, True
+        negotiating = self.negotiating.get(key)
+        if negotiating is not None:
+            connection = await asyncio.shield(negotiating)
+            if connection is not None:
+                return connection, True
+        idle = self.idle.get(key)
+        now = time.monotonic()
+        while idle:
+            connection = idle.pop()
+            if not connection.closed and now - connection.idle_since < self.idle_timeout:
+                return connection, True
+            connection.close()
+        if not self.http2 or scheme != 'https' or key in self.http1 or key in self.negotiating:
+            return await self.open(key), False
+        negotiating = self.negotiating[key] = asyncio.get_running_loop().create_future()
+        connection = None
+        try:
+            connection = await self.open(key)
+        finally:
+            del self.negotiating[key]
+            negotiating.set_result(connection if connection is not None and
+                                   connection.multiplexed else None)
+        return connection, False
+    
+    async def open(self, key):
+        '''Open a new connection to the host of `key`. A TLS connection that negotiated h2 is
+        returned as an `Http2Connection`, and kept as the multiplexed connection to the host.
+        '''
+        scheme, host, port = key
+        if scheme == 'https':
+            context = self.ssl_context or ssl.create_default_context()
+            opening = asyncio.open_connection(host, port, ssl=context, server_hostname=host)
+        else:
+            opening = asyncio.open_connection(host, port)
+        try:
+            reader, writer = await asyncio.wait_for(opening, self.timeout)
+        except (OSError, asyncio.TimeoutError) as error:
+            raise FetchError('Could not connect to {}:{}: {!r}'.format(host, port, error))
+        ssl_object = writer.get_extra_info('ssl_object')
+        if self.http2 and ssl_object is not None:
+            if ssl_object.selected_alpn_protocol() == 'h2':
+                try:
+                    from scrapers.Http2 import Http2Connection
+                except ImportError:
+                    from Http2 import Http2Connection
+                connection = self.multiplexed[key] = Http2Connection(key, reader, writer)
+                self.http1.discard(key)
+                return connection
+            self.http1.add(key)
+        return Connection(key, reader, writer)
+    
+    def release(self, connection):
+        '''Hand a connection whose response was fully read back to the pool.'''
+        if connection.closed:
+            connection.close()
+            return
+        connection.idle_since = time.monotonic()
+        self.idle.setdefault(connection.key, []).append(connection)
+    
+    def prune(self):
+        '''Close the idle connections that have timed out or were closed by their host, and the
+        multiplexed connections that carried no stream for as long.
+        '''
+        now = time.monotonic()
+        for key, connection in list(self.multiplexed.items()):
+            if connection.closed or not connection.streams and \
+                    now - connection.idle_since >= self.idle_timeout:
+                if not connection.streams:
+                    connection.close()
+                del self.multiplexed[key]
+        for key, connections in list(self.idle.items()):
+            alive = []
+            for connection in connections:
+                if connection.closed or now - connection.idle_since >= self.idle_timeout:
+                    connection.close()
+                else:
+                    alive.append(connection)
+            if alive:
+                self.idle[key] = alive
+            else:
+                del self.idle[key]
+    
+    def close(self):
+        '''Close every idle and multiplexed connection.'''
+        for connections in self.idle.values():
+            for connection in connections:
+                connection.close()
+        for connection in self.multiplexed.values():
+            connection.close()
+        self.idle = {}
+        self.multiplexed = {}
+
+
+def create_pool(cert_file=None, timeout=None, http2=False):
+    '''Return a new `ConnectionPool`, presenting the client certificate in `cert_file`, if given,
+    on TLS connections, and offering HTTP/2 on them with `http2`.
+    '''
+    ssl_context = None
+    if cert_file:
+        ssl_context = ssl.create_default_context()
+        ssl_context.load_cert_chain(cert_file)
+    return ConnectionPool(ssl_context=ssl_context, timeout=timeout, http2=http2)
+
+
+class Response:
+    """A streamed HTTP response. The body must be consumed with `read()` or `iter_chunks()`, or
+    the response closed, so that the connection it arrived on goes back to the pool.
+    """
+    
+    def __init__(self, fetcher, connection, method, url, status, reason, headers, keep_alive):
+        self.fetcher = fetcher
+        self.connection = connection
+        self.method = method
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.keep_alive = keep_alive
+        self.done = False
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        self.chunk_left = 0
+        self.buffer = b''
+        self.received = 0
+        self.started = time.monotonic()
+        self.remaining = None
+        if not self.chunked and 'content-length' in headers:
+            try:
+                self.remaining = int(headers['content-length'])
+            except ValueError:
+                self.keep_alive = False
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            self.remaining = 0
+            self.chunked = False
+        if self.remaining == 0:
+            self.finish()
+    
+    def __repr__(self):
+        return '<Response [{}] {}>'.format(self.status, self.url)
+    
+    @property
+    def content_type(self):
+        '''The media type of the response, without parameters.'''
+        return self.headers.get('content-type', '').split(';', 1)[0].strip().lower()
+    
+    @property
+    def total_length(self):
+        '''The length of the whole resource: the total of the Content-Range header of a 206
+        response, else the Content-Length. None when it is not known.
+        '''
+        if self.status == 206:
+            total = self.headers.get('content-range', '').rpartition('/')[2]
+            return int(total) if total.isdigit() else None
+        return self.content_length
+    
+    @property
+    def charset(self):
+        '''The charset parameter of the Content-Type header. Default is utf-8.'''
+        for param in self.headers.get('content-type', '').split(';')[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'charset' and value.strip():
+                return value.strip().strip('"')
+        return 'utf-8'
+    
+    @property
+    def content_length(self):
+        '''The Content-Length header as an int, or None when it was not sent.'''
+        try:
+            return int(self.headers['content-length'])
+        except (KeyError, ValueError):
+            return None
+    
+    def finish(self):
+        '''Mark the body as fully read and release the connection.'''
+        if self.done:
+            return
+        self.done = True
+        if self.fetcher.metrics is not None:
+            self.fetcher.record(self)
+        if self.keep_alive:
+            self.fetcher.pool.release(self.connection)
+        else:
+            self.connection.close()
+    
+    def close(self):
+        '''Abandon the response. If the body has not been fully read the connection is closed
+        rather than returned to the pool, which stops the rest of the body from being sent.
+        '''
+        if not self.done:
+            self.done = True
+            if self.fetcher.metrics is not None:
+                self.fetcher.record(self)
+            self.connection.close()
+    
+    async def read_chunk(self, size):
+        '''Read at most `size` bytes of the body. Returns b'' once the body is exhausted.'''
+        if self.done:
+            return b''
+        reader = self.connection.reader
+        timeout = self.fetcher.timeout
+        try:
+            if self.chunked:
+                if self.chunk_left == 0:
+                    line = await asyncio.wait_for(reader.readline(), timeout)
+                    self.chunk_left = int(line.split(b';', 1)[0].strip() or b'0', 16)
+                    if self.chunk_left == 0:
+                        while (await asyncio.wait_for(reader.readline(), timeout)) \
+                                not in (b'\r\n', b'\n', b''):
+                            pass
+                        self.finish()
+                        return b''
+                data = await asyncio.wait_for(reader.read(min(size, self.chunk_left)), timeout)
+                if not data:
+                    raise FetchError('Connection closed mid-chunk: {}'.format(self.url))
+                self.chunk_left -= len(data)
+                self.received += len(data)
+                if self.chunk_left == 0:
+                    await asyncio.wait_for(reader.readexactly(2), timeout)
+                return data
+            if self.remaining is not None:
+                data = await asyncio.wait_for(reader.read(min(size, self.remaining)), timeout)
+                if not data:
+                    raise FetchError('Connection closed early: {}'.format(self.url))
+                self.remaining -= len(data)
+                self.received += len(data)
+                if self.remaining == 0:
+                    self.finish()
+                return data
+            data = await asyncio.wait_for(reader.read(size), timeout)
+            self.received += len(data)
+            if not data:
+                self.keep_alive = False
+                self.finish()
+            return data
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as error:
+            self.close()
+            raise FetchError('Error reading {}: {!r}'.format(self.url, error))
+        except FetchError:
+            self.close()
+            raise
+    
+    async def iter_chunks(self, size=None):
+        '''Asynchronously iterate over the body in chunks of at most `size` bytes, metered by the
+        rate limiter of the fetcher, if any.
+        '''
+        limiter = self.fetcher.limiter
+        size = size or self.fetcher.chunk_size
+        if limiter is not None:
+            size = limiter.chunk_size(size)
+        if self.buffer:
+            chunk, self.buffer = self.buffer, b''
+            yield chunk
+        while True:
+            chunk = await self.read_chunk(size)
+            if not chunk:
+                return
+            if limiter is not None:
+                await limiter.consume(self.connection.key[1], len(chunk))
+            yield chunk
+    
+    async def peek(self, size):
+        '''Return up to `size` leading bytes of the rest of the body without consuming them; they
+        are yielded again by `iter_chunks()`.
+        '''
+        while len(self.buffer) < size:
+            chunk = await self.read_chunk(size - len(self.buffer))
+            if not chunk:
+                break
+            self.buffer += chunk
+        return self.buffer[:size]
+    
+    async def read(self):
+        '''Read and return the whole body.'''
+        chunks = []
+        async for chunk in self.iter_chunks():
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+
+class Fetcher:
+    """Asyncio HTTP/1.1 client with per-host keep-alive connection pools, and HTTP/2 for the
+    hosts that accept it with `http2`."""
+    
+    chunk_size = 65536
+    max_redirects = 10
+    
+    def __init__(self, num_resources=4, user_agent='ScraperBot', timeout=60.0, cert_file=None,
+                 limiter=None, log=None, metrics=None, pool=None, http2=False):
+        self.num_resources = max(1, num_resources or 1)
+        self.limiter = limiter if limiter is not None and limiter.active else None
+        self.metrics = metrics
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.log = log or (lambda *args, **kwargs: None)
+        # A pool handed in is shared with other fetchers, and outlives this one.
+        self.owns_pool = pool is None
+        self.pool = create_pool(cert_file, timeout, http2) if pool is None else pool
+        self.ranges = {}
+        self._slot = None
+    
+    @property
+    def slot(self):
+        '''Semaphore bounding the number of resources transferred at once. Created lazily so that
+        it belongs to the running event loop.
+        '''
+        if self._slot is None:
+            self._slot = asyncio.Semaphore(self.num_resources)
+        return self._slot
+    
+    def accepts_ranges(self, url):
+        '''Return True if the host of `url` has advertised support for byte range requests.'''
+        parts = urlsplit(url)
+        return self.ranges.get((parts.scheme.lower(), parts.netloc.lower()), False)
+    
+    def get_headers(self, host, headers=None):
+        '''Return the request headers sent with every request, updated with `headers`.'''
+        request_headers = {
+            'Host': host,
+            'User-Agent': self.user_agent,
+            'Accept': '*/*',
+            'Accept-Encoding': 'identity',
+            'Connection': 'keep-alive',
+        }
+        if headers:
+            request_headers.update(headers)
+        return request_headers
+    
+    async def request(self, method, url, headers=None, follow_redirects=True):
+        '''Send a request for `url` and return its `Response` once the headers have arrived.
+        Redirects are followed unless `follow_redirects` is False.
+        '''
+        for _ in range(self.max_redirects + 1):
+            response = await self.send(method, url, headers)
+            if not follow_redirects or response.status not in REDIRECT_CODES \
+                    or 'location' not in response.headers:
+                return response
+            if response.chunked or response.remaining is not None:
+                await response.read()
+            else:
+                response.close()
+            url = urljoin(url, response.headers['location'])
+            if response.status == 303:
+                method = 'GET'
+            self.log('Redirected to', url)
+        raise FetchError('Too many redirects: {}'.format(url))
+    
+    async def get(self, url, headers=None, follow_redirects=True):
+        '''Shortcut for `request('GET', ...)`.'''
+        return await self.request('GET', url, headers=headers, follow_redirects=follow_redirects)
+    
+    async def send(self, method, url, headers=None):
+        '''Send a single request on a pooled connection, or on a stream of the multiplexed
+        connection to the host. A reused connection that turns out to have been closed by the
+        server is retried once on a fresh connection.
+        '''
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS:
+            raise FetchError('Unsupported URI scheme: {}'.format(url))
+        host = parts.hostname
+        port = parts.port or DEFAULT_PORTS[scheme]
+        host_header = parts.netloc.rsplit('@', 1)[-1]
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        request_headers = self.get_headers(host_header, headers)
+        lines = ['{} {} HTTP/1.1'.format(method, target)]
+        for name, value in request_headers.items():
+            lines.append('{}: {}'.format(name, value))
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        while True:
+            started = time.monotonic()
+            connection, reused = await self.pool.acquire(scheme, host, port)
+            sent = time.monotonic()
+            if self.metrics is not None and not reused:
+                self.metrics.observe('connect', host, sent - started)
+            if connection.multiplexed:
+                response = await connection.send(self, method, url, target, request_headers,
+                                                 reused)
+            else:
+                response = await self.send_payload(connection, method, url, payload, reused)
+            if response is None:
+                if self.metrics is not None:
+                    self.metrics.count('retries', host)
+                continue
+            if self.metrics is not None:
+                self.metrics.observe('ttfb', host, time.monotonic() - sent)
+                self.metrics.count('requests', host)
+                self.metrics.count('responses', host, str(response.status))
+            return response
+    
+    async def send_payload(self, connection, method, url, payload, reused):
+        '''Send the HTTP/1.1 request `payload` on `connection` and return its `Response` once the
+        head has arrived. Returns None when the request failed on a reused connection, in which
+        case it may be sent again.
+        '''
+        try:
+            connection.writer.write(payload)
+            await connection.writer.drain()
+            head = await asyncio.wait_for(connection.reader.readuntil(b'\r\n\r\n'),
+                                          self.timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError) as error:
+            connection.close()
+            if reused:
+                return None
+            raise FetchError('Error requesting {}: {!r}'.format(url, error))
+        connection.requests += 1
+        return self.parse_head(connection, method, url, head)
+    
+    def parse_head(self, connection, method, url, head):
+        '''Parse the status line and headers of a response into a `Response`.'''
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            version, status, reason = (lines[0].split(' ', 2) + [''])[:3]
+            status = int(status)
+        except ValueError:
+            connection.close()
+            raise FetchError('Malformed status line from {}: {!r}'.format(url, lines[0]))
+        headers = {}
+        for line in lines[1:]:
+            if ':' not in line:
+                continue
+            name, value = line.split(':', 1)
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = headers[name] + ', ' + value if name in headers else value
+        self.remember_ranges(url, status, headers)
+        connection_header = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            keep_alive = 'keep-alive' in connection_header
+        else:
+            keep_alive = 'close' not in connection_header
+        return Response(self, connection, method, url, status, reason, headers, keep_alive)
+    
+    def remember_ranges(self, url, status, headers):
+        '''Remember whether the host of `url` supports byte range requests, from the status and
+        the parsed `headers` of a response.
+        '''
+        if status == 206 or 'accept-ranges' in headers:
+            parts = urlsplit(url)
+            self.ranges[(parts.scheme.lower(), parts.netloc.lower())] = \
+                status == 206 or headers['accept-ranges'].lower() == 'bytes'
+    
+    def record(self, response):
+        '''Record the bytes received and the transfer time of `response` in the metrics.'''
+        host = response.connection.key[1]
+        self.metrics.count('bytes', host, amount=response.received)
+        self.metrics.observe('transfer', host, time.monotonic() - response.started)
+    
+    async def close(self):
+        '''Close every pooled connection, unless the pool is shared.'''
+        if self.owns_pool:
+            self.pool.close()
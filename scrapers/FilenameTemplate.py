@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+'''FilenameTemplate implements option -of/--output-filename. A template such as `img##_%d.%e` is
+parsed once into a list of literal strings and placeholder functions, so that naming a file only
+joins the parts. NameIndex hands out free filenames in the data directory, adding an incremental
+`_N` suffix to names that are taken. It scans the directory once, then keeps the names in memory,
+so that no name is probed on disk, and no two downloads are given the same name. Each name handed
+out is claimed by creating its file exclusively, so that processes sharing the directory, such as
+the workers of option -b, never write to the same file either. Names are cleaned of characters no
+filesystem accepts and cut to 255 bytes, keeping their extension.
+
+   usage:
+       >>> from scrapers.FilenameTemplate import FilenameTemplate, NameIndex
+       >>> template = FilenameTemplate('img##_%d.%e')
+       >>> template.render(name='photo', ext='jpg')
+       'img01_2017-12-29.jpg'
+       >>> names = NameIndex('images')
+       >>> names.reserve('img.jpg')
+       'img_1.jpg'
+'''
+
+import datetime
+import errno
+import itertools
+import os
+import re
+import threading
+from email.utils import parsedate_to_datetime
+
+
+PLACEHOLDER = re.compile(r'(#+)|%(fd|d|t)(?:\(([^)]*)\))?|%([nwhe%])')
+
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H-%M-%S'
+
+NAME_MAX = 255
+
+CONTROL = re.compile(r'[\x00-\x1f\x7f]')
+
+
+def parse_modified(value):
+    '''Parse the value of a Last-Modified header into a POSIX timestamp, or None.'''
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def sanitize_name(name):
+    '''Return `name` made safe to use as a filename: without control characters such as NUL,
+    with path separators replaced by `_`, without trailing dots and spaces, and cut to
+    `NAME_MAX` bytes. Returns an empty string if nothing is left.
+    '''
+    name = CONTROL.sub('', name).replace('/', '_').replace(os.sep, '_')
+    if os.altsep:
+        name = name.replace(os.altsep, '_')
+    root, ext = os.path.splitext(name.rstrip('. '))
+    return fit_name(root, ext).rstrip('. ')
+
+
+def fit_name(root, ext, suffix=''):
+    '''Return `root` + `suffix` + `ext`, with `root` cut short so that the name takes at most
+    `NAME_MAX` bytes in UTF-8. An extension too long to leave room for any of `root` is cut as
+    well.
+    '''
+    encoded = ext.encode('utf-8')
+    if len(encoded) > NAME_MAX // 2:
+        ext = encoded[:NAME_MAX // 2].decode('utf-8', 'ignore')
+    room = NAME_MAX - len((suffix + ext).encode('utf-8'))
+    root = root.encode('utf-8')[:room].decode('utf-8', 'ignore')
+    return root + suffix + ext
+
+
+def check_literal(literal):
+    '''Return the literal part `literal` of a template. Raises ValueError if it holds a `%`
+    that did not start a placeholder.
+    '''
+    if '%' in literal:
+        raise ValueError('Unknown placeholder in filename template: {!r}'.format(
+            literal[literal.index('%'):][:2]))
+    return literal
+
+
+def format_counter(width):
+    '''Placeholder `#`: the resource counter, zero padded to `width` digits.'''
+    return lambda fields: str(fields['counter']).zfill(width)
+
+
+def format_date(date, date_format):
+    '''Placeholders `%d`, `%fd`, and `%t`: the current date, the last modification date of the
+    resource (or the current date if unknown), and the current time, in `date_format`.
+    '''
+    if date == 'fd':
+        return lambda fields: (fields['modified'] or fields['now']).strftime(
+            date_format or DATE_FORMAT)
+    date_format = date_format or (TIME_FORMAT if date == 't' else DATE_FORMAT)
+    return lambda fields: fields['now'].strftime(date_format)
+
+
+def format_dimension(index):
+    '''Placeholders `%w` and `%h`: the image width or height, or nothing if unknown.'''
+    return lambda fields: str(fields['dimensions'][index]) if fields['dimensions'] else ''
+
+
+def format_field(key):
+    '''Placeholders `%n` and `%e`: the original filename without its extension, and the
+    original extension.
+    '''
+    return lambda fields: fields[key]
+
+
+class FilenameTemplate:
+    """Output filename template of option -of, compiled into literal and placeholder parts."""
+    
+    def __init__(self, template):
+        self.template = template
+        self.counter = itertools.count(1)
+        self.needs_dimensions = False
+        self.parts = self.compile(template)
+    
+    def compile(self, template):
+        '''Parse `template` into a list of literal strings and functions of the fields of
+        `render()`. Raises ValueError on an unknown placeholder.
+        '''
+        parts = []
+        position = 0
+        for match in PLACEHOLDER.finditer(template):
+            parts.append(check_literal(template[position:match.start()]))
+            counter, date, date_format, field = match.groups()
+            if counter:
+                parts.append(format_counter(len(counter)))
+            elif date:
+                parts.append(format_date(date, date_format))
+            elif field == '%':
+                parts.append('%')
+            elif field in 'wh':
+                self.needs_dimensions = True
+                parts.append(format_dimension(0 if field == 'w' else 1))
+            else:
+                parts.append(format_field('name' if field == 'n' else 'ext'))
+            position = match.end()
+        parts.append(check_literal(template[position:]))
+        merged = []
+        for part in parts:
+            if isinstance(part, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += part
+            elif part != '':
+                merged.append(part)
+        return merged
+    
+    def render(self, name, ext, dimensions=None, modified=None):
+        '''Return the filename for a resource originally named `name` + '.' + `ext`, with image
+        `dimensions` (a (width, height) tuple) and last modification time `modified` (a POSIX
+        timestamp), when known. Each call takes the next value of the resource counter.
+        '''
+        if modified is not None:
+            modified = datetime.datetime.fromtimestamp(modified)
+        fields = {'counter': next(self.counter), 'name': name, 'ext': ext,
+                  'dimensions': dimensions, 'modified': modified,
+                  'now': datetime.datetime.now()}
+        filename = ''.join(part if isinstance(part, str) else part(fields)
+                           for part in self.parts)
+        return sanitize_name(filename) or sanitize_name(name) or 'index'
+
+
+class NameIndex:
+    """In-memory index of the names taken in a directory, handing out free filenames."""
+    
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.suffixes = {}
+        with os.scandir(directory) as entries:
+            self.names = {entry.name for entry in entries}
+    
+    def reserve(self, name):
+        '''Return `name`, or if it is taken, the first free `name_N` with an incremental suffix
+        N, and mark the returned name as taken. Suffixes resume from the last one handed out for
+        `name`, so a name that keeps colliding does not rescan the suffixes before it. The
+        returned name is claimed by creating an empty file under it; a name another process
+        claimed since the directory was scanned is skipped. `name` is passed through
+        `sanitize_name()` first. Raises OSError if the file can not be created.
+        '''
+        name = sanitize_name(name) or 'index'
+        with self.lock:
+            candidate = name
+            root, ext = os.path.splitext(name)
+            counter = self.suffixes.get(name, 1)
+            while True:
+                if candidate not in self.names:
+                    self.names.add(candidate)
+                    try:
+                        if self.claim(candidate):
+                            break
+                    except OSError:
+                        self.names.discard(candidate)
+                        raise
+                candidate = fit_name(root, ext, '_{}'.format(counter))
+                counter += 1
+            if candidate != name:
+                self.suffixes[name] = counter
+            return candidate
+    
+    def claim(self, name):
+        '''Create the file `name` in the directory, unless it exists. Returns True if created.
+        Raises OSError if it can not be created, also for a name the OS rejects outright.
+        '''
+        path = os.path.join(self.directory, name)
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+        except FileExistsError:
+            return False
+        except ValueError as error:
+            raise OSError(errno.EINVAL, str(error), path) from error
+        return True
+    
+    def discard(self, name):
+        '''Mark `name` as free again, after the file reserved under it was removed.'''
+        with self.lock:
+            self.names.discard(name)
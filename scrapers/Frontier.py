@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+'''Frontier is the disk-backed crawl frontier used by recursive (`-r`) scrapes. Pending URLs,
+visited URLs, and their depth are kept in an SQLite database inside the output directory, so
+memory use does not grow with the size of the crawl and a killed crawl resumes where it stopped.
+URLs are deduplicated on their canonical form, but fetched as they were found.
+
+   usage:
+       >>> from scrapers.Frontier import Frontier
+       >>> frontier = Frontier('frontier.sqlite')
+       >>> frontier.add('http://example.com/', depth=0, root='http://example.com/')
+       >>> item = frontier.pop()
+       >>> frontier.done(item.url)
+       >>> frontier.close(complete=True)
+'''
+
+import collections
+import posixpath
+import sqlite3
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+PENDING = 0
+LEASED = 1
+VISITED = 2
+
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'ftp': 21, 'ftps': 990, 'sftp': 22, 'ssh': 22}
+
+FrontierItem = collections.namedtuple('FrontierItem', 'url depth kind root referrer')
+
+
+def canonicalize_url(url):
+    '''Return the canonical form of `url` used to dedupe the frontier: the scheme and host are
+    lowercased, default ports, fragments and dot segments are dropped, and query parameters are
+    sorted.
+    '''
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += ':{}'.format(parts.port)
+    if parts.username:
+        netloc = '{}@{}'.format(parts.username, netloc)
+    path = parts.path or '/'
+    trailing = path.endswith('/')
+    path = posixpath.normpath(path)
+    if path.startswith('//'):
+        path = '/' + path.lstrip('/')
+    if trailing and path != '/':
+        path += '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+class Frontier:
+    """SQLite-backed queue of URLs to crawl, deduplicated on their canonical form. Each item
+    keeps the URL it was added with, which is the one fetched.
+    """
+    
+    lease_size = 256
+    commit_every = 512
+    
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS urls (
+                               url TEXT PRIMARY KEY,
+                               fetch_url TEXT,
+                               depth INTEGER NOT NULL,
+                               kind TEXT NOT NULL,
+                               root TEXT NOT NULL,
+                               referrer TEXT,
+                               state INTEGER NOT NULL DEFAULT 0)''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS urls_state ON urls (state, depth)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS urls_root ON urls (root, state, depth)')
+        try:
+            # Frontiers written before the URLs to fetch were kept lack the column; their items
+            # are fetched at their canonical URL.
+            self.db.execute('ALTER TABLE urls ADD COLUMN fetch_url TEXT')
+        except sqlite3.OperationalError:
+            pass
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.roots = collections.OrderedDict()
+        self.uncommitted = 0
+        self.resumed = False
+        self.open()
+    
+    def open(self):
+        '''Prepare the frontier for a run. A crawl that completed last time is cleared so that it
+        starts over; an interrupted crawl has its leased-but-unfinished URLs made pending again.
+        '''
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'complete'").fetchone()
+        if row is None or row[0] == '1':
+            self.db.execute('DELETE FROM urls')
+        else:
+            self.db.execute('UPDATE urls SET state = ? WHERE state = ?', (PENDING, LEASED))
+            self.resumed = self.db.execute('SELECT 1 FROM urls LIMIT 1').fetchone() is not None
+            for row in self.db.execute('SELECT DISTINCT root FROM urls WHERE state = ?',
+                                       (PENDING,)):
+                self.roots.setdefault(row[0], collections.deque())
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '0')")
+        self.db.commit()
+    
+    def add(self, url, depth, root, kind='page', referrer=None):
+        '''Add `url` to the frontier unless its canonical form has been seen before. Returns True
+        if the URL was added.
+        '''
+        cursor = self.db.execute('INSERT OR IGNORE INTO urls '
+                                 '(url, fetch_url, depth, kind, root, referrer) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)',
+                                 (canonicalize_url(url), url, depth, kind, root, referrer))
+        self.roots.setdefault(root, collections.deque())
+        self.tick()
+        return cursor.rowcount == 1
+    
+    def add_many(self, urls, depth, root, kind='page', referrer=None):
+        '''Add each of `urls` to the frontier. Returns the number of URLs that were new.'''
+        before = self.db.total_changes
+        self.db.executemany('INSERT OR IGNORE INTO urls '
+                            '(url, fetch_url, depth, kind, root, referrer) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            ((canonicalize_url(url), url, depth, kind, root, referrer)
+                             for url in urls))
+        self.roots.setdefault(root, collections.deque())
+        self.tick()
+        return self.db.total_changes - before
+    
+    def pop(self):
+        '''Return the next pending `FrontierItem`, or None if nothing is pending. The URI
+        resources being crawled take turns, so that a large site does not starve a small one.
+        Items are leased from the database in batches per URI resource, shallowest first.
+        '''
+        for _ in range(len(self.roots)):
+            root, leased = self.roots.popitem(last=False)
+            self.roots[root] = leased
+            if not leased:
+                leased.extend(self.lease(root))
+            if leased:
+                return leased.popleft()
+        return None
+    
+    def lease(self, root):
+        '''Lease the next batch of pending items of the URI resource `root`.'''
+        rows = self.db.execute('SELECT url, COALESCE(fetch_url, url), depth, kind, root, '
+                               'referrer FROM urls '
+                               'WHERE root = ? AND state = ? ORDER BY depth, rowid LIMIT ?',
+                               (root, PENDING, self.lease_size)).fetchall()
+        if rows:
+            self.db.executemany('UPDATE urls SET state = ? WHERE url = ?',
+                                ((LEASED, row[0]) for row in rows))
+            self.db.commit()
+            self.uncommitted = 0
+        return [FrontierItem(*row[1:]) for row in rows]
+    
+    def requeue(self, items):
+        '''Make the `items`, as returned by `pop()` but not done, pending again, such as those
+        leased by a worker of a distributed crawl that stopped responding.
+        '''
+        self.db.executemany('UPDATE urls SET state = ? WHERE url = ? AND state = ?',
+                            ((PENDING, canonicalize_url(item.url), LEASED) for item in items))
+        for item in items:
+            self.roots.setdefault(item.root, collections.deque())
+        self.tick()
+    
+    def done(self, url):
+        '''Mark `url`, as returned by `pop()`, as visited.'''
+        self.db.execute('UPDATE urls SET state = ? WHERE url = ?',
+                        (VISITED, canonicalize_url(url)))
+        self.tick()
+    
+    def seen(self, url):
+        '''Return True if `url` is already in the frontier, pending or visited.'''
+        row = self.db.execute('SELECT 1 FROM urls WHERE url = ?',
+                              (canonicalize_url(url),)).fetchone()
+        return row is not None
+    
+    def count(self, state=None):
+        '''Return the number of URLs in the frontier, optionally only those in `state`.'''
+        if state is None:
+            return self.db.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+        return self.db.execute('SELECT COUNT(*) FROM urls WHERE state = ?', (state,)).fetchone()[0]
+    
+    def tick(self):
+        '''Commit once enough changes have accumulated.'''
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.db.commit()
+            self.uncommitted = 0
+    
+    def close(self, complete=False):
+        '''Commit and close the frontier. When `complete` is True the crawl is recorded as
+        finished, so the next run starts from scratch rather than resuming.
+        '''
+        if complete:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+        self.db.commit()
+        self.db.close()
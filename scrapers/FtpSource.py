@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+
+'''FtpSource scrapes images out of a directory tree on an FTP or FTPS server. It keeps a pool of
+logged-in control connections to the server, one per worker thread at most, so that the login
+(and the TLS handshake of FTPS) is paid once per connection rather than once per file. Directories
+are listed with MLSD, which gives the type, size, and modification time of every entry in one
+round trip, and with LIST on servers without MLSD. Many listings and transfers are in flight at
+once, each on a connection of the pool. ftps URIs on port 990 use implicit TLS; on any other port
+the control connection is upgraded with AUTH TLS. With a `RateLimiter`, every chunk transferred
+is metered through it, the thread reading it waiting on the event loop for its turn.
+
+   usage:
+       >>> from scrapers.FtpSource import FtpSource
+       >>> source = FtpSource('ftp', 'ftp.example.com', 21, workers=8)
+       >>> async for files in source.walk('/pub/images'):
+       >>>     for path, stat in files:
+       >>>         async with source.slot:
+       >>>             transfer = await source.run(source.retrieve, path, None, stat.st_size)
+       >>>             await source.run(transfer.save, 'images/copy.png')
+       >>> source.close()
+'''
+
+import asyncio
+import calendar
+import collections
+import ftplib
+import posixpath
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_PORTS = {'ftp': 21, 'ftps': 990}
+IMPLICIT_TLS_PORT = 990
+MONTHS = {name: index for index, name in enumerate(calendar.month_abbr) if name}
+
+# The size and modification time of an FTP file, named after the `os.stat_result` fields the
+# metadata file reads.
+FtpStat = collections.namedtuple('FtpStat', 'st_size st_mtime st_mtime_ns')
+
+# Replies to a command the server does not implement, or does not understand.
+UNSUPPORTED = ('500', '501', '502', '504')
+
+
+class FtpError(Exception):
+    """Raised when a file or directory cannot be read from the server."""
+
+
+class FtpsConnection(ftplib.FTP_TLS):
+    """FTP_TLS that resumes the TLS session of the control connection on data connections, as
+    many servers require, and that also speaks implicit FTPS.
+    """
+    
+    implicit = False
+    
+    def connect(self, host='', port=0, timeout=-999, source_address=None):
+        '''Connect to the server. With implicit FTPS, the socket is wrapped in TLS before the
+        greeting is read.
+        '''
+        if not self.implicit:
+            return super().connect(host, port, timeout, source_address)
+        if host:
+            self.host = host
+        if port > 0:
+            self.port = port
+        if timeout != -999:
+            self.timeout = timeout
+        if source_address is not None:
+            self.source_address = source_address
+        sock = socket.create_connection((self.host, self.port), self.timeout,
+                                        source_address=self.source_address)
+        self.sock = self.context.wrap_socket(sock, server_hostname=self.host)
+        self.af = self.sock.family
+        self.file = self.sock.makefile('r', encoding=self.encoding)
+        self.welcome = self.getresp()
+        return self.welcome
+    
+    def ntransfercmd(self, cmd, rest=None):
+        '''Open the data connection of `cmd`, protected with the session of the control
+        connection.
+        '''
+        conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p:
+            conn = self.context.wrap_socket(conn, server_hostname=self.host,
+                                            session=self.sock.session)
+        return conn, size
+
+
+def parse_mlsd_time(value):
+    '''Return the seconds since the epoch of an MLSD `modify` fact, YYYYMMDDHHMMSS[.sss] in UTC,
+    or None if it is malformed.
+    '''
+    try:
+        return calendar.timegm(time.strptime(value[:14], '%Y%m%d%H%M%S'))
+    except ValueError:
+        return None
+
+
+def parse_list_line(line, now=None):
+    '''Parse a line of a Unix style LIST reply into a (name, type, size, modified) tuple, where
+    type is 'file', 'dir', or 'link'. Returns None for lines that are not entries.
+    '''
+    parts = line.split(None, 8)
+    if len(parts) < 9 or parts[0][0] not in '-dl':
+        return None
+    kind = {'-': 'file', 'd': 'dir', 'l': 'link'}[parts[0][0]]
+    name = parts[8]
+    if kind == 'link':
+        name = name.split(' -> ', 1)[0]
+    try:
+        size = int(parts[4])
+        month = MONTHS[parts[5].title()]
+        day = int(parts[6])
+        if ':' in parts[7]:
+            hour, minute = (int(value) for value in parts[7].split(':', 1))
+            now = time.gmtime(now)
+            year = now.tm_year
+            # Without a year, the date is within the last six months.
+            if (month, day) > (now.tm_mon, now.tm_mday + 1):
+                year -= 1
+        else:
+            year, hour, minute = int(parts[7]), 0, 0
+        modified = calendar.timegm((year, month, day, hour, minute, 0))
+    except (KeyError, ValueError):
+        return None
+    return name, kind, size, modified
+
+
+def make_stat(size, modified):
+    '''Return the `FtpStat` of a file of `size` bytes last modified at `modified`.'''
+    modified = modified or 0
+    return FtpStat(size or 0, modified, int(modified) * 10 ** 9)
+
+
+class Transfer:
+    """A file being retrieved on a connection of an `FtpSource`. The leading bytes read so far
+    are in `head`; the transfer must be saved or aborted to give the connection back.
+    """
+    
+    def __init__(self, source, ftp, data, head):
+        self.source = source
+        self.ftp = ftp
+        self.data = data
+        self.head = head
+    
+    def save(self, path):
+        '''Write the whole file to `path`. Returns the number of bytes written.'''
+        size = len(self.head)
+        try:
+            with open(path, 'wb') as fd:
+                fd.write(self.head)
+                while True:
+                    chunk = self.data.recv(self.source.chunk_size)
+                    if not chunk:
+                        break
+                    self.source.consume(len(chunk))
+                    fd.write(chunk)
+                    size += len(chunk)
+            self.finish()
+        except ftplib.all_errors as error:
+            self.abort()
+            raise FtpError(str(error)) from error
+        return size
+    
+    def finish(self):
+        '''Close the data connection and read the reply of the transfer.'''
+        if isinstance(self.data, ssl.SSLSocket):
+            self.data.unwrap()
+        self.data.close()
+        self.data = None
+        self.ftp.voidresp()
+        self.source.release(self.ftp)
+        self.ftp = None
+    
+    def abort(self):
+        '''Stop the transfer. The connection is dropped rather than given back, as the state of
+        an aborted transfer varies between servers.
+        '''
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        if self.ftp is not None:
+            self.source.discard(self.ftp)
+            self.ftp = None
+
+
+class FtpSource:
+    """Pool of FTP or FTPS connections to a server, with a parallel directory walker."""
+    
+    chunk_size = 65536
+    
+    def __init__(self, scheme, host, port=None, username=None, password=None, cert_file=None,
+                 workers=8, accept_name=None, timeout=60.0, limiter=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port or DEFAULT_PORTS[scheme]
+        self.username = username or 'anonymous'
+        self.password = password or ''
+        self.cert_file = cert_file
+        self.timeout = timeout
+        self.accept_name = accept_name
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix='scraper-ftp')
+        self._slot = None
+        self.lock = threading.Lock()
+        self.idle = []
+        self.connections = 0
+        self.mlsd = True
+        self.limiter = limiter
+        self.loop = None
+        if limiter is not None:
+            self.chunk_size = limiter.chunk_size(self.chunk_size)
+    
+    @property
+    def slot(self):
+        '''Semaphore bounding the number of connections in use at once to `workers`: it is held
+        by every listing, and by every transfer from its start until it is saved or aborted.
+        Created lazily so that it belongs to the running event loop.
+        '''
+        if self._slot is None:
+            self._slot = asyncio.Semaphore(self.workers)
+        return self._slot
+    
+    async def run(self, function, *args):
+        '''Run `function(*args)` on the thread pool of the source and return its result.'''
+        self.loop = asyncio.get_running_loop()
+        return await self.loop.run_in_executor(self.executor, function, *args)
+    
+    def consume(self, amount):
+        '''Account for `amount` bytes transferred, blocking the calling thread of the pool as long
+        as the rate limiter requires. Does nothing without one.
+        '''
+        if self.limiter is not None:
+            asyncio.run_coroutine_threadsafe(self.limiter.consume(self.host, amount),
+                                             self.loop).result()
+    
+    def url(self, path):
+        '''Return the URL of the file at `path` on the server, without credentials.'''
+        netloc = self.host if ':' not in self.host else '[{}]'.format(self.host)
+        if self.port != DEFAULT_PORTS[self.scheme]:
+            netloc += ':{}'.format(self.port)
+        return '{}://{}{}'.format(self.scheme, netloc, path)
+    
+    def connect(self):
+        '''Open and log in a new control connection. Raises FtpError.'''
+        try:
+            if self.scheme == 'ftps':
+                context = ssl.create_default_context()
+                if self.cert_file:
+                    context.load_cert_chain(self.cert_file)
+                ftp = FtpsConnection(context=context, timeout=self.timeout)
+                ftp.implicit = self.port == IMPLICIT_TLS_PORT
+            else:
+                ftp = ftplib.FTP(timeout=self.timeout)
+            ftp.connect(self.host, self.port)
+            ftp.login(self.username, self.password)
+            if self.scheme == 'ftps':
+                ftp.prot_p()
+            ftp.binary = False
+        except ftplib.all_errors as error:
+            raise FtpError('Could not log in to {}:{}: {}'.format(self.host, self.port, error))
+        with self.lock:
+            self.connections += 1
+        return ftp
+    
+    def acquire(self):
+        '''Return an idle connection, or a new one. The second item of the returned tuple is True
+        when the connection was reused from the pool.
+        '''
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return self.connect(), False
+    
+    def release(self, ftp):
+        '''Hand a connection whose command is done back to the pool.'''
+        with self.lock:
+            self.idle.append(ftp)
+    
+    def discard(self, ftp):
+        '''Close a connection that is no longer usable.'''
+        with self.lock:
+            self.connections -= 1
+        try:
+            ftp.close()
+        except OSError:
+            pass
+    
+    def call(self, function, *args):
+        '''Return `function(ftp, *args)` run on a pooled connection. A reused connection that
+        turns out to have been closed by the server is retried once on a fresh connection.
+        Replies that refuse the command leave the connection in the pool and raise FtpError.
+        '''
+        while True:
+            ftp, reused = self.acquire()
+            try:
+                result = function(ftp, *args)
+            except (ftplib.error_perm, ftplib.error_reply) as error:
+                self.release(ftp)
+                raise FtpError(str(error)) from error
+            except ftplib.all_errors as error:
+                self.discard(ftp)
+                if reused:
+                    continue
+                raise FtpError(str(error)) from error
+            self.release(ftp)
+            return result
+    
+    async def walk(self, root, recursive=True):
+        '''Asynchronously iterate over the files under `root`, yielding a list of (path, stat)
+        tuples per directory listed. Up to `workers` directories are listed in parallel, each
+        holding the `slot`; the others wait their turn, so that nothing more is listed once the
+        iterator is closed early. If `root` is a file rather than a directory, it is yielded
+        alone. Raises FtpError if `root` can not be read.
+        '''
+        try:
+            async with self.slot:
+                files, directories = await self.run(self.scan, root)
+        except FtpError:
+            async with self.slot:
+                stat = await self.run(self.call, self.stat_file, root)
+            yield [(root, stat)]
+            return
+        queue = collections.deque()
+        pending = set()
+        try:
+            while True:
+                if recursive:
+                    queue.extend(directories)
+                while queue and len(pending) < self.workers:
+                    pending.add(asyncio.ensure_future(self.scan_quietly(queue.popleft())))
+                if files:
+                    yield files
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                files, directories = [], []
+                for future in done:
+                    more_files, more_directories = future.result()
+                    files.extend(more_files)
+                    directories.extend(more_directories)
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    async def scan_quietly(self, directory):
+        '''Coroutine that lists `directory` like `scan`, holding the `slot`. Unreadable
+        directories are skipped.
+        '''
+        async with self.slot:
+            try:
+                return await self.run(self.scan, directory)
+            except FtpError:
+                return [], []
+    
+    def scan(self, directory):
+        '''List `directory`. Returns the (path, stat) tuples of the files whose names pass
+        `accept_name`, and the paths of the subdirectories. Symbolic links are not followed.
+        Raises FtpError if the directory can not be listed.
+        '''
+        files = []
+        directories = []
+        for name, kind, size, modified in self.call(self.list_entries, directory):
+            if name in ('.', '..') or '/' in name:
+                continue
+            path = posixpath.join(directory, name)
+            if kind == 'dir':
+                directories.append(path)
+            elif kind == 'file' and (self.accept_name is None or self.accept_name(name)):
+                files.append((path, make_stat(size, modified)))
+        return files, directories
+    
+    def list_entries(self, ftp, directory):
+        '''Return the (name, type, size, modified) tuples of the entries of `directory`, listed
+        with MLSD, or with CWD and LIST once the server turned out not to implement MLSD.
+        '''
+        if self.mlsd:
+            try:
+                ftp.binary = False
+                entries = []
+                # The facts asked for with OPTS MLST hold for the rest of the connection.
+                wanted = () if getattr(ftp, 'mlst_facts', False) else ('type', 'size', 'modify')
+                for name, facts in ftp.mlsd(directory, facts=wanted):
+                    kind = facts.get('type', '').lower()
+                    if kind not in ('file', 'dir'):
+                        continue
+                    size = facts.get('size')
+                    entries.append((name, kind, int(size) if size and size.isdigit() else None,
+                                    parse_mlsd_time(facts.get('modify', ''))))
+                ftp.mlst_facts = True
+                return entries
+            except ftplib.error_perm as error:
+                if not str(error).startswith(UNSUPPORTED):
+                    raise
+                self.mlsd = False
+        lines = []
+        # retrlines switches the connection to TYPE A. LIST is given no argument, as servers
+        # differ in how they parse it, and would list a file rather than fail on it.
+        ftp.binary = False
+        ftp.cwd(directory)
+        ftp.retrlines('LIST', lines.append)
+        return [entry for entry in map(parse_list_line, lines) if entry is not None]
+    
+    @staticmethod
+    def set_binary(ftp):
+        '''Switch `ftp` to binary transfers, unless it already is.'''
+        if not getattr(ftp, 'binary', False):
+            ftp.voidcmd('TYPE I')
+            ftp.binary = True
+    
+    def stat_file(self, ftp, path):
+        '''Return the `FtpStat` of the file at `path`, from the SIZE and MDTM commands.'''
+        self.set_binary(ftp)
+        size = ftp.size(path)
+        try:
+            modified = parse_mlsd_time(ftp.sendcmd('MDTM {}'.format(path))[4:].strip())
+        except ftplib.error_perm:
+            modified = None
+        return make_stat(size, modified)
+    
+    def retrieve(self, path, probe=None, size=None):  # pylint: disable=unused-argument
+        '''Start retrieving the file at `path` and return its `Transfer`. With an `ImageProbe`
+        `probe`, the leading bytes of the file are fed to it until it can decide; a rejected file
+        is aborted and None returned. The `size` of the file as listed is not needed over FTP,
+        which tells the end of the file by closing the data connection. Raises FtpError.
+        '''
+        while True:
+            ftp, reused = self.acquire()
+            try:
+                self.set_binary(ftp)
+                data = ftp.transfercmd('RETR {}'.format(path))
+            except (ftplib.error_perm, ftplib.error_reply) as error:
+                self.release(ftp)
+                raise FtpError(str(error)) from error
+            except ftplib.all_errors as error:
+                self.discard(ftp)
+                if reused:
+                    continue
+                raise FtpError(str(error)) from error
+            break
+        transfer = Transfer(self, ftp, data, b'')
+        if probe is None:
+            return transfer
+        try:
+            while True:
+                chunk = data.recv(16384)
+                if not chunk:
+                    probe.finish()
+                    break
+                self.consume(len(chunk))
+                if probe.feed(chunk):
+                    break
+        except OSError as error:
+            transfer.abort()
+            raise FtpError(str(error)) from error
+        if not probe.accepted:
+            transfer.abort()
+            return None
+        transfer.head = bytes(probe.buffer)
+        return transfer
+    
+    def close(self):
+        '''Shut the thread pool down and log out of every pooled connection.'''
+        self.executor.shutdown()
+        for ftp in self.idle:
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+        self.idle = []
@@ -58,7 +58,7 @@ examples:
                         images from http://foo.example.com/.
 
   $ python %(prog)s \\
-            -nr 4 \\
+            -R 4 \\
             /usr/share/icons
                         Scrape all images located at the local directory,
                         /usr/share/icons, and recursively grab all
@@ -72,7 +72,7 @@ examples:
             -e jpg,png \\
             -lt site \\
             -lp http://foo.example.com/login \\
-            -l 512k \\
+            -rl 512k \\
             --no-follow \\
             --names="^img[0-9]+" \\
             -un myuser \\
@@ -81,7 +81,7 @@ examples:
             -of log.txt \\
             -s 10 \\
             -w 7 \\
-            -nr 10 \\
+            -R 10 \\
             http://foo.example.com/
                         Recursively scrape all images and sub-resources at
                         http://foo.example.com with the "ScraperBot" user
@@ -116,6 +116,15 @@ examples:
                         http://qux.example.com/images/backup2 into the
                         local current working directory.
 
+  $ python %(prog)s \\
+            -r \\
+            -b uris.txt \\
+            -bw 8
+                        Recursively scrape every URI listed in uris.txt,
+                        one per line, in 8 worker processes, and report
+                        the results of all of them at the end. Use -b -
+                        to read the URIs from stdin.
+
   $ python %(prog)s --version
                         Display the version of scraper.py and exit.
 
@@ -126,25 +135,12 @@ examples:
 {SALC}'''.format(SALC=SALC))
         super().parse_arguments()
     
-    @staticmethod
-    def sub_parser(subparsers):
-        '''A subparser is passed in as `subparsers`. Add a new subparser to the `subparsers` object
-        then return that subparser. See `argparse.ArgumentsParser` for details.
-        '''
-        parser = subparsers.add_parser('generic',
-                                       help=('Invoke the generic scraper to scrape images off '
-                                             'of any URI resource. This is a general scraper '
-                                             'and may not grab every image.'))
-        return parser
-    
     def handle(self):
         '''Main class method that drives the work on scraping the images for this GenericScraper.
         '''
-        self.write('Args:', self.args)
-        self.write('Parser:', self.parser)
-        self.write('Parsed options:', self.options)
-        self.write('')
-        self.write('This is the GenericScraper.')
+        self.log('Args:', self.args)
+        self.log('Parsed options:', self.options)
+        self.scrape(self.options.get('uri'))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+'''Http2 is the HTTP/2 transport of option --http2. When a TLS connection to a host negotiates h2
+with ALPN, the connection pool keeps it as the one connection to that origin, and every request
+to the origin is sent on a stream of its own over it. Hundreds of small resources then share one
+TCP and TLS handshake, and a slow response no longer holds up the ones queued behind it. Hosts
+that only offer HTTP/1.1, and plain http URIs, carry on over pooled HTTP/1.1 connections.
+Requires h2.
+
+   usage:
+       >>> from scrapers.Fetcher import Fetcher
+       >>> fetcher = Fetcher(num_resources=100, http2=True)
+'''
+
+import asyncio
+import collections
+import time
+
+try:
+    from scrapers.Fetcher import FetchError, Response
+except ImportError:
+    from Fetcher import FetchError, Response
+
+
+# Request headers that are specific to an HTTP/1.1 connection, and forbidden in HTTP/2.
+CONNECTION_HEADERS = ('host', 'connection', 'keep-alive', 'proxy-connection',
+                      'transfer-encoding', 'upgrade')
+
+
+def load_h2():
+    '''Import and return the `h2` package, or None if it is not installed. h2 is only imported
+    once a host negotiates HTTP/2, to keep it out of the startup time of the scraper.
+    '''
+    try:
+        import h2.config
+        import h2.connection
+        import h2.errors
+        import h2.events
+        import h2.exceptions
+        import h2.settings
+    except ImportError:
+        return None
+    return h2
+
+
+class Http2Stream:
+    """A stream of an `Http2Connection`, carrying one request and its response."""
+    
+    def __init__(self, connection, stream_id):
+        self.connection = connection
+        self.key = connection.key
+        self.stream_id = stream_id
+        self.head = asyncio.get_running_loop().create_future()
+        self.chunks = collections.deque()
+        self.arrived = asyncio.Event()
+        self.ended = False
+        self.error = None
+    
+    def fail(self, error):
+        '''Fail the response with the exception `error`, waking up its reader.'''
+        self.error = error
+        if not self.head.done():
+            self.head.set_exception(error)
+        self.arrived.set()
+    
+    async def read(self, size, timeout):
+        '''Read at most `size` bytes of the body, waiting up to `timeout` seconds for them to
+        arrive. Returns b'' once the body is exhausted.
+        '''
+        while not self.chunks:
+            if self.ended:
+                return b''
+            if self.error is not None:
+                raise self.error
+            self.arrived.clear()
+            await asyncio.wait_for(self.arrived.wait(), timeout)
+        data = self.chunks.popleft()
+        if len(data) > size:
+            self.chunks.appendleft(data[size:])
+            data = data[:size]
+        self.connection.acknowledge(self.stream_id, len(data))
+        return data
+    
+    def close(self):
+        '''Forget the stream, resetting it if the response has not fully arrived.'''
+        self.connection.forget(self)
+
+
+class Http2Connection:
+    """A connection to an origin that negotiated HTTP/2, shared by every request to the origin.
+    Responses are read by a task of the connection, which hands their data to their streams.
+    """
+    
+    multiplexed = True
+    window_size = 2 ** 24
+    
+    def __init__(self, key, reader, writer):
+        self.h2 = load_h2()
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.requests = 0
+        self.streams = {}
+        self.idle_since = time.monotonic()
+        self.error = None
+        self.going_away = False
+        self.freed = asyncio.Event()
+        self.settled = asyncio.Event()
+        config = self.h2.config.H2Configuration(client_side=True, header_encoding='latin-1')
+        self.conn = self.h2.connection.H2Connection(config=config)
+        self.conn.initiate_connection()
+        self.conn.update_settings({
+            self.h2.settings.SettingCodes.ENABLE_PUSH: 0,
+            self.h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: self.window_size,
+        })
+        self.conn.increment_flow_control_window(self.window_size - 65535)
+        self.flush()
+        self.task = asyncio.ensure_future(self.run())
+    
+    @property
+    def closed(self):
+        '''True if no new stream can be opened on this connection.'''
+        return self.error is not None or self.going_away or self.writer.is_closing()
+    
+    def flush(self):
+        '''Write out the frames queued by the protocol state machine.'''
+        data = self.conn.data_to_send()
+        if data and not self.writer.is_closing():
+            self.writer.write(data)
+    
+    async def run(self):
+        '''Coroutine reading the frames sent by the host until the connection is closed.'''
+        error = FetchError('Connection closed by {}'.format(self.key[1]))
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                for event in self.conn.receive_data(data):
+                    self.handle(event)
+                self.flush()
+        except (OSError, self.h2.exceptions.ProtocolError) as exception:
+            error = FetchError('HTTP/2 error from {}: {!r}'.format(self.key[1], exception))
+        finally:
+            self.error = error
+            for stream in list(self.streams.values()):
+                stream.fail(error)
+            self.freed.set()
+            self.settled.set()
+            self.writer.close()
+    
+    def handle(self, event):
+        '''Hand the protocol event `event` to the stream it belongs to.'''
+        events = self.h2.events
+        stream = self.streams.get(getattr(event, 'stream_id', None))
+        if isinstance(event, events.DataReceived):
+            padding = event.flow_controlled_length - len(event.data)
+            if stream is None:
+                self.conn.acknowledge_received_data(event.flow_controlled_length,
+                                                    event.stream_id)
+                return
+            if padding:
+                self.conn.acknowledge_received_data(padding, event.stream_id)
+            stream.chunks.append(event.data)
+            stream.arrived.set()
+        elif isinstance(event, events.ResponseReceived):
+            if stream is not None and not stream.head.done():
+                stream.head.set_result(event.headers)
+        elif isinstance(event, events.StreamEnded):
+            if stream is not None:
+                stream.ended = True
+                stream.arrived.set()
+        elif isinstance(event, events.StreamReset):
+            if stream is not None:
+                stream.fail(FetchError('Stream reset by {} with error code {}'.format(
+                    self.key[1], event.error_code)))
+                self.forget(stream)
+        elif isinstance(event, events.ConnectionTerminated):
+            self.going_away = True
+            for stream_id, stream in list(self.streams.items()):
+                if event.last_stream_id is None or stream_id > event.last_stream_id:
+                    stream.fail(FetchError('Stream refused by {}'.format(self.key[1])))
+                    self.forget(stream)
+        elif isinstance(event, events.RemoteSettingsChanged):
+            self.settled.set()
+            self.freed.set()
+    
+    def acknowledge(self, stream_id, size):
+        '''Give `size` bytes of the stream `stream_id` that were read back to the flow control
+        windows, so that the host may send more.
+        '''
+        if self.error is None:
+            self.conn.acknowledge_received_data(size, stream_id)
+            self.flush()
+    
+    def forget(self, stream):
+        '''Drop `stream` from the connection, resetting it if it has not ended, and give its unread
+        data back to the flow control window of the connection.
+        '''
+        if self.streams.pop(stream.stream_id, None) is None:
+            return
+        if self.error is None:
+            unread = sum(len(chunk) for chunk in stream.chunks)
+            if unread:
+                self.conn.acknowledge_received_data(unread, stream.stream_id)
+            if not stream.ended:
+                try:
+                    self.conn.reset_stream(stream.stream_id,
+                                           self.h2.errors.ErrorCodes.CANCEL)
+                except self.h2.exceptions.ProtocolError:
+                    pass
+            self.flush()
+        stream.chunks.clear()
+        if not self.streams:
+            self.idle_since = time.monotonic()
+            if self.going_away:
+                self.writer.close()
+        self.freed.set()
+    
+    async def open_stream(self, fields, timeout):
+        '''Send the request header `fields` on a new stream and return the `Http2Stream`. Waits up
+        to `timeout` seconds for the first settings of the host, which limit the number of
+        streams open at once, then while the host already has as many streams open as it allows.
+        '''
+        await asyncio.wait_for(self.settled.wait(), timeout)
+        while not self.closed and self.conn.open_outbound_streams >= \
+                self.conn.remote_settings.max_concurrent_streams:
+            self.freed.clear()
+            await self.freed.wait()
+        if self.error is not None:
+            raise self.error
+        if self.closed:
+            raise FetchError('Connection to {} is going away'.format(self.key[1]))
+        stream_id = self.conn.get_next_available_stream_id()
+        stream = Http2Stream(self, stream_id)
+        self.streams[stream_id] = stream
+        self.conn.send_headers(stream_id, fields, end_stream=True)
+        self.flush()
+        return stream
+    
+    async def send(self, fetcher, method, url, target, headers, reused):
+        '''Send a request for `url` on a new stream and return its `Http2Response` once the head
+        has arrived. Returns None when the request failed on a connection that was already open,
+        in which case it may be sent again.
+        '''
+        fields = [(':method', method), (':scheme', self.key[0]),
+                  (':authority', headers['Host']), (':path', target)]
+        fields.extend((name.lower(), str(value)) for name, value in headers.items()
+                      if name.lower() not in CONNECTION_HEADERS)
+        stream = None
+        try:
+            stream = await self.open_stream(fields, fetcher.timeout)
+            head = await asyncio.wait_for(stream.head, fetcher.timeout)
+        except (FetchError, asyncio.TimeoutError) as error:
+            if stream is not None:
+                stream.close()
+            if reused:
+                return None
+            raise FetchError('Error requesting {}: {!r}'.format(url, error))
+        self.requests += 1
+        status = 0
+        response_headers = {}
+        for name, value in head:
+            if name == ':status':
+                status = int(value)
+            elif name in response_headers:
+                response_headers[name] += ', ' + value
+            else:
+                response_headers[name] = value
+        fetcher.remember_ranges(url, status, response_headers)
+        return Http2Response(fetcher, stream, method, url, status, response_headers)
+    
+    def close(self):
+        '''Close the connection, failing the streams still open on it.'''
+        self.task.cancel()
+        self.writer.close()
+
+
+class Http2Response(Response):
+    """A response streamed on a stream of an `Http2Connection`. Closing it before the body has
+    been read resets its stream alone; the connection carries on with the others.
+    """
+    
+    def __init__(self, fetcher, stream, method, url, status, headers):
+        super().__init__(fetcher, stream, method, url, status, '', headers, True)
+    
+    def finish(self):
+        '''Mark the body as fully read and forget the stream.'''
+        if self.done:
+            return
+        self.done = True
+        if self.fetcher.metrics is not None:
+            self.fetcher.record(self)
+        self.connection.close()
+    
+    def close(self):
+        '''Abandon the response, resetting its stream if the body has not been fully read.'''
+        self.finish()
+    
+    async def read_chunk(self, size):
+        '''Read at most `size` bytes of the body. Returns b'' once the body is exhausted.'''
+        if self.done:
+            return b''
+        try:
+            data = await self.connection.read(size, self.fetcher.timeout)
+        except (FetchError, asyncio.TimeoutError) as error:
+            self.close()
+            raise FetchError('Error reading {}: {!r}'.format(self.url, error))
+        if not data:
+            self.finish()
+            return b''
+        self.received += len(data)
+        return data
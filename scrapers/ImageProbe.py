@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+'''ImageProbe reads the dimensions of an image from the leading bytes of its body, so that the
+`-minw`, `-maxw`, `-minh`, and `-maxh` filters can accept or reject an image before it has been
+downloaded. PNG, GIF, JPEG (by scanning for the SOF marker), BMP, PSD, XCF, and SVG are supported.
+
+   usage:
+       >>> from scrapers.ImageProbe import ImageProbe
+       >>> probe = ImageProbe(min_width=640)
+       >>> for chunk in chunks:
+       >>>     if probe.feed(chunk):
+       >>>         break
+       >>> probe.accepted
+'''
+
+import re
+import struct
+
+
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+JPEG_STANDALONE_MARKERS = frozenset(range(0xD0, 0xDA)) | {0x01}
+
+SVG_TAG = re.compile(rb'<svg\b[^>]*>', re.IGNORECASE | re.DOTALL)
+SVG_LENGTH = re.compile(r'^\s*([0-9.]+)\s*(px)?\s*$')
+
+
+class ProbeError(Exception):
+    """Raised when the dimensions cannot be read from the data given."""
+
+
+def parse_dimensions(data):
+    '''Return the (width, height) of the image whose leading bytes are `data`, or None if more
+    bytes are needed. Raises `ProbeError` if the format is unknown or the header is malformed.
+    '''
+    if len(data) < 4:
+        return None
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        if len(data) < 24:
+            return None
+        if data[12:16] != b'IHDR':
+            raise ProbeError('PNG without IHDR chunk')
+        return struct.unpack('>II', data[16:24])
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        if len(data) < 10:
+            return None
+        return struct.unpack('<HH', data[6:10])
+    if data.startswith(b'\xff\xd8'):
+        return parse_jpeg(data)
+    if data.startswith(b'BM'):
+        if len(data) < 26:
+            return None
+        if struct.unpack('<I', data[14:18])[0] == 12:
+            return struct.unpack('<HH', data[18:22])
+        width, height = struct.unpack('<ii', data[18:26])
+        return abs(width), abs(height)
+    if data.startswith(b'8BPS'):
+        if len(data) < 22:
+            return None
+        height, width = struct.unpack('>II', data[14:22])
+        return width, height
+    if data.startswith(b'gimp xcf'):
+        if len(data) < 22:
+            return None
+        return struct.unpack('>II', data[14:22])
+    head = data.lstrip()
+    if head[:1] == b'<':
+        return parse_svg(data)
+    raise ProbeError('Unknown image format')
+
+
+def parse_jpeg(data):
+    '''Scan the markers of a JPEG for the first start-of-frame segment, which holds the image
+    dimensions. Returns None if the segment is not within `data`.
+    '''
+    position = 2
+    length = len(data)
+    while True:
+        if position >= length:
+            return None
+        if data[position] != 0xFF:
+            raise ProbeError('Malformed JPEG marker')
+        while position < length and data[position] == 0xFF:
+            position += 1
+        if position >= length:
+            return None
+        marker = data[position]
+        position += 1
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker == 0xDA:
+            raise ProbeError('JPEG scan started before a frame header')
+        if position + 2 > length:
+            return None
+        segment = struct.unpack('>H', data[position:position + 2])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if position + 7 > length:
+                return None
+            height, width = struct.unpack('>HH', data[position + 3:position + 7])
+            return width, height
+        position += segment
+
+
+def parse_svg(data):
+    '''Read the width and height attributes, or failing that the viewBox, of the root `svg`
+    element. Returns None if the start tag is not within `data`.
+    '''
+    match = SVG_TAG.search(data)
+    if match is None:
+        if b'<svg' in data.lower() or len(data) < 4096:
+            return None
+        raise ProbeError('No svg element')
+    tag = match.group(0).decode('utf-8', errors='replace')
+    attrs = dict(re.findall(r'([\w:-]+)\s*=\s*["\']([^"\']*)["\']', tag))
+    width = SVG_LENGTH.match(attrs.get('width', ''))
+    height = SVG_LENGTH.match(attrs.get('height', ''))
+    if width and height:
+        return int(float(width.group(1))), int(float(height.group(1)))
+    view_box = attrs.get('viewBox', '').replace(',', ' ').split()
+    if len(view_box) == 4:
+        try:
+            return int(float(view_box[2])), int(float(view_box[3]))
+        except ValueError:
+            pass
+    raise ProbeError('SVG without absolute dimensions')
+
+
+class ImageProbe:
+    """Incrementally reads the dimensions of an image and checks them against the dimension
+    filters. An image whose dimensions cannot be read is accepted."""
+    
+    max_bytes = 512 * 1024
+    
+    def __init__(self, min_width=None, max_width=None, min_height=None, max_height=None):
+        self.min_width = min_width
+        self.max_width = max_width
+        self.min_height = min_height
+        self.max_height = max_height
+        self.reset()
+    
+    def reset(self):
+        '''Forget the bytes fed so far, to probe another body.'''
+        self.buffer = bytearray()
+        self.dimensions = None
+        self.done = False
+    
+    @property
+    def active(self):
+        '''True if any dimension filter is set.'''
+        return any(limit is not None for limit in (self.min_width, self.max_width,
+                                                   self.min_height, self.max_height))
+    
+    def feed(self, data):
+        '''Add the next bytes of the body. Returns True once a decision can be made.'''
+        if self.done:
+            return True
+        self.buffer += data
+        try:
+            self.dimensions = parse_dimensions(self.buffer)
+        except ProbeError:
+            self.done = True
+        if self.dimensions is not None or len(self.buffer) >= self.max_bytes:
+            self.done = True
+        return self.done
+    
+    def finish(self):
+        '''Mark the end of the body; no further bytes will be fed.'''
+        self.done = True
+    
+    @property
+    def accepted(self):
+        '''True if the image passes the dimension filters, False if it does not, and None if no
+        decision can be made yet.
+        '''
+        if not self.done:
+            return None
+        if self.dimensions is None:
+            return True
+        width, height = self.dimensions
+        return ((self.min_width is None or width >= self.min_width) and
+                (self.max_width is None or width <= self.max_width) and
+                (self.min_height is None or height >= self.min_height) and
+                (self.max_height is None or height <= self.max_height))
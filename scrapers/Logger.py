@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+'''Logger is the logging subsystem shared by `ScraperDriver`, `Scraper`, and the scrapers. Log
+calls only put their arguments on a queue, and nothing at all is done for a debug record unless
+option --debug is set. Strings and numbers are queued as they are; any other argument, which might
+change before it is written, is formatted at the call. A background thread formats the records
+and writes them out in batches, one write and flush per batch, to stdout or to the file of option
+-ol, as text or, with option -lj, as JSON lines.
+
+   usage:
+       >>> from scrapers.Logger import LOGGER
+       >>> LOGGER.configure(debug=True)
+       >>> LOGGER.debug('Scraper.py', ('self.options:', {'uri': ['http://example.com/']}))
+       >>> LOGGER.info('TemplateScraper.py', ('Saved: http://example.com/img.png',))
+       >>> LOGGER.flush()
+'''
+
+import atexit
+import json
+import queue
+import sys
+import threading
+import time
+from pprint import pformat
+
+
+DEBUG = 'debug'
+INFO = 'info'
+
+# Types of the arguments that can be queued unformatted, since they can not change.
+IMMUTABLE_TYPES = frozenset((str, int, float, bool, bytes, type(None)))
+
+
+def format_arg(arg):
+    '''Return `arg` as text, pretty-printing lists, tuples, and dicts. Never raises.'''
+    try:
+        if isinstance(arg, (list, tuple, dict)):
+            return pformat(arg)
+        return str(arg)
+    except Exception:  # pylint: disable=broad-except
+        try:
+            return pformat(arg)
+        except Exception:  # pylint: disable=broad-except
+            return '<unprintable {}>'.format(type(arg).__name__)
+
+
+def format_args(args):
+    '''Join `args` with spaces, pretty-printing lists, tuples, and dicts.'''
+    return ' '.join(format_arg(arg) for arg in args)
+
+
+def snapshot(args):
+    '''Return `args` with every argument but strings and numbers already formatted, so that the
+    record shows them as they were at the call, not as they are when the writer gets to it.
+    '''
+    for arg in args:
+        if type(arg) not in IMMUTABLE_TYPES:
+            return tuple(arg if type(arg) in IMMUTABLE_TYPES else format_arg(arg) for arg in args)
+    return args
+
+
+class Logger:
+    """Process-wide logger with lazy formatting and a batching background writer."""
+    
+    max_batch = 1024
+    spacing = 8
+    
+    def __init__(self):
+        self.debug_enabled = False
+        self.json_lines = False
+        self.path = None
+        self.file = None
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.counter = 1
+        self.line_start = True
+    
+    def configure(self, debug=None, path=None, json_lines=None):
+        '''Set whether debug records are logged, the file to write to instead of stdout, and
+        whether records are written as JSON lines. Arguments left as None are unchanged. Raises
+        OSError if the file can not be opened, leaving the file written to unchanged.
+        '''
+        if debug is not None:
+            self.debug_enabled = bool(debug)
+        if json_lines is not None:
+            self.json_lines = bool(json_lines)
+        if path is not None and path != self.path:
+            stream = open(path, 'a', encoding='utf-8')
+            self.flush()
+            if self.file is not None:
+                self.file.close()
+            self.path = path
+            self.file = stream
+    
+    def debug(self, source, args, ending='\n'):
+        '''Log the debug message made of `args`, from the module named `source`, if debug
+        logging is enabled. A message with an empty `ending` is continued by the next one.
+        '''
+        if self.debug_enabled:
+            self.put((DEBUG, source, snapshot(args), ending, time.time()))
+    
+    def info(self, source, args, ending='\n'):
+        '''Log the message made of `args`, from the module named `source`.'''
+        self.put((INFO, source, snapshot(args), ending, time.time()))
+    
+    def put(self, record):
+        '''Queue `record` for the writer thread, starting it on first use.'''
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name='scraper-log',
+                                                   daemon=True)
+                    self.thread.start()
+        self.queue.put(record)
+    
+    def flush(self):
+        '''Wait until every record queued so far has been written.'''
+        if self.thread is None or not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+    
+    def close(self):
+        '''Write the remaining records and stop the writer thread.'''
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+    
+    def run(self):
+        '''Writer thread: take records off the queue in batches and write each batch at once.'''
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            events = []
+            for record in batch:
+                if record is None:
+                    stop = True
+                elif isinstance(record, threading.Event):
+                    events.append(record)
+                else:
+                    try:
+                        lines.append(self.format(record))
+                    except Exception as error:  # pylint: disable=broad-except
+                        # A record that can not be formatted must not stop the writer.
+                        lines.append('Error: could not format a log record: {!r}\n'.format(error))
+            if lines:
+                stream = self.file or sys.stdout
+                try:
+                    stream.write(''.join(lines))
+                    stream.flush()
+                except (OSError, ValueError):
+                    pass
+            for event in events:
+                event.set()
+            if stop:
+                return
+    
+    def format(self, record):
+        '''Format `record` as a line of text, or as a JSON line.'''
+        level, source, args, ending, created = record
+        message = format_args(args)
+        if self.json_lines:
+            return json.dumps({'time': created, 'level': level, 'source': source,
+                               'message': message}) + '\n'
+        if level == INFO:
+            return message + ending
+        prefix = ''
+        if self.line_start:
+            prefix = '{:>{spacing}} {} | '.format('({})'.format(self.counter), source,
+                                                  spacing=self.spacing)
+            self.counter += 1
+        self.line_start = ending != ''
+        return prefix + message + ending
+
+
+LOGGER = Logger()
+atexit.register(LOGGER.close)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+'''Metadata is the metadata file kept in the output directory (option -od). It records the ETag,
+Last-Modified date, size, and saved path of every resource fetched, and the links found on every
+page and stylesheet, so that the next run of the same job can revalidate resources with
+conditional requests instead of downloading them again.
+
+   usage:
+       >>> from scrapers.Metadata import Metadata
+       >>> metadata = Metadata('scraper-metadata.sqlite')
+       >>> record = metadata.get('http://example.com/img.png')
+       >>> headers = metadata.conditional_headers(record)
+'''
+
+import collections
+import os
+import sqlite3
+import time
+
+try:
+    from scrapers.Frontier import canonicalize_url
+except ImportError:
+    from Frontier import canonicalize_url
+
+
+MetadataRecord = collections.namedtuple('MetadataRecord',
+                                        'url etag last_modified size content_type path fetched')
+
+
+class Metadata:
+    """SQLite-backed record of the validators of fetched resources."""
+    
+    commit_every = 256
+    
+    def __init__(self, path, commit_every=None):
+        self.path = path
+        if commit_every is not None:
+            self.commit_every = commit_every
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS resources (
+                               url TEXT PRIMARY KEY,
+                               etag TEXT,
+                               last_modified TEXT,
+                               size INTEGER,
+                               content_type TEXT,
+                               path TEXT,
+                               fetched REAL)''')
+        self.db.execute('CREATE TABLE IF NOT EXISTS links (page TEXT NOT NULL, '
+                        "link TEXT NOT NULL, kind TEXT NOT NULL DEFAULT 'page')")
+        try:
+            # Metadata files written before the kind of each link was recorded only hold page
+            # links, which the default describes.
+            self.db.execute("ALTER TABLE links ADD COLUMN kind TEXT NOT NULL DEFAULT 'page'")
+        except sqlite3.OperationalError:
+            pass
+        self.db.execute('CREATE INDEX IF NOT EXISTS links_page ON links (page)')
+        self.uncommitted = 0
+    
+    def get(self, url):
+        '''Return the `MetadataRecord` of `url`, or None if it has not been fetched before.'''
+        row = self.db.execute('SELECT url, etag, last_modified, size, content_type, path, fetched '
+                              'FROM resources WHERE url = ?', (canonicalize_url(url),)).fetchone()
+        return MetadataRecord(*row) if row else None
+    
+    @staticmethod
+    def conditional_headers(record):
+        '''Return the If-None-Match and If-Modified-Since headers to revalidate `record` with.
+        Nothing is revalidated if the file saved for it has since been removed.
+        '''
+        headers = {}
+        if record is None or (record.path and not os.path.exists(record.path)):
+            return headers
+        if record.etag:
+            headers['If-None-Match'] = record.etag
+        if record.last_modified:
+            headers['If-Modified-Since'] = record.last_modified
+        return headers
+    
+    @staticmethod
+    def is_unchanged(record, response):
+        '''Return True if `response` shows that the resource of `record` has not changed since
+        it was saved: either a 304, or a 200 with the recorded size and no differing ETag.
+        '''
+        if record is None or (record.path and not os.path.exists(record.path)):
+            return False
+        if response.status == 304:
+            return True
+        if response.status != 200 or record.size is None:
+            return False
+        etag = response.headers.get('etag')
+        if etag and record.etag and etag != record.etag:
+            return False
+        return response.content_length == record.size
+    
+    def update(self, url, response, path=None, size=None):
+        '''Record the validators of `response`, fetched from `url` and saved at `path`.'''
+        if size is None:
+            size = response.content_length
+        self.db.execute('INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (canonicalize_url(url), response.headers.get('etag'),
+                         response.headers.get('last-modified'), size, response.content_type,
+                         path and os.path.abspath(path), time.time()))
+        self.tick()
+    
+    def update_file(self, url, stat, path):
+        '''Record the local file at `url`, whose `os.stat_result` is `stat`, as saved at `path`.
+        The modification time in nanoseconds stands in for the Last-Modified date.
+        '''
+        self.db.execute('INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (canonicalize_url(url), None, str(stat.st_mtime_ns), stat.st_size, None,
+                         os.path.abspath(path), time.time()))
+        self.tick()
+    
+    @staticmethod
+    def is_file_unchanged(record, stat):
+        '''Return True if the local file of `record`, whose `os.stat_result` is now `stat`, has
+        the size and modification time it had when it was saved.
+        '''
+        if record is None or not record.path or not os.path.exists(record.path):
+            return False
+        return record.size == stat.st_size and record.last_modified == str(stat.st_mtime_ns)
+    
+    def get_links(self, page):
+        '''Return the (url, kind) tuples of the links recorded for `page`.'''
+        rows = self.db.execute('SELECT link, kind FROM links WHERE page = ? ORDER BY rowid',
+                               (canonicalize_url(page),))
+        return [tuple(row) for row in rows]
+    
+    def set_links(self, page, links):
+        '''Record the (url, kind) tuples of the links found on `page`, a page or a stylesheet,
+        replacing those recorded before.
+        '''
+        page = canonicalize_url(page)
+        self.db.execute('DELETE FROM links WHERE page = ?', (page,))
+        self.db.executemany('INSERT INTO links (page, link, kind) VALUES (?, ?, ?)',
+                            ((page, link, kind) for link, kind in dict.fromkeys(links)))
+        self.tick()
+    
+    def tick(self):
+        '''Commit once enough changes have accumulated.'''
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+    
+    def commit(self):
+        '''Commit the changes made so far.'''
+        self.db.commit()
+        self.uncommitted = 0
+    
+    def close(self):
+        '''Commit and close the metadata file.'''
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+'''Metrics records where a scraper run spends its time, per host: counters (requests, bytes,
+retries, responses by status, results by reason, links found) and latency histograms (connect,
+time to first byte, transfer, page parsing, disk write, resize). Recording is a dict update, plus
+a bisect into a fixed list of exponential buckets for histograms. Nothing is formatted until the
+summary of option --stats is printed, or a JSON or Prometheus text snapshot is dumped with option
+--stats-file.
+
+   usage:
+       >>> from scrapers.Metrics import Metrics
+       >>> metrics = Metrics()
+       >>> metrics.count('requests', 'example.com')
+       >>> metrics.observe('ttfb', 'example.com', 0.120)
+       >>> print('\\n'.join(metrics.summary()))
+       >>> metrics.dump('scraper.prom', 'prometheus')
+'''
+
+import bisect
+import collections
+import json
+import os
+import tempfile
+import time
+
+
+BUCKETS = tuple(0.0005 * 2 ** exponent for exponent in range(18))
+
+HISTOGRAMS = ('connect', 'ttfb', 'transfer', 'parse', 'write', 'resize')
+
+
+class Histogram:
+    """Latency histogram with fixed exponential buckets, from 0.5 ms to about 65 s."""
+    
+    __slots__ = ('counts', 'count', 'sum', 'max')
+    
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, value):
+        '''Record the duration `value`, in seconds.'''
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+    
+    def merge(self, other):
+        '''Add the observations of the histogram `other`.'''
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+    
+    def quantile(self, q):
+        '''Estimate the `q` quantile (0 to 1) by interpolating within its bucket.'''
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = BUCKETS[index - 1] if index else 0.0
+                high = BUCKETS[index] if index < len(BUCKETS) else self.max
+                return min(self.max, low + (high - low) * (rank - seen) / count)
+            seen += count
+        return self.max
+    
+    def as_dict(self):
+        '''Return the histogram as a JSON serializable dict.'''
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95),
+                'buckets': dict(zip([str(bound) for bound in BUCKETS] + ['+Inf'],
+                                    self.counts))}
+
+
+class Metrics:
+    """Per-host counters and latency histograms of a scraper run."""
+    
+    def __init__(self):
+        self.started = time.time()
+        self.clock = time.monotonic()
+        self.counters = collections.Counter()
+        self.histograms = collections.defaultdict(Histogram)
+    
+    def count(self, name, host='', reason='', amount=1):
+        '''Add `amount` to the counter `name` of `host`, broken down by `reason` if given.'''
+        self.counters[(name, host or '', reason)] += amount
+    
+    def observe(self, name, host, seconds):
+        '''Record the duration `seconds` in the histogram `name` of `host`.'''
+        self.histograms[(name, host or '')].observe(seconds)
+    
+    def merge(self, other):
+        '''Add the counters and histograms of the `Metrics` `other`, such as those recorded by a
+        worker process of option -b.
+        '''
+        self.counters.update(other.counters)
+        for key, histogram in other.histograms.items():
+            self.histograms[key].merge(histogram)
+    
+    def hosts(self):
+        '''Return the sorted hosts seen so far.'''
+        return sorted({key[1] for key in self.counters} | {key[1] for key in self.histograms})
+    
+    def summary(self):
+        '''Return the lines of a human readable summary of the run, one per host.'''
+        elapsed = time.monotonic() - self.clock
+        totals = collections.Counter()
+        for (name, _, _), value in self.counters.items():
+            totals[name] += value
+        lines = ['Stats: {:.1f}s, {} requests, {} retries, {:.1f} MB'.format(
+            elapsed, totals['requests'], totals['retries'], totals['bytes'] / 2 ** 20)]
+        for host in self.hosts():
+            parts = ['{} requests'.format(self.counters[('requests', host, '')]),
+                     '{:.1f} MB'.format(self.counters[('bytes', host, '')] / 2 ** 20)]
+            for name in HISTOGRAMS:
+                histogram = self.histograms.get((name, host))
+                if histogram is not None and histogram.count:
+                    parts.append('{} p50 {:.1f}ms p95 {:.1f}ms'.format(
+                        name, histogram.quantile(0.5) * 1000, histogram.quantile(0.95) * 1000))
+            reasons = ['{} {}'.format(reason, value) for (name, key, reason), value
+                       in sorted(self.counters.items()) if key == host and name == 'results']
+            if reasons:
+                parts.append('results: ' + ', '.join(reasons))
+            lines.append('  {}: {}'.format(host or 'local', '; '.join(parts)))
+        return lines
+    
+    def as_json(self):
+        '''Return a snapshot of every metric as a JSON string.'''
+        return json.dumps({
+            'time': time.time(),
+            'started': self.started,
+            'elapsed': time.monotonic() - self.clock,
+            'counters': [{'name': name, 'host': host, 'reason': reason, 'value': value}
+                         for (name, host, reason), value in sorted(self.counters.items())],
+            'histograms': [dict(histogram.as_dict(), name=name, host=host)
+                           for (name, host), histogram in sorted(self.histograms.items())],
+        })
+    
+    def as_prometheus(self):
+        '''Return a snapshot of every metric in the Prometheus text exposition format.'''
+        lines = []
+        typed = set()
+        for (name, host, reason), value in sorted(self.counters.items()):
+            metric = 'scraper_{}_total'.format(name)
+            if metric not in typed:
+                typed.add(metric)
+                lines.append('# TYPE {} counter'.format(metric))
+            labels = 'host="{}"'.format(escape(host))
+            if reason:
+                labels += ',reason="{}"'.format(escape(reason))
+            lines.append('{}{{{}}} {}'.format(metric, labels, value))
+        for (name, host), histogram in sorted(self.histograms.items()):
+            metric = 'scraper_{}_seconds'.format(name)
+            if metric not in typed:
+                typed.add(metric)
+                lines.append('# TYPE {} histogram'.format(metric))
+            labels = 'host="{}"'.format(escape(host))
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels, bound,
+                                                                 cumulative))
+            lines.append('{}_sum{{{}}} {}'.format(metric, labels, histogram.sum))
+            lines.append('{}_count{{{}}} {}'.format(metric, labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+    
+    def dump(self, path, stats_format='json'):
+        '''Write a snapshot to `path` as JSON or Prometheus text, replacing the file atomically
+        so that a collector never reads half of it.
+        '''
+        data = self.as_prometheus() if stats_format == 'prometheus' else self.as_json() + '\n'
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.stats', suffix='.part')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def escape(value):
+    '''Escape `value` for use as a Prometheus label value.'''
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
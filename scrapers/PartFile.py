@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+'''PartFile is a download in progress. The body is written to a `.part` file in the data
+directory and renamed into place atomically once complete, so a saved name never holds a
+truncated file. Each download writes to a locked `.part` file of its own, so that downloads of
+the same URL running at once never share one. A JSON sidecar named after the URL records the name
+of the part, the URL, the validator of the response (its ETag, else its Last-Modified date), and
+how many bytes of the body are safely on disk. It is rewritten at checkpoints, after the part has
+been flushed to disk. When a run dies partway through a large download, the next run finds the
+part through the sidecar, claims it by locking and renaming it, and asks for the rest of the body
+with a Range request. The server only honours it while the validator still matches. Parts of the
+URL that no sidecar vouches for and no download holds, such as those of a run killed before its
+first checkpoint, are removed when a new part of the URL is created.
+
+   usage:
+       >>> from scrapers.PartFile import PartFile
+       >>> part = PartFile.find('images', url) or PartFile('images', url)
+       >>> response = await fetcher.get(url, headers=part.range_headers())
+       >>> part.open(response)
+       >>> async for chunk in response.iter_chunks():
+       >>>     part.write(chunk)
+       >>> part.commit('images/img.png')
+'''
+
+import hashlib
+import json
+import os
+import re
+from urllib.parse import unquote, urlsplit
+
+try:
+    from scrapers.FilenameTemplate import sanitize_name
+except ImportError:
+    from FilenameTemplate import sanitize_name
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-')
+
+
+def lock(fd):
+    '''Take an exclusive lock on the open file `fd`, which is held until it is closed, without
+    waiting. Returns False if another download holds it.
+    '''
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def remove_stale(path):
+    '''Remove the part at `path`, unless a download holds it. Returns True if it is gone.'''
+    try:
+        fd = open(path, 'rb')
+    except FileNotFoundError:
+        return True
+    except OSError:
+        return False
+    try:
+        if not lock(fd):
+            return False
+        if fcntl is None:
+            # Without locks, the removal of a part another download has open fails instead.
+            fd.close()
+        os.unlink(path)
+    except OSError:
+        return False
+    finally:
+        fd.close()
+    return True
+
+
+class PartFile:
+    """The `.part` file and sidecar of the download of `url` into `data_dir`. The body is hashed
+    as it is written, for the dedup store.
+    """
+    
+    checkpoint_size = 2 ** 20
+    
+    def __init__(self, data_dir, url):
+        self.url = url
+        self.data_dir = data_dir
+        name = sanitize_name(os.path.basename(unquote(urlsplit(url).path))) or 'index'
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        name = name.encode('utf-8')[:64].decode('utf-8', 'ignore')
+        self.prefix = '{}.{}.'.format(name, digest)
+        self.sidecar = os.path.join(data_dir, self.prefix + 'part.json')
+        self.path = None
+        self.validator = None
+        self.offset = 0
+        self.saved = 0
+        self.hash = None
+        self.fd = None
+    
+    @classmethod
+    def find(cls, data_dir, url):
+        '''Return the `PartFile` an earlier run left behind for `url`, if its sidecar records a
+        validator and no more bytes than the part holds, and no other download has it open. The
+        part is claimed by locking it and renaming it to a name of its own, so that when two
+        downloads of `url` look for it at once only one of them resumes it. Returns None
+        otherwise.
+        '''
+        part = cls(data_dir, url)
+        state = part.read_state()
+        # Sidecars written before parts had names of their own lack the name of the part.
+        name = state.get('part') or os.path.basename(part.sidecar)[:-len('.json')]
+        offset = state.get('offset')
+        if state.get('url') != url or not state.get('validator') or \
+                not isinstance(offset, int) or not isinstance(name, str) or \
+                os.path.basename(name) != name:
+            return None
+        path = os.path.join(data_dir, name)
+        try:
+            fd = open(path, 'r+b')
+        except OSError:
+            return None
+        if not lock(fd) or not 0 < offset <= os.fstat(fd.fileno()).st_size:
+            fd.close()
+            return None
+        try:
+            part.reserve()
+        except OSError:
+            fd.close()
+            return None
+        try:
+            os.replace(path, part.path)
+        except OSError:
+            fd.close()
+            part.discard()
+            return None
+        # The reserved file was replaced by the claimed part.
+        part.fd.close()
+        part.fd = fd
+        part.validator = state['validator']
+        part.offset = part.saved = offset
+        try:
+            part.write_state()
+        except OSError:
+            pass
+        return part
+    
+    def read_state(self):
+        '''Return the dict recorded in the sidecar, or an empty dict if there is none.'''
+        try:
+            with open(self.sidecar, encoding='utf-8') as fd:
+                state = json.load(fd)
+        except (OSError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+    
+    def write_state(self):
+        '''Record the part and how much of it is on disk in the sidecar. The sidecar is
+        replaced atomically, so it is never seen half written.
+        '''
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fd:
+            json.dump({'url': self.url, 'part': os.path.basename(self.path),
+                       'validator': self.validator, 'offset': self.saved}, fd)
+        os.replace(tmp_path, self.sidecar)
+    
+    def reserve(self):
+        '''Create an empty `.part` file of a name no other download uses, and open it locked for
+        writing. Returns its path. Parts are numbered after the prefix of the URL; those that
+        the sidecar does not name and no download holds are stale, and are removed to reuse
+        their name.
+        '''
+        live = self.read_state().get('part')
+        index = 0
+        while True:
+            name = '{}{}.part'.format(self.prefix, index)
+            path = os.path.join(self.data_dir, name)
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            except FileExistsError:
+                if name == live or not remove_stale(path):
+                    index += 1
+                continue
+            self.fd = os.fdopen(fd, 'wb')
+            # A stale sweep may have taken the file between its creation and its lock.
+            try:
+                held = lock(self.fd) and \
+                    os.path.samestat(os.stat(path), os.fstat(self.fd.fileno()))
+            except FileNotFoundError:
+                held = False
+            if held:
+                self.path = path
+                return path
+            self.fd.close()
+            self.fd = None
+    
+    @staticmethod
+    def get_validator(response):
+        '''Return the validator `response` may be resumed with: its ETag, unless it is weak, as
+        If-Range only accepts strong ones, else its Last-Modified date. None if it has neither.
+        '''
+        etag = response.headers.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return response.headers.get('last-modified')
+    
+    def range_headers(self):
+        '''Return the headers asking for the rest of the body, if it has not changed.'''
+        if not self.offset:
+            return {}
+        return {'Range': 'bytes={}-'.format(self.offset), 'If-Range': self.validator}
+    
+    def resumes(self, response):
+        '''Return True if `response` carries the rest of the body from the end of the part: a
+        206 whose Content-Range starts at its offset. A 200 means the resource changed, or that
+        the server ignores ranges, and the part has to start over.
+        '''
+        if response.status != 206:
+            return False
+        match = CONTENT_RANGE.match(response.headers.get('content-range', '').strip())
+        return match is not None and int(match.group(1)) == self.offset
+    
+    def head(self, size):
+        '''Return up to `size` leading bytes of the body already in the part.'''
+        with open(self.path, 'rb') as fd:
+            return fd.read(min(size, self.offset))
+    
+    def open(self, response=None):
+        '''Open the part for writing. A resumed part is cut back to the bytes the sidecar vouches
+        for, and writing continues after them; otherwise the part starts empty, taking its
+        validator from `response`. The part stays locked while it is open.
+        '''
+        self.hash = hashlib.sha256()
+        if self.offset:
+            self.fd.seek(0)
+            remaining = self.offset
+            while remaining:
+                chunk = self.fd.read(min(remaining, self.checkpoint_size))
+                if not chunk:
+                    raise OSError('{} is shorter than its sidecar records'.format(self.path))
+                self.hash.update(chunk)
+                remaining -= len(chunk)
+            self.fd.truncate(self.offset)
+            self.fd.seek(self.offset)
+        else:
+            self.reserve()
+            self.validator = self.get_validator(response) if response is not None else None
+    
+    def write(self, data):
+        '''Write and hash the next bytes of the body, checkpointing every `checkpoint_size`.'''
+        self.fd.write(data)
+        self.hash.update(data)
+        self.offset += len(data)
+        if self.validator and self.offset - self.saved >= self.checkpoint_size:
+            self.checkpoint()
+    
+    def checkpoint(self):
+        '''Flush the part to disk, then record in the sidecar how much of it is there.'''
+        self.fd.flush()
+        os.fsync(self.fd.fileno())
+        self.saved = self.offset
+        self.write_state()
+    
+    def close(self):
+        '''Close the complete part. Returns the hex SHA-256 digest of the body, or None if it
+        was not written through `write()`.
+        '''
+        self.fd.close()
+        self.fd = None
+        return self.hash.hexdigest() if self.hash is not None else None
+    
+    def commit(self, path):
+        '''Close the complete part and rename it to `path` atomically, replacing the empty file
+        that reserved the name. Returns the hex SHA-256 digest of the body, as `close()` does.
+        '''
+        digest = self.close()
+        os.replace(self.path, path)
+        self.remove_sidecar()
+        return digest
+    
+    def suspend(self):
+        '''Keep what was written for a later run, after the download failed. A part that can not
+        be resumed, for lack of a validator or of any bytes, is discarded instead.
+        '''
+        if self.fd is None:
+            return
+        if not self.validator or not self.offset:
+            self.discard()
+            return
+        try:
+            self.checkpoint()
+        except OSError:
+            pass
+        self.fd.close()
+        self.fd = None
+    
+    def discard(self):
+        '''Throw the part and its sidecar away.'''
+        if self.fd is not None:
+            try:
+                self.fd.close()
+            except OSError:
+                # Closing flushes what is buffered, which fails again after a failed write.
+                pass
+            self.fd = None
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.remove_sidecar()
+        self.offset = self.saved = 0
+    
+    def remove_sidecar(self):
+        '''Remove the sidecar of a part that has been moved into place or discarded, unless
+        another download of the same URL has since recorded its own part in it.
+        '''
+        if self.read_state().get('part') != os.path.basename(self.path):
+            return
+        try:
+            os.unlink(self.sidecar)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+'''Profiler implements option --profile. The run is split into phases at fixed boundaries:
+argument parsing, then scraping (discovery and fetching are interleaved by the download engine,
+so they share a phase and are told apart by function in the profile), then post-processing (the
+wait for resizing and the final reports). Each phase is profiled on its own:
+
+    full:   cProfile data, written as a `.pstats` file per phase, plus the top allocations
+            of each phase from tracemalloc snapshots taken at its boundaries.
+    sample: a background thread samples the stack of the main thread every few milliseconds,
+            written as folded stacks (the input format of flame graph tools) per phase, plus
+            the functions most often on the stack. Cheap enough to leave on in production.
+
+Only the main thread is profiled, which is where the event loop of the scraper runs. The files
+are written to option -od/--output-dir, with a summary of every phase in `<prefix>-summary.txt`.
+
+   usage:
+       >>> from scrapers.Profiler import Profiler
+       >>> profiler = Profiler(mode='full')
+       >>> profiler.start('arguments')
+       >>> profiler.start('scrape')
+       >>> profiler.close(output_dir='.')
+       ['./profile-20171229-120000-4242-1-arguments.pstats', ...]
+'''
+
+import collections
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+FULL = 'full'
+SAMPLE = 'sample'
+MODES = (FULL, SAMPLE)
+
+
+def take_snapshot():
+    '''Take a tracemalloc snapshot, leaving out the memory used by tracemalloc itself.'''
+    return tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),))
+
+
+def max_rss():
+    '''Return the peak resident set size of the process in kilobytes, or None if unknown.'''
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Sampler(threading.Thread):
+    """Background thread counting the stacks of the thread `ident` every `interval` seconds."""
+    
+    def __init__(self, ident, interval):
+        super().__init__(name='scraper-profile', daemon=True)
+        self.target = ident
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+    
+    def run(self):
+        '''Take samples until `stop()` is called.'''
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)  # pylint: disable=protected-access
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+    
+    def stop(self):
+        '''Stop sampling and wait for the thread to exit.'''
+        self.stopped.set()
+        self.join()
+
+
+class Phase:
+    """The data collected for one phase of the run."""
+    
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.profile = None
+        self.sampler = None
+        self.snapshot = None
+        self.allocations = []
+        self.peak = None
+        self.max_rss = None
+
+
+class Profiler:
+    """Per-phase cProfile and tracemalloc profiler, or stack sampler, for option --profile."""
+    
+    def __init__(self, mode=FULL, top=20, interval=0.005):
+        if mode not in MODES:
+            raise ValueError('Unknown profile mode: {!r}'.format(mode))
+        self.mode = mode
+        self.top = top
+        self.interval = interval
+        self.output_dir = None
+        self.prefix = 'profile-{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+        self.phases = []
+        self.current = None
+        self.closed = False
+    
+    def start(self, name):
+        '''End the current phase, if any, and start profiling the phase `name`.'''
+        if self.closed:
+            return
+        self.stop()
+        phase = Phase(len(self.phases) + 1, name)
+        if self.mode == SAMPLE:
+            phase.sampler = Sampler(threading.main_thread().ident, self.interval)
+            phase.sampler.start()
+        else:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            phase.snapshot = take_snapshot()
+            phase.profile = cProfile.Profile()
+            phase.profile.enable()
+        self.phases.append(phase)
+        self.current = phase
+    
+    def stop(self):
+        '''End the current phase.'''
+        phase = self.current
+        if phase is None:
+            return
+        self.current = None
+        if phase.sampler is not None:
+            phase.sampler.stop()
+        if phase.profile is not None:
+            phase.profile.disable()
+            phase.allocations = take_snapshot().compare_to(phase.snapshot, 'lineno')[:self.top]
+            phase.peak = tracemalloc.get_traced_memory()[1]
+            phase.snapshot = None
+        phase.elapsed = time.perf_counter() - phase.started
+        phase.max_rss = max_rss()
+    
+    def close(self, output_dir=None):
+        '''End the current phase and write the profile of every phase to `output_dir`, or to
+        `self.output_dir`, or the current working directory. Returns the paths written.
+        '''
+        if self.closed:
+            return []
+        self.stop()
+        self.closed = True
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        output_dir = output_dir or self.output_dir or os.getcwd()
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        summary = ['Profile ({} mode) of {}'.format(self.mode, ' '.join(sys.argv))]
+        for phase in self.phases:
+            base = os.path.join(output_dir, '{}-{}-{}'.format(self.prefix, phase.index,
+                                                              phase.name))
+            summary.append('')
+            summary.append('Phase {} {}: {:.3f}s, peak RSS {} kB'.format(
+                phase.index, phase.name, phase.elapsed, phase.max_rss))
+            if phase.profile is not None:
+                paths.append(base + '.pstats')
+                phase.profile.dump_stats(paths[-1])
+                summary.extend(self.summarize_profile(phase))
+            if phase.sampler is not None:
+                paths.append(base + '.folded')
+                with open(paths[-1], 'w', encoding='utf-8') as fd:
+                    for stack, count in phase.sampler.stacks.most_common():
+                        fd.write('{} {}\n'.format(stack, count))
+                summary.extend(self.summarize_samples(phase))
+        paths.append(os.path.join(output_dir, self.prefix + '-summary.txt'))
+        with open(paths[-1], 'w', encoding='utf-8') as fd:
+            fd.write('\n'.join(summary) + '\n')
+        return paths
+    
+    def summarize_profile(self, phase):
+        '''Return the summary lines of a phase profiled in full mode: the functions with the
+        highest cumulative time, and the lines that allocated the most memory.
+        '''
+        stream = io.StringIO()
+        stats = pstats.Stats(phase.profile, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        lines = [line for line in stream.getvalue().splitlines()
+                 if line.strip() and not line.startswith(('   Ordered', '   List reduced'))]
+        lines.append('Top {} allocations (peak traced {} kB):'.format(
+            len(phase.allocations), (phase.peak or 0) // 1024))
+        lines.extend('  {}'.format(stat) for stat in phase.allocations)
+        return lines
+    
+    def summarize_samples(self, phase):
+        '''Return the summary lines of a phase profiled in sample mode: the functions that were
+        on the stack in the most samples, with the share of samples they were on the top in.
+        '''
+        stacks = phase.sampler.stacks
+        total = sum(stacks.values())
+        if not total:
+            return ['No samples']
+        inclusive = collections.Counter()
+        own = collections.Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            for frame in set(frames):
+                inclusive[frame] += count
+            own[frames[-1]] += count
+        lines = ['{} samples every {:.0f} ms; on stack / on top:'.format(total,
+                                                                        self.interval * 1000)]
+        for frame, count in inclusive.most_common(self.top):
+            lines.append('  {:6.1%} {:6.1%}  {}'.format(count / total, own[frame] / total, frame))
+        return lines
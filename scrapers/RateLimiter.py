@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+'''RateLimiter implements option -rl/--rate-limit: a token bucket shared by every transfer of the
+scraper, plus optional per-host buckets. Transfers are metered chunk by chunk, each chunk
+reserving its bytes and sleeping until the reservation falls due, so that many parallel streams
+stay smooth instead of bursting. Everything runs on the event loop, so no lock is taken.
+
+   usage:
+       >>> from scrapers.RateLimiter import RateLimiter, parse_rate
+       >>> limiter = RateLimiter(parse_rate('256k'))
+       >>> await limiter.consume('example.com', len(chunk))
+'''
+
+import asyncio
+import time
+
+
+UNITS = {'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(value):
+    '''Parse a rate such as `512`, `256k`, `1.5m`, or `1g` into bytes per second. Returns None
+    for an empty value.
+    '''
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value.endswith('/s'):
+        value = value[:-2]
+    multiplier = UNITS.get(value[-1:])
+    if multiplier is not None:
+        value = value[:-1]
+    try:
+        rate = float(value) * (multiplier or 1)
+    except ValueError:
+        raise ValueError('Invalid rate: {!r}'.format(value))
+    if rate <= 0:
+        raise ValueError('Rate must be positive: {!r}'.format(value))
+    return rate
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations. A reservation larger than the tokens available
+    puts the bucket into debt, and the caller waits for the debt to be repaid."""
+    
+    def __init__(self, rate, burst=0.1):
+        self.rate = rate
+        self.capacity = rate * burst
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+    
+    def reserve(self, amount):
+        '''Take `amount` tokens and return the number of seconds to wait before using them.'''
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate) - amount
+        self.last = now
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Overall and per-host byte rate limits shared by all concurrent transfers."""
+    
+    def __init__(self, rate=None, host_rate=None):
+        self.rate = rate
+        self.host_rate = host_rate
+        self.bucket = TokenBucket(rate) if rate else None
+        self.hosts = {}
+    
+    @property
+    def active(self):
+        '''True if any limit is set.'''
+        return bool(self.rate or self.host_rate)
+    
+    def chunk_size(self, default):
+        '''Return the read size to use so that each chunk is a small slice of the budget.'''
+        rates = [rate for rate in (self.rate, self.host_rate) if rate]
+        if not rates:
+            return default
+        return max(1024, min(default, int(min(rates) / 20)))
+    
+    async def consume(self, host, amount):
+        '''Account for `amount` bytes transferred from `host`, sleeping as long as needed to stay
+        within the limits.
+        '''
+        delay = 0.0
+        if self.bucket is not None:
+            delay = self.bucket.reserve(amount)
+        if self.host_rate:
+            bucket = self.hosts.get(host)
+            if bucket is None:
+                bucket = self.hosts[host] = TokenBucket(self.host_rate)
+            delay = max(delay, bucket.reserve(amount))
+        if delay > 0:
+            await asyncio.sleep(delay)
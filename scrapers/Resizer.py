@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+'''Resizer implements options -re/--resize and -nr/--no-ratio. Saved images are handed to a pool
+of worker processes, so that decoding and resampling run on every core instead of contending for
+the GIL with the downloads. The queue in front of the pool is bounded: when resizing falls behind,
+`submit()` blocks and the downloads feeding it pause. Resizing requires Pillow.
+
+   usage:
+       >>> from scrapers.Resizer import Resizer, parse_size
+       >>> resizer = Resizer(parse_size('640x480'))
+       >>> await resizer.submit('images/img.jpg')
+       >>> await resizer.join()
+       >>> resizer.close()
+'''
+
+import asyncio
+import os
+import re
+import tempfile
+import time
+from concurrent import futures
+
+
+SIZE = re.compile(r'^\s*(\d+)\s*[xX]\s*(\d+)\s*$')
+
+
+def parse_size(value):
+    '''Parse a size such as `640x480` into a (width, height) tuple. Returns None for an empty
+    value.
+    '''
+    if not value:
+        return None
+    match = SIZE.match(value)
+    if match is None or not all(int(group) for group in match.groups()):
+        raise ValueError('Invalid size, expected XxY: {!r}'.format(value))
+    return int(match.group(1)), int(match.group(2))
+
+
+def load_pillow():
+    '''Import and return the `PIL.Image` module, or None if Pillow is not installed. Pillow is
+    only imported once an image is resized, to keep it out of the startup time of the scraper.
+    '''
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def fit_size(source, target, keep_ratio=True):
+    '''Return the size to resize an image of size `source` to, for the target size `target`. With
+    `keep_ratio`, the image is scaled to fit within `target` keeping its aspect ratio.
+    '''
+    if not keep_ratio:
+        return target
+    scale = min(target[0] / source[0], target[1] / source[1])
+    return max(1, round(source[0] * scale)), max(1, round(source[1] * scale))
+
+
+def resize_image(path, size, keep_ratio=True, draft=True):
+    '''Resize the image file at `path` to `size` in place, replacing it atomically with a file of
+    the same format. Returns the (old size, new size) tuple, or None if the image already has the
+    requested size, is animated, or is in a format Pillow cannot read, such as SVG.
+    
+    JPEGs much larger than the target are decoded at a reduced scale (draft mode), which skips
+    most of the work of decoding pixels that resampling would throw away.
+    '''
+    Image = load_pillow()  # pylint: disable=invalid-name
+    try:
+        image = Image.open(path)
+    except Image.UnidentifiedImageError:
+        return None
+    with image:
+        original = image.size
+        if getattr(image, 'is_animated', False):
+            return None
+        target = fit_size(original, size, keep_ratio)
+        if target == original:
+            return None
+        image_format = image.format
+        if draft and image_format == 'JPEG':
+            image.draft(image.mode, target)
+        resized = image.resize(target, Image.LANCZOS)
+        info = {key: value for key, value in image.info.items()
+                if key in ('dpi', 'icc_profile', 'transparency')}
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + name, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            resized.save(tmp, format=image_format, **info)
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return original, target
+
+
+class Resizer:
+    """Bounded queue of saved images feeding a pool of resizing worker processes."""
+    
+    def __init__(self, size, keep_ratio=True, workers=None, queue_size=None, draft=True,
+                 on_done=None, metrics=None):
+        self.size = size
+        self.keep_ratio = keep_ratio
+        self.draft = draft
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size or self.workers * 4
+        self.on_done = on_done
+        self.metrics = metrics
+        self.executor = None
+        self.slots = None
+        self.pending = set()
+    
+    @staticmethod
+    def available():
+        '''True if Pillow is installed.'''
+        return load_pillow() is not None
+    
+    async def submit(self, path):
+        '''Queue the image at `path` for resizing. Blocks while the queue is full.'''
+        if self.executor is None:
+            self.executor = futures.ProcessPoolExecutor(max_workers=self.workers)
+            self.slots = asyncio.Semaphore(self.queue_size)
+        await self.slots.acquire()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, resize_image, path, self.size,
+                                      self.keep_ratio, self.draft)
+        self.pending.add(future)
+        started = time.monotonic()
+        future.add_done_callback(lambda done: self.finished(path, done, started))
+    
+    def finished(self, path, future, started=None):
+        '''Release the queue slot of the resize of `path` and report the outcome. The time from
+        `started`, when it was queued, is recorded in the metrics.
+        '''
+        self.pending.discard(future)
+        self.slots.release()
+        if self.metrics is not None and started is not None:
+            self.metrics.observe('resize', '', time.monotonic() - started)
+        if self.on_done is not None and not future.cancelled():
+            self.on_done(path, future.result() if future.exception() is None else None,
+                         future.exception())
+    
+    async def join(self):
+        '''Wait until every queued image has been resized.'''
+        while self.pending:
+            await asyncio.wait(list(self.pending))
+    
+    def close(self):
+        '''Shut the worker processes down.'''
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+'''ResourceExtractor finds the image, stylesheet, and page links of an HTML document while it is
+still being downloaded. Chunks are fed to it as they arrive from the socket and the links found
+in each chunk are handed back straight away, so image downloads overlap with the transfer of the
+page. No DOM is built; only the unparsed tail of the last chunk is kept in memory.
+
+   usage:
+       >>> from scrapers.ResourceExtractor import ResourceExtractor
+       >>> extractor = ResourceExtractor('http://example.com/')
+       >>> for chunk in chunks:
+       >>>     for url, kind in extractor.feed(chunk):
+       >>>         print(kind, url)
+       >>> extractor.close()
+'''
+
+import codecs
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+
+PAGE = 'page'
+IMAGE = 'image'
+STYLESHEET = 'css'
+
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpg', '.jpeg', '.png', '.svg', '.psd', '.xcf', '.webp')
+META_IMAGES = ('og:image', 'og:image:url', 'og:image:secure_url', 'twitter:image',
+               'twitter:image:src')
+SCHEMES = ('http', 'https', 'ftp', 'ftps', 'sftp')
+
+CSS_URL = re.compile(r'''(@import\s+)?url\(\s*(['"]?)([^'")]+?)\2\s*\)|@import\s+(['"])(.+?)\4''',
+                     re.IGNORECASE)
+
+
+def parse_srcset(value):
+    '''Return the URLs of the image candidates in a `srcset` attribute, in order.'''
+    urls = []
+    position = 0
+    length = len(value)
+    while position < length:
+        while position < length and (value[position].isspace() or value[position] == ','):
+            position += 1
+        start = position
+        while position < length and not value[position].isspace():
+            position += 1
+        url = value[start:position]
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            comma = value.find(',', position)
+            position = length if comma == -1 else comma + 1
+        if url:
+            urls.append(url)
+    return urls
+
+
+class CssExtractor:
+    """Streaming extractor of the `url()` and `@import` references of a stylesheet."""
+    
+    max_carry = 65536
+    
+    def __init__(self, url, charset='utf-8'):
+        self.url = url
+        self.carry = ''
+        try:
+            self.decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+        except LookupError:
+            self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    
+    def feed(self, text):
+        '''Parse the next piece of the stylesheet, bytes or str. Returns a list of (url, kind)
+        tuples, kind being IMAGE for `url()` references and STYLESHEET for `@import`s.
+        '''
+        if isinstance(text, bytes):
+            text = self.decoder.decode(text)
+        text = self.carry + text
+        links = []
+        end = 0
+        for match in CSS_URL.finditer(text):
+            if match.group(3):
+                link = resolve(self.url, match.group(3))
+                kind = STYLESHEET if match.group(1) else IMAGE
+            else:
+                link = resolve(self.url, match.group(5))
+                kind = STYLESHEET
+            if link:
+                links.append((link, kind))
+            end = match.end()
+        tail = text[end:]
+        lowered = tail.lower()
+        cut = lowered.rfind('url(')
+        imported = lowered.rfind('@import')
+        if imported != -1 and (imported > cut or not lowered[imported + 7:cut].strip()):
+            cut = imported
+        self.carry = tail[cut:] if cut != -1 else tail[-8:]
+        if len(self.carry) > self.max_carry:
+            self.carry = ''
+        return links
+    
+    def close(self):
+        '''Parse whatever was held back from the last piece.'''
+        links = self.feed(self.decoder.decode(b'', final=True))
+        self.carry = ''
+        return links
+
+
+def resolve(base, link):
+    '''Resolve `link` against `base`, returning None for links that cannot be fetched, such as
+    `data:` or `javascript:` URIs.
+    '''
+    link = link.strip()
+    if not link or link.startswith('#'):
+        return None
+    url = urljoin(base, link)
+    if urlsplit(url).scheme not in SCHEMES:
+        return None
+    return url.split('#', 1)[0]
+
+
+class ResourceExtractor(HTMLParser):
+    """Incremental HTML parser that extracts image candidates from `img src`, `srcset`,
+    `picture/source`, `og:image` meta tags, inline `style` backgrounds, `style` elements and
+    linked stylesheets, along with the page links to recurse into."""
+    
+    def __init__(self, url, charset='utf-8'):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        try:
+            self.decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+        except LookupError:
+            self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.found = []
+        self.style = None
+    
+    def feed(self, data):  # pylint: disable=arguments-differ
+        '''Parse the next chunk of the document, bytes or str. Returns the list of (url, kind)
+        tuples found in it, kind being one of PAGE, IMAGE, or STYLESHEET.
+        '''
+        if isinstance(data, bytes):
+            data = self.decoder.decode(data)
+        super().feed(data)
+        return self.take()
+    
+    def close(self):
+        '''Parse whatever is left of the document. Returns the last links found.'''
+        super().feed(self.decoder.decode(b'', final=True))
+        super().close()
+        if self.style is not None:
+            self.found.extend(self.style.close())
+        return self.take()
+    
+    def take(self):
+        '''Return and forget the links found since the last call.'''
+        found, self.found = self.found, []
+        return found
+    
+    def add(self, link, kind):
+        '''Resolve `link` and remember it as found.'''
+        url = resolve(self.url, link or '')
+        if url:
+            if kind == PAGE and urlsplit(url).path.lower().endswith(IMAGE_EXTENSIONS):
+                kind = IMAGE
+            self.found.append((url, kind))
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'base' and attrs.get('href'):
+            self.url = urljoin(self.url, attrs['href'])
+        elif tag in ('a', 'area'):
+            self.add(attrs.get('href'), PAGE)
+        elif tag in ('frame', 'iframe'):
+            self.add(attrs.get('src'), PAGE)
+        elif tag == 'img':
+            self.add(attrs.get('src'), IMAGE)
+            for link in parse_srcset(attrs.get('srcset') or ''):
+                self.add(link, IMAGE)
+        elif tag == 'source':
+            for link in parse_srcset(attrs.get('srcset') or ''):
+                self.add(link, IMAGE)
+        elif tag == 'video':
+            self.add(attrs.get('poster'), IMAGE)
+        elif tag == 'input' and (attrs.get('type') or '').lower() == 'image':
+            self.add(attrs.get('src'), IMAGE)
+        elif tag == 'meta':
+            name = (attrs.get('property') or attrs.get('name') or '').lower()
+            if name in META_IMAGES:
+                self.add(attrs.get('content'), IMAGE)
+        elif tag == 'link':
+            rel = (attrs.get('rel') or '').lower().split()
+            if 'stylesheet' in rel:
+                self.add(attrs.get('href'), STYLESHEET)
+            elif 'image_src' in rel or 'icon' in rel or 'apple-touch-icon' in rel:
+                self.add(attrs.get('href'), IMAGE)
+        elif tag == 'style':
+            self.style = CssExtractor(self.url)
+        if attrs.get('style'):
+            css = CssExtractor(self.url)
+            self.found.extend(css.feed(attrs['style']) + css.close())
+    
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag == 'style':
+            self.style = None
+    
+    def handle_endtag(self, tag):
+        if tag == 'style' and self.style is not None:
+            self.found.extend(self.style.close())
+            self.style = None
+    
+    def handle_data(self, data):
+        if self.style is not None:
+            self.found.extend(self.style.feed(data))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+'''ResultSink collects one `Result` record per resource handled by a scraper (its URL, outcome,
+saved path, size, and timing) and hands them to a target in batches, once enough have been
+buffered or a timer runs out, instead of writing and flushing a line per resource. Targets are
+pluggable: `LogTarget` writes the familiar text lines through `LOGGER` (so options -ol and -lj
+apply), `TextTarget` and `JsonLinesTarget` write to any file-like object, and `BinaryTarget`
+writes a compact binary log that `read_binary()` decodes.
+
+   usage:
+       >>> from scrapers.ResultSink import Result, ResultSink, JsonLinesTarget
+       >>> sink = ResultSink(JsonLinesTarget(open('results.jsonl', 'w')))
+       >>> sink.add(Result('http://example.com/img.png', 'saved', 'img.png', 1024, 0.0, 0.2))
+       >>> sink.close()
+'''
+
+import asyncio
+import collections
+import json
+import struct
+import sys
+import time
+
+try:
+    from scrapers.Logger import LOGGER
+except ImportError:
+    from Logger import LOGGER
+
+
+Result = collections.namedtuple('Result', 'url status path size started elapsed detail')
+Result.__new__.__defaults__ = (None, None, None, None, None)
+
+STATUSES = ('saved', 'linked', 'unchanged', 'skipped', 'rejected', 'filtered', 'error', 'resized')
+
+TEXT_FORMATS = {
+    'saved': 'Saved: {url} -> {path}',
+    'linked': 'Linked: {url} -> {path}',
+    'unchanged': 'Unchanged: {url}',
+    'skipped': 'Skipped [{detail}]: {url}',
+    'rejected': 'Rejected {detail}: {url}',
+    'filtered': 'Filtered [{detail}]: {url}',
+    'error': 'Error: {detail}',
+    'resized': 'Resized {detail}: {path}',
+}
+
+BINARY_MAGIC = b'SCRAPER-RESULTS\x01'
+BINARY_HEADER = struct.Struct('<BdfqHHH')
+
+
+def format_text(result):
+    '''Return the text line of `result`, without a line ending.'''
+    return TEXT_FORMATS.get(result.status, '{status}: {url}').format(**result._asdict())
+
+
+class LogTarget:
+    """Writes results as text lines through `LOGGER`, to stdout or the file of option -ol."""
+    
+    def __init__(self, source):
+        self.source = source
+    
+    def write_batch(self, results):
+        '''Write `results`.'''
+        for result in results:
+            LOGGER.info(self.source, (format_text(result),))
+    
+    def close(self):
+        '''Nothing to close; `LOGGER` is shut down at exit.'''
+
+
+class TextTarget:
+    """Writes results as text lines to a file-like object, one write per batch."""
+    
+    def __init__(self, stream):
+        self.stream = stream
+    
+    def write_batch(self, results):
+        '''Write `results`.'''
+        self.stream.write(''.join(format_text(result) + '\n' for result in results))
+        self.stream.flush()
+    
+    def close(self):
+        '''Close the stream, unless it is stdout.'''
+        if self.stream is sys.stdout:
+            self.stream.flush()
+        else:
+            self.stream.close()
+
+
+class JsonLinesTarget(TextTarget):
+    """Writes results as JSON lines to a file-like object, one write per batch. A detail that
+    is not JSON, such as the exception of an error, is written as its string.
+    """
+    
+    def write_batch(self, results):
+        '''Write `results`.'''
+        self.stream.write(''.join(json.dumps(result._asdict(), default=str) + '\n'
+                                  for result in results))
+        self.stream.flush()
+
+
+class BinaryTarget:
+    """Writes results to a binary file-like object as compact fixed-header records."""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        if not stream.seekable() or stream.tell() == 0:
+            stream.write(BINARY_MAGIC)
+    
+    def write_batch(self, results):
+        '''Write `results`.'''
+        chunks = []
+        for result in results:
+            url = (result.url or '').encode('utf-8')[:65535]
+            path = (result.path or '').encode('utf-8')[:65535]
+            detail = str(result.detail if result.detail is not None else '')
+            detail = detail.encode('utf-8')[:65535]
+            chunks.append(BINARY_HEADER.pack(
+                STATUSES.index(result.status) if result.status in STATUSES else 255,
+                result.started or 0.0, result.elapsed or 0.0,
+                -1 if result.size is None else result.size, len(url), len(path), len(detail)))
+            chunks.extend((url, path, detail))
+        self.stream.write(b''.join(chunks))
+        self.stream.flush()
+    
+    def close(self):
+        '''Close the stream.'''
+        self.stream.close()
+
+
+def read_binary(stream):
+    '''Iterate over the `Result` records of a binary log written by `BinaryTarget`.'''
+    if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError('Not a binary result log')
+    while True:
+        header = stream.read(BINARY_HEADER.size)
+        if len(header) < BINARY_HEADER.size:
+            return
+        status, started, elapsed, size, url, path, detail = BINARY_HEADER.unpack(header)
+        url, path, detail = (stream.read(length).decode('utf-8') for length in (url, path, detail))
+        yield Result(url or None, STATUSES[status] if status < len(STATUSES) else 'unknown',
+                     path or None, None if size < 0 else size, started, elapsed, detail or None)
+
+
+class ResultSink:
+    """Buffer of `Result` records flushed to a target in batches or on a timer."""
+    
+    def __init__(self, target, batch_size=256, interval=1.0):
+        self.target = target
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer = []
+        self.flushed = time.monotonic()
+        self.counts = collections.Counter()
+    
+    def add(self, result):
+        '''Buffer `result`, flushing if the batch is full or the timer has run out.'''
+        self.buffer.append(result)
+        self.counts[result.status] += 1
+        if len(self.buffer) >= self.batch_size or \
+                time.monotonic() - self.flushed >= self.interval:
+            self.flush()
+    
+    def flush(self):
+        '''Write the buffered results to the target.'''
+        self.flushed = time.monotonic()
+        if self.buffer:
+            batch, self.buffer = self.buffer, []
+            self.target.write_batch(batch)
+    
+    async def run_timer(self):
+        '''Coroutine that flushes the sink every `interval` seconds until cancelled, so that
+        results do not sit in the buffer while the scraper is busy elsewhere.
+        '''
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+    
+    def close(self):
+        '''Flush and close the target.'''
+        self.flush()
+        self.target.close()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+'''Scheduler implements the politeness options -s/--sleep and -w/--wait and the per-URI download
+limit of option -l/--limit. Delays are kept as a "not before" time per host instead of sleeping in
+line, so a host that is being waited on never holds up the downloads from other hosts. A URI
+resource may have a limit of its own, such as one given in the file of option -b. The `FairGate`
+hands download slots out to the URI resources of a job in turn.
+
+   usage:
+       >>> from scrapers.Scheduler import Scheduler
+       >>> scheduler = Scheduler(wait=2.0, limit=100)
+       >>> await scheduler.wait_turn('http://example.com/img.png', depth=1)
+'''
+
+import asyncio
+import collections
+import heapq
+import itertools
+import random
+import time
+from urllib.parse import urlsplit
+
+
+class FairGate:
+    """Bounds the number of concurrent holders like a semaphore, but hands freed slots to the
+    waiting keys in turn, so that one key with many waiters cannot starve the others."""
+    
+    def __init__(self, size):
+        self.free = max(1, size)
+        self.waiters = collections.OrderedDict()
+    
+    async def acquire(self, key):
+        '''Wait for a slot on behalf of `key`.'''
+        if self.free > 0 and not self.waiters:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, collections.deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                queue = self.waiters.get(key)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self.waiters[key]
+            raise
+    
+    def release(self):
+        '''Give a slot back, handing it to the next key in turn if any are waiting.'''
+        while self.waiters:
+            key, queue = self.waiters.popitem(last=False)
+            future = queue.popleft()
+            if queue:
+                self.waiters[key] = queue
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+    
+    def slot(self, key):
+        '''Return an async context manager holding a slot for `key`.'''
+        return _GateSlot(self, key)
+
+
+class _GateSlot:
+    """Async context manager returned by `FairGate.slot()`."""
+    
+    def __init__(self, gate, key):
+        self.gate = gate
+        self.key = key
+    
+    async def __aenter__(self):
+        await self.gate.acquire(self.key)
+    
+    async def __aexit__(self, *exc_info):
+        self.gate.release()
+
+
+class Scheduler:
+    """Per-host politeness delays and per-URI download limits shared by every worker of a job."""
+    
+    max_deferred = 1024
+    
+    def __init__(self, sleep=None, wait=None, limit=None, limits=None):
+        self.sleep = sleep
+        self.wait = wait
+        self.limit = limit
+        self.limits = limits or {}
+        self.not_before = {}
+        self.levels = {}
+        self.deferred = []
+        self.sequence = itertools.count()
+        self.claimed = collections.Counter()
+        self.saved = collections.Counter()
+        self.changed = None
+    
+    def reserve(self, url, depth=0):
+        '''Reserve the next turn of the host of `url`, for a resource at `depth` levels below its
+        URI resource. Returns the `time.monotonic()` time at which the resource may be fetched.
+        
+        Each turn pushes the next one back by a random wait of up to option -w seconds; the first
+        resource of a deeper level also sleeps up to option -s seconds.
+        '''
+        host = urlsplit(url).netloc.lower()
+        now = time.monotonic()
+        due = max(now, self.not_before.get(host, now))
+        level = self.levels.setdefault(host, depth)
+        if depth > level:
+            self.levels[host] = depth
+            if self.sleep:
+                due += random.uniform(0, self.sleep)
+        self.not_before[host] = due + (random.uniform(0, self.wait) if self.wait else 0.0)
+        return due
+    
+    async def wait_turn(self, url, depth=0):
+        '''Reserve the next turn of the host of `url` and sleep until it comes.'''
+        delay = self.reserve(url, depth) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    def defer(self, item, due):
+        '''Hold `item` back until `due`, a `time.monotonic()` time.'''
+        heapq.heappush(self.deferred, (due, next(self.sequence), item))
+    
+    def pop_due(self):
+        '''Return the deferred item that has been due the longest, or None.'''
+        if self.deferred and self.deferred[0][0] <= time.monotonic():
+            return heapq.heappop(self.deferred)[2]
+        return None
+    
+    def next_due(self):
+        '''Return the seconds until the next deferred item is due, or None if none are held.'''
+        if not self.deferred:
+            return None
+        return max(0.0, self.deferred[0][0] - time.monotonic())
+    
+    @property
+    def full(self):
+        '''True if no more items should be deferred until some fall due.'''
+        return len(self.deferred) >= self.max_deferred
+    
+    def limit_of(self, root):
+        '''Return the download limit of the URI resource `root`: its own limit in `limits`, if
+        it has one, else the limit of option -l. None means no limit.
+        '''
+        return self.limits.get(root, self.limit)
+    
+    def exhausted(self, root):
+        '''True if the URI resource `root` has used up its download limit.'''
+        limit = self.limit_of(root)
+        return limit is not None and self.saved[root] >= limit
+    
+    async def claim(self, root):
+        '''Claim one download of the limit of `root`. Returns False if the limit is used up. While
+        the downloads in flight could use up the limit, waits to see whether they do.
+        '''
+        limit = None if root is None else self.limit_of(root)
+        if limit is None:
+            return True
+        if self.changed is None:
+            self.changed = asyncio.Condition()
+        async with self.changed:
+            while True:
+                if self.saved[root] >= limit:
+                    return False
+                if self.saved[root] + self.claimed[root] < limit:
+                    self.claimed[root] += 1
+                    return True
+                await self.changed.wait()
+    
+    async def release(self, root, saved):
+        '''Settle a download claimed with `claim()`, counting it against the limit if `saved`.'''
+        if root is None or self.limit_of(root) is None:
+            return
+        async with self.changed:
+            self.claimed[root] -= 1
+            if saved:
+                self.saved[root] += 1
+            self.changed.notify_all()
@@ -11,44 +11,82 @@
 
 import os
 import sys
-import imp
-from pprint import pformat
 import argparse
+import importlib
 
 try:
     from scrapers import SALC
+    from scrapers.Logger import LOGGER
 except ImportError:
     from . import SALC
+    from .Logger import LOGGER
 
 
-SCRAPERS = ( 
-    'scrapers.GenericScraper.GenericScraper',
-    'scrapers.TumblrScraper.TumblrScraper',
-    'scrapers.TwitterScraper.TwitterScraper',
-)
-
-def import_from_dotted_path(dotted_names, path=None):
-    """ import_from_dotted_path('foo.bar') -> from foo import bar; return bar """
-    next_module, remaining_names = dotted_names.split('.', 1)
-    fp, pathname, description = imp.find_module(next_module, path)
-    module = imp.load_module(next_module, fp, pathname, description)
-    if hasattr(module, remaining_names):
-        return getattr(module, remaining_names)
-    if '.' not in remaining_names:
-        return module
-    return import_from_dotted_path(remaining_names, path=module.__path__)
-
-def get_scraper_names():
-    '''Return a 2-tuple of scraper names as a list and scraper names as a string. Uses SCRAPERS
-    attribute of this module to walk through. String is formatted like "name1 | name2 | name3".
-    The names as a string is used in command line help.
+# Registry of scraper name to the `module:ClassName` path of its class and its command line help.
+# Nothing is imported until a scraper is chosen.
+SCRAPERS = {
+    'generic': ('scrapers.GenericScraper:GenericScraper',
+                'Invoke the generic scraper to scrape images off of any URI resource. This is a '
+                'general scraper and may not grab every image.'),
+    'tumblr': ('scrapers.TumblrScraper:TumblrScraper',
+               'Invoke the tumblr scraper to scrape images off of tumblr.com'),
+    'twitter': ('scrapers.TwitterScraper:TwitterScraper',
+                'Invoke the twitter scraper to scrape images off of twitter.com'),
+}
+
+# Installed packages may register more scrapers under this entry point group, as
+# `name = package.module:ClassName`.
+ENTRY_POINT_GROUP = 'scraper.scrapers'
+
+_plugins = None
+
+
+def get_plugins():
+    '''Return a dict of scraper name to (`module:ClassName`, help) for the scrapers registered
+    by installed packages under ENTRY_POINT_GROUP. Looked up once, and only when needed, since
+    scanning the installed packages is slow.
+    '''
+    global _plugins  # pylint: disable=global-statement
+    if _plugins is None:
+        _plugins = {}
+        try:
+            from importlib.metadata import entry_points
+            found = entry_points(group=ENTRY_POINT_GROUP)
+        except (ImportError, TypeError):
+            found = ()
+        for entry_point in found:
+            if entry_point.name not in SCRAPERS:
+                _plugins[entry_point.name] = (entry_point.value,
+                                              'Invoke the {} scraper.'.format(entry_point.name))
+    return _plugins
+
+
+def get_registry(name=None):
+    '''Return the dict of scraper name to (`module:ClassName`, help). Plugins are only looked up
+    if `name` is not one of the built-in scrapers.
+    '''
+    if name in SCRAPERS:
+        return SCRAPERS
+    registry = dict(SCRAPERS)
+    registry.update(get_plugins())
+    return registry
+
+
+def load_scraper(name):
+    '''Import and return the class of the scraper registered as `name`, importing nothing else.
+    Raises KeyError for an unknown name.
+    '''
+    module_name, _, class_name = get_registry(name)[name][0].partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def get_scraper_names(name=None):
+    '''Return a 2-tuple of scraper names as a list and scraper names as a string. The names are
+    those of the registry, with the plugins unless `name` is one of the built-in scrapers. String
+    is formatted like "name1 | name2 | name3". The names as a string is used in command line help.
     '''
-    names = []
-    names_str = ' [ {} ]'
-    for scraper in SCRAPERS:
-        cls = import_from_dotted_path(scraper)
-        names.append(cls.name)
-    names_str = names_str.format(' | '.join(names))
+    names = list(get_registry(name))
+    names_str = ' [ {} ]'.format(' | '.join(names))
     return names, names_str
 
 
@@ -58,8 +96,7 @@ class Scraper:
     args = None
     kwargs = None
     debug = False
-    log_counter = 1
-    log_spacing = 8
+    filename = os.path.basename(__file__)
     name = 'scraper'
     scrapers = None
     parser = None
@@ -67,7 +104,6 @@ class Scraper:
     options = None
     stdout = sys.stdout
     driver = None
-    log_ending = '\n'
     prog = None
     
     def __init__(self, driver):
@@ -82,35 +118,12 @@ class Scraper:
         self.log('self.parse_args:', self.parse_args)
         self.log('self.options:', self.options)
     
-    def log(self, *args, ending='\n', flush=True):
-        '''Log the messages provided by args. If DEBUG is True, this method will print out the
-        messages provided by args onto stdout.
+    def log(self, *args, ending='\n', flush=True):  # pylint: disable=unused-argument
+        '''Log the messages provided by args. If DEBUG is True, the messages are formatted and
+        written out by the background writer of `LOGGER`; otherwise nothing is done at all.
         '''
-        if not self.debug:
-            return
-        if self.log_ending != '':
-            filename = os.path.basename(__file__)
-            print('{:>{spacing}} {} | ' \
-                  .format('({})'.format(self.log_counter), filename, spacing=self.log_spacing),
-                  end='', flush=flush)
-        end = ending
-        self.log_ending = ending
-        spacer = ''
-        for arg in args:
-            try:
-                if isinstance(arg, (list, tuple, dict)):
-                    printed = pformat(arg)
-                    print('{}{}'.format(spacer, printed), end='', flush=flush)
-                else:
-                    print('{}{}'.format(spacer, arg), end='', flush=flush)
-            except:
-                printed = pformat(arg)
-                print('{}{}'.format(spacer, printed), end='', flush=flush)
-            if spacer == '':
-                spacer = ' '
-        print('', end=end, flush=True)
-        if self.log_ending != '':
-            self.log_counter += 1
+        if self.debug:
+            LOGGER.debug(self.filename, args, ending)
     
     def parse_arguments(self):
         '''Parse the arguments as supplied by args. args is passed into python's
@@ -125,7 +138,7 @@ class Scraper:
         if self.name == 'scraper':
             parse_args = parse_args[0:1]
         
-        scraper_names, scraper_names_str = get_scraper_names()
+        scraper_names, scraper_names_str = get_scraper_names(parse_args[0] if parse_args else None)
         del scraper_names
         
         self.parser = argparse.ArgumentParser(prog=self.prog,
@@ -155,47 +168,50 @@ examples:
                                        ' from one of {}.'.format(scraper_names_str)))
         self.parser.add_argument('--debug', action='store_true',
                                  help=('Set this flag to display debug information.'))
+        self.parser.add_argument('--profile', action='store_const', const='full',
+                                 dest='profile',
+                                 help=('Profile the run with cProfile and tracemalloc.'))
+        self.parser.add_argument('--profile-sample', action='store_const', const='sample',
+                                 dest='profile',
+                                 help=('Profile the run with a low overhead stack sampler.'))
         
         options = self.parser.parse_args(parse_args).__dict__
         if options.get('scraper') != 'scraper':
-            self.get_subparsers()
-        options = self.parser.parse_args(parse_args).__dict__
+            self.get_subparsers(options.get('scraper'))
+            options = self.parser.parse_args(parse_args).__dict__
         options['debug'] = self.debug
         return parse_args, options
-        
-    def get_subparsers(self):
-        '''Load each scraper template class into self.scrapers dictionary, then add the subparser
-        to the class.
+    
+    def get_subparsers(self, name=None):
+        '''Add a subparser for each registered scraper, from the names and help texts of the
+        registry, without importing any of them. Plugins are only looked up if `name` is not one
+        of the built-in scrapers.
         '''
         self.log('>>>> in get_subparsers()')
-        self.log('SCRAPERS:', SCRAPERS)
-        if SCRAPERS:
-            subparsers = self.parser.add_subparsers(dest='scraper',
-                                                    description=('Description text goes here...'),
-                                                    help=('Invoke a particular scraper designed '
-                                                          'for specific URI resources.'))
-            self.log('subparsers:', subparsers)
-        for scraper in SCRAPERS:
-            self.log('Importing {}... '.format(scraper), ending='')
-            cls = import_from_dotted_path(scraper)
-            self.scrapers.update({scraper: cls})
-            self.log('Done! Imported {}'.format(cls))
-            cls.sub_parser(subparsers)
+        registry = get_registry(name)
+        self.log('registry:', registry)
+        subparsers = self.parser.add_subparsers(dest='scraper',
+                                                description=('Description text goes here...'),
+                                                help=('Invoke a particular scraper designed '
+                                                      'for specific URI resources.'))
+        self.log('subparsers:', subparsers)
+        for scraper, (path, help_text) in registry.items():
+            self.scrapers[scraper] = path
+            subparsers.add_parser(scraper, help=help_text)
         self.log('self.scrapers:', self.scrapers)
         self.log('>>>> end get_subparsers()')
     
     def get_scraper_class(self):
-        '''Get the class of one of the scrapers as defined by the 'scraper' option in SCRAPERS.
+        '''Get the class of one of the scrapers as defined by the 'scraper' option, importing only
+        that scraper's module.
         '''
         self.log('<<<< In get_scraper_class()')
         self.log('self.options = ', self.options)
         scraper = self.options.get('scraper')
-        if scraper == 'generic':
-            scraper_class = self.scrapers.get('scrapers.GenericScraper.GenericScraper')
-        elif scraper == 'tumblr':
-            scraper_class = self.scrapers.get('scrapers.TumblrScraper.TumblrScraper')
-        elif scraper == 'twitter':
-            scraper_class = self.scrapers.get('scrapers.TwitterScraper.TwitterScraper')
+        if scraper in self.scrapers:
+            self.log('Importing {}... '.format(self.scrapers[scraper]), ending='')
+            scraper_class = load_scraper(scraper)
+            self.log('Done! Imported {}'.format(scraper_class))
         else:
             scraper_class = self.__class__
         scraper_class.prog = self.args[0] + ' ' + scraper
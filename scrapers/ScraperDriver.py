@@ -9,8 +9,13 @@
        >>> scraper = Scraper(driver, *args)
 '''
 
+import atexit
 import os
-from pprint import pformat
+
+try:
+    from scrapers.Logger import LOGGER
+except ImportError:
+    from Logger import LOGGER
 
 
 class ScraperDriver:
@@ -20,40 +25,39 @@ class ScraperDriver:
     args = None
     kwargs = None
     debug = False
-    log_counter = 1
-    log_spacing = 4
+    profiler = None
+    filename = os.path.basename(__file__)
     
     def __init__(self, *args, **kwargs):
         self.args = args
         self.kwargs = kwargs
         if '--debug' in args:
             self.debug = True
+        if 'job' in kwargs:
+            # The driver of a job of option --daemon leaves the logger and profiler of the
+            # daemon process alone.
+            return
+        LOGGER.configure(debug=self.debug)
+        if '--profile' in args or '--profile-sample' in args:
+            self.start_profiler('sample' if '--profile-sample' in args else 'full')
     
-    def log(self, *args, ending='\n', flush=True):
-        '''Log the messages provided by args. If DEBUG is True, this method will print out the
-        messages provided by args onto stdout.
+    def start_profiler(self, mode):
+        '''Start profiling the run for option --profile (or --profile-sample), beginning with the
+        argument parsing phase. The profiler is only imported when one of the options is set. If
+        the scraper does not close the profiler itself, it is closed at exit.
         '''
-        if self.debug is False:
-            return
-        filename = os.path.basename(__file__)
-        print('{:>{spacing}} {} | '.format('({})'.format(self.log_counter),
-                                           filename,
-                                           spacing=self.log_spacing),
-              end='',
-              flush=flush)
-        end = ending
-        spacer = ''
-        for arg in args:
-            try:
-                if isinstance(arg, (list, tuple, dict)):
-                        printed = pformat(arg)
-                        print('{}{}'.format(spacer, printed), end='', flush=flush)
-                else:
-                    print('{}{}'.format(spacer, arg), end='', flush=flush)
-            except:
-                printed = pformat(arg)
-                print('{}{}'.format(spacer, printed), end='', flush=flush)
-            if spacer == '':
-                spacer = ' '
-        print('', end=end, flush=True)
-        self.log_counter += 1
+        try:
+            from scrapers.Profiler import Profiler
+        except ImportError:
+            from Profiler import Profiler
+        self.profiler = Profiler(mode=mode)
+        self.profiler.start('arguments')
+        atexit.register(self.profiler.close)
+    
+    def log(self, *args, ending='\n', flush=True):  # pylint: disable=unused-argument
+        '''Log the messages provided by args. If DEBUG is True, the messages are formatted and
+        written out by the background writer of `LOGGER`; otherwise nothing is done at all.
+        `flush` is accepted for compatibility; records are flushed in batches.
+        '''
+        if self.debug:
+            LOGGER.debug(self.filename, args, ending)
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+
+'''SftpSource scrapes images out of a directory tree on an SSH server, over SFTP. A single SSH
+connection is opened and authenticated per server, and every listing and transfer runs on one of
+a pool of SFTP channels multiplexed over it, so the key exchange and the login are paid once per
+server rather than once per file. Large files are read with many read requests in flight at
+once, rather than one round trip per 32 KiB. With option -r the subdirectories are listed in
+parallel, each on a channel of its own. ssh URIs are scraped the same way. With a
+`RateLimiter`, the reads of a transfer are only requested once the limiter grants their bytes, so
+that the limits hold on the network and not just on the disk. Requires paramiko.
+
+   usage:
+       >>> from scrapers.SftpSource import SftpSource
+       >>> source = SftpSource('sftp', 'ssh.example.com', 22, username='me', workers=8)
+       >>> async for files in source.walk('/srv/images'):
+       >>>     for path, stat in files:
+       >>>         async with source.slot:
+       >>>             transfer = await source.run(source.retrieve, path, None, stat.st_size)
+       >>>             await source.run(transfer.save, 'images/copy.png')
+       >>> source.close()
+'''
+
+import asyncio
+import collections
+import getpass
+import posixpath
+import stat as stat_module
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_PORTS = {'sftp': 22, 'ssh': 22}
+
+# The size and modification time of an SFTP file, named after the `os.stat_result` fields the
+# metadata file reads.
+SftpStat = collections.namedtuple('SftpStat', 'st_size st_mtime st_mtime_ns')
+
+
+def load_paramiko():
+    '''Import and return the `paramiko` package, or None if it is not installed. paramiko is only
+    imported once an sftp or ssh URI is scraped, to keep it out of the startup time of the
+    scraper.
+    '''
+    try:
+        import paramiko
+    except ImportError:
+        return None
+    return paramiko
+
+
+def make_stat(attributes):
+    '''Return the `SftpStat` of the paramiko `SFTPAttributes` `attributes`.'''
+    modified = attributes.st_mtime or 0
+    return SftpStat(attributes.st_size or 0, modified, int(modified) * 10 ** 9)
+
+
+class SftpError(Exception):
+    """Raised when a file or directory cannot be read from the server."""
+
+
+class Transfer:
+    """A file being read on a channel of an `SftpSource`. The leading bytes read so far are in
+    `head`; the transfer must be saved or aborted to give the channel back.
+    """
+    
+    def __init__(self, source, sftp, fd, size, head):
+        self.source = source
+        self.sftp = sftp
+        self.fd = fd
+        self.size = size
+        self.head = head
+    
+    def save(self, path):
+        '''Write the whole file to `path`. Returns the number of bytes written.'''
+        paramiko = self.source.paramiko
+        size = len(self.head)
+        try:
+            with open(path, 'wb') as fd:
+                fd.write(self.head)
+                if self.source.limiter is not None:
+                    size += self.save_metered(fd)
+                elif self.size is not None and self.size - size > self.fd.MAX_REQUEST_SIZE:
+                    # Queue read requests for the rest of the file at once, up to the window of
+                    # the channel, rather than waiting for each reply before the next request.
+                    self.fd.prefetch(self.size)
+                while True:
+                    chunk = self.fd.read(self.source.chunk_size)
+                    if not chunk:
+                        break
+                    self.source.consume(len(chunk))
+                    fd.write(chunk)
+                    size += len(chunk)
+            self.finish()
+        except (OSError, EOFError, paramiko.SSHException) as error:
+            self.abort()
+            raise SftpError(str(error)) from error
+        return size
+    
+    def save_metered(self, fd):
+        '''Write the file, up to its listed size, to the local file `fd`, a chunk at a time. The
+        reads of each chunk are requested together once the rate limiter has granted its bytes.
+        Returns the number of bytes written. The remote file is left positioned after them.
+        '''
+        offset = start = self.fd.tell()
+        step = self.fd.MAX_REQUEST_SIZE
+        while self.size is not None and offset < self.size:
+            end = min(offset + self.source.chunk_size, self.size)
+            self.source.consume(end - offset)
+            received = 0
+            for data in self.fd.readv([(position, min(step, end - position))
+                                       for position in range(offset, end, step)]):
+                fd.write(data)
+                received += len(data)
+            offset += received
+            if offset < end:
+                # The file is shorter than it was listed; the reads that follow find its end.
+                break
+        self.fd.seek(offset)
+        return offset - start
+    
+    def finish(self):
+        '''Close the remote file and hand the channel back.'''
+        self.fd.close()
+        self.fd = None
+        self.source.release(self.sftp)
+        self.sftp = None
+    
+    def abort(self):
+        '''Stop the transfer. The channel is handed back if the remote file could be closed, and
+        dropped otherwise.
+        '''
+        if self.sftp is None:
+            return
+        try:
+            self.fd.close()
+        except (OSError, EOFError, self.source.paramiko.SSHException):
+            self.source.discard(self.sftp)
+        else:
+            self.source.release(self.sftp)
+        self.fd = None
+        self.sftp = None
+
+
+class SftpSource:
+    """One SSH session to a server with a pool of SFTP channels over it, and a parallel directory
+    walker.
+    """
+    
+    chunk_size = 65536
+    window_size = 2 ** 24
+    
+    def __init__(self, scheme, host, port=None, username=None, password=None, cert_file=None,
+                 workers=8, accept_name=None, timeout=60.0, limiter=None):
+        self.paramiko = load_paramiko()
+        self.scheme = scheme
+        self.host = host
+        self.port = port or DEFAULT_PORTS[scheme]
+        self.username = username or getpass.getuser()
+        self.password = password
+        self.cert_file = cert_file
+        self.timeout = timeout
+        self.accept_name = accept_name
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix='scraper-sftp')
+        self._slot = None
+        self.client = None
+        self.connecting = threading.RLock()
+        self.lock = threading.Condition()
+        self.idle = []
+        self.channels = 0
+        self.max_channels = self.workers
+        self.sessions = 0
+        self.error = None
+        self.limiter = limiter
+        self.loop = None
+        if limiter is not None:
+            self.chunk_size = limiter.chunk_size(self.chunk_size)
+    
+    @property
+    def slot(self):
+        '''Semaphore bounding the number of channels in use at once to `workers`: it is held by
+        every listing, and by every transfer from its start until it is saved or aborted.
+        Created lazily so that it belongs to the running event loop.
+        '''
+        if self._slot is None:
+            self._slot = asyncio.Semaphore(self.workers)
+        return self._slot
+    
+    async def run(self, function, *args):
+        '''Run `function(*args)` on the thread pool of the source and return its result.'''
+        self.loop = asyncio.get_running_loop()
+        return await self.loop.run_in_executor(self.executor, function, *args)
+    
+    def consume(self, amount):
+        '''Account for `amount` bytes transferred, blocking the calling thread of the pool as long
+        as the rate limiter requires. Does nothing without one.
+        '''
+        if self.limiter is not None:
+            asyncio.run_coroutine_threadsafe(self.limiter.consume(self.host, amount),
+                                             self.loop).result()
+    
+    def url(self, path):
+        '''Return the URL of the file at `path` on the server, without credentials.'''
+        netloc = self.host if ':' not in self.host else '[{}]'.format(self.host)
+        if self.port != DEFAULT_PORTS[self.scheme]:
+            netloc += ':{}'.format(self.port)
+        return '{}://{}{}'.format(self.scheme, netloc, path)
+    
+    def session(self):
+        '''Return the transport of the SSH session to the server, connecting and authenticating
+        first if there is none yet, or if the last one was dropped. Threads that need the session
+        while it is being set up wait for it. A failed login is not attempted again, so that a
+        wrong password is only sent once. Raises SftpError.
+        '''
+        with self.connecting:
+            if self.error is not None:
+                raise self.error
+            if self.client is not None:
+                transport = self.client.get_transport()
+                if transport is not None and transport.is_active():
+                    return transport
+                self.client.close()
+                self.client = None
+            paramiko = self.paramiko
+            client = paramiko.SSHClient()
+            # Like ssh, only servers whose host key is known are trusted.
+            client.load_system_host_keys()
+            client.set_missing_host_key_policy(paramiko.RejectPolicy())
+            explicit = bool(self.cert_file or self.password)
+            try:
+                client.connect(self.host, self.port, username=self.username,
+                               password=self.password, key_filename=self.cert_file,
+                               timeout=self.timeout, banner_timeout=self.timeout,
+                               auth_timeout=self.timeout, allow_agent=not explicit,
+                               look_for_keys=not explicit)
+            except (OSError, EOFError, paramiko.SSHException) as error:
+                client.close()
+                self.error = SftpError('Could not log in to {}:{}: {}'.format(
+                    self.host, self.port, error))
+                raise self.error
+            transport = client.get_transport()
+            transport.set_keepalive(30)
+            self.client = client
+            self.sessions += 1
+            return transport
+    
+    def open_channel(self):
+        '''Open a new SFTP channel on the SSH session. Raises SftpError, or the ChannelException
+        of paramiko if the server refuses another channel. Channels are opened one at a time, as
+        paramiko keeps the reason a channel was refused in the transport, where the refusals of
+        concurrent requests overwrite each other.
+        '''
+        with self.connecting:
+            transport = self.session()
+            try:
+                return self.paramiko.SFTPClient.from_transport(transport,
+                                                               window_size=self.window_size)
+            except self.paramiko.ChannelException:
+                raise
+            except (OSError, EOFError, self.paramiko.SSHException) as error:
+                raise SftpError('Could not open an SFTP channel to {}:{}: {}'.format(
+                    self.host, self.port, error))
+    
+    def acquire(self):
+        '''Return an idle channel, or a new one. The second item of the returned tuple is True
+        when the channel was reused from the pool. Servers limit the channels of a session (to
+        10 by default for OpenSSH): once one refuses a channel, no more than those already open
+        are used, and threads wait for one of them to be handed back.
+        '''
+        with self.lock:
+            while not self.idle and self.channels >= self.max_channels:
+                self.lock.wait()
+            if self.idle:
+                return self.idle.pop(), True
+            self.channels += 1
+        try:
+            return self.open_channel(), False
+        except self.paramiko.ChannelException as error:
+            with self.lock:
+                self.channels -= 1
+                if not self.channels:
+                    raise SftpError('Could not open an SFTP channel to {}:{}: {}'.format(
+                        self.host, self.port, error))
+                self.max_channels = self.channels
+            return self.acquire()
+        except SftpError:
+            with self.lock:
+                self.channels -= 1
+                self.lock.notify()
+            raise
+    
+    def release(self, sftp):
+        '''Hand a channel whose request is done back to the pool.'''
+        with self.lock:
+            self.idle.append(sftp)
+            self.lock.notify()
+    
+    def discard(self, sftp):
+        '''Close a channel that is no longer usable.'''
+        with self.lock:
+            self.channels -= 1
+            self.lock.notify()
+        try:
+            sftp.close()
+        except (OSError, EOFError, self.paramiko.SSHException):
+            pass
+    
+    def call(self, function, *args):
+        '''Return `function(sftp, *args)` run on a pooled channel. A reused channel whose session
+        turns out to have been dropped is retried once on a fresh channel, in a new session if
+        need be. Errors returned by the server leave the channel in the pool and raise
+        SftpError.
+        '''
+        while True:
+            sftp, reused = self.acquire()
+            try:
+                result = function(sftp, *args)
+            except (EOFError, self.paramiko.SSHException) as error:
+                self.discard(sftp)
+                if reused:
+                    continue
+                raise SftpError(str(error)) from error
+            except OSError as error:
+                self.release(sftp)
+                raise SftpError('{}: {}'.format(args[0], error)) from error
+            self.release(sftp)
+            return result
+    
+    async def walk(self, root, recursive=True):
+        '''Asynchronously iterate over the files under `root`, yielding a list of (path, stat)
+        tuples per directory listed. Up to `workers` directories are listed in parallel, each
+        holding the `slot`; the others wait their turn, so that nothing more is listed once the
+        iterator is closed early. If `root` is a file rather than a directory, it is yielded
+        alone. Raises SftpError if `root` can not be read.
+        '''
+        async with self.slot:
+            attributes = await self.run(self.call, self.paramiko.SFTPClient.stat, root)
+        if not stat_module.S_ISDIR(attributes.st_mode or 0):
+            yield [(root, make_stat(attributes))]
+            return
+        async with self.slot:
+            files, directories = await self.run(self.scan, root)
+        queue = collections.deque()
+        pending = set()
+        try:
+            while True:
+                if recursive:
+                    queue.extend(directories)
+                while queue and len(pending) < self.workers:
+                    pending.add(asyncio.ensure_future(self.scan_quietly(queue.popleft())))
+                if files:
+                    yield files
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                files, directories = [], []
+                for future in done:
+                    more_files, more_directories = future.result()
+                    files.extend(more_files)
+                    directories.extend(more_directories)
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    async def scan_quietly(self, directory):
+        '''Coroutine that lists `directory` like `scan`, holding the `slot`. Unreadable
+        directories are skipped.
+        '''
+        async with self.slot:
+            try:
+                return await self.run(self.scan, directory)
+            except SftpError:
+                return [], []
+    
+    def scan(self, directory):
+        '''List `directory`. Returns the (path, stat) tuples of the files whose names pass
+        `accept_name`, and the paths of the subdirectories. Symbolic links are not followed.
+        Raises SftpError if the directory can not be listed.
+        '''
+        files = []
+        directories = []
+        for attributes in self.call(self.paramiko.SFTPClient.listdir_attr, directory):
+            name = attributes.filename
+            mode = attributes.st_mode or 0
+            path = posixpath.join(directory, name)
+            if stat_module.S_ISDIR(mode):
+                directories.append(path)
+            elif stat_module.S_ISREG(mode) and (self.accept_name is None or
+                                                self.accept_name(name)):
+                files.append((path, make_stat(attributes)))
+        return files, directories
+    
+    def retrieve(self, path, probe=None, size=None):
+        '''Start reading the file at `path`, of `size` bytes as listed, and return its
+        `Transfer`. With an `ImageProbe` `probe`, the leading bytes of the file are fed to it
+        until it can decide; a rejected file is aborted and None returned. Raises SftpError.
+        '''
+        paramiko = self.paramiko
+        while True:
+            sftp, reused = self.acquire()
+            try:
+                fd = sftp.open(path, 'rb')
+            except (EOFError, paramiko.SSHException) as error:
+                self.discard(sftp)
+                if reused:
+                    continue
+                raise SftpError(str(error)) from error
+            except OSError as error:
+                self.release(sftp)
+                raise SftpError('{}: {}'.format(path, error)) from error
+            break
+        transfer = Transfer(self, sftp, fd, size, b'')
+        if probe is None:
+            return transfer
+        try:
+            while True:
+                chunk = fd.read(16384)
+                if not chunk:
+                    probe.finish()
+                    break
+                self.consume(len(chunk))
+                if probe.feed(chunk):
+                    break
+        except (OSError, EOFError, paramiko.SSHException) as error:
+            transfer.abort()
+            raise SftpError(str(error)) from error
+        if not probe.accepted:
+            transfer.abort()
+            return None
+        transfer.head = bytes(probe.buffer)
+        return transfer
+    
+    def close(self):
+        '''Shut the thread pool down, close the pooled channels, and end the SSH session.'''
+        self.executor.shutdown()
+        for sftp in self.idle:
+            try:
+                sftp.close()
+            except (OSError, EOFError, self.paramiko.SSHException):
+                pass
+        self.idle = []
+        if self.client is not None:
+            self.client.close()
+            self.client = None
@@ -2,14 +2,75 @@
 # pylint: disable=too-many-branches,too-many-statements
 
 '''TemplateScraper is the base class for driving each image scraper template. Subclass
-TemplateScraper then implement the `parse_arguments()`, `sub_parser()`, and `handle()` methods to
-create your own customized scraper. See `GenericScraper` for an example.
+TemplateScraper then implement the `parse_arguments()` and `handle()` methods to create your own
+customized scraper, and register it in `SCRAPERS` of `scrapers.Scraper`, or under the
+`scraper.scrapers` entry point of a package. See `GenericScraper` for an example.
 '''
 
 import os
+import re
 import sys
+import time
+import asyncio
+import hashlib
+import contextlib
 import argparse
-from pprint import pformat
+import getpass
+import itertools
+import posixpath
+import tempfile
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+try:
+    from scrapers.CandidateFilter import CandidateFilter
+    from scrapers.DedupStore import DedupStore
+    from scrapers.DirectorySource import DirectorySource
+    from scrapers.Fetcher import Fetcher, FetchError
+    from scrapers.FilenameTemplate import FilenameTemplate, NameIndex, parse_modified
+    from scrapers.Frontier import Frontier, canonicalize_url
+    from scrapers.FtpSource import FtpError, FtpSource
+    from scrapers.Http2 import load_h2
+    from scrapers.ImageProbe import ImageProbe
+    from scrapers.Logger import LOGGER
+    from scrapers.Metadata import Metadata
+    from scrapers.Metrics import Metrics
+    from scrapers.PartFile import PartFile
+    from scrapers.RateLimiter import RateLimiter, parse_rate
+    from scrapers.Resizer import Resizer, parse_size
+    from scrapers.ResourceExtractor import (IMAGE, PAGE, STYLESHEET, CssExtractor,
+                                            ResourceExtractor)
+    from scrapers.ResultSink import (BinaryTarget, JsonLinesTarget, LogTarget, Result,
+                                     ResultSink, TextTarget, format_text)
+    from scrapers.Scheduler import FairGate, Scheduler
+    from scrapers.SftpSource import SftpError, SftpSource, load_paramiko
+except ImportError:
+    from CandidateFilter import CandidateFilter
+    from DedupStore import DedupStore
+    from DirectorySource import DirectorySource
+    from Fetcher import Fetcher, FetchError
+    from FilenameTemplate import FilenameTemplate, NameIndex, parse_modified
+    from Frontier import Frontier, canonicalize_url
+    from FtpSource import FtpError, FtpSource
+    from Http2 import load_h2
+    from ImageProbe import ImageProbe
+    from Logger import LOGGER
+    from Metadata import Metadata
+    from Metrics import Metrics
+    from PartFile import PartFile
+    from RateLimiter import RateLimiter, parse_rate
+    from Resizer import Resizer, parse_size
+    from ResourceExtractor import IMAGE, PAGE, STYLESHEET, CssExtractor, ResourceExtractor
+    from ResultSink import (BinaryTarget, JsonLinesTarget, LogTarget, Result, ResultSink,
+                            TextTarget, format_text)
+    from Scheduler import FairGate, Scheduler
+    from SftpSource import SftpError, SftpSource, load_paramiko
+
+
+IMAGE_EXTENSIONS = ('bmp', 'gif', 'jpg', 'jpeg', 'png', 'svg', 'psd', 'xcf')
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+# Errors of the sources of files on FTP, FTPS, SFTP, and SSH servers.
+SOURCE_ERRORS = (FtpError, SftpError)
 
 class TemplateScraper:
     """Base class providing basic scraper functionality."""
@@ -17,9 +78,6 @@ class TemplateScraper:
     args = None
     kwargs = None
     debug = False
-    log_counter = 1
-    log_spacing = 12
-    log_ending = '\n'
     parser = None
     options = None
     name = None
@@ -27,6 +85,27 @@ class TemplateScraper:
     filename = os.path.basename(__file__)
     stdout = sys.stdout
     prog = sys.argv[0]
+    fetcher = None
+    data_dir = None
+    store = None
+    metadata = None
+    scheduler = None
+    resizer = None
+    candidates = None
+    template = None
+    names = None
+    results = None
+    started = None
+    downloads = None
+    metrics = None
+    batch_worker = False
+    resize_workers = None
+    job = None
+    shared = None
+    probe_size = 16384
+    crawl_active = 0
+    crawl_changed = None
+    sources = None
     
     def __init__(self, driver, name):
         self.driver = driver
@@ -36,64 +115,60 @@ class TemplateScraper:
         self.log('self.debug:', self.debug)
         self.name = name
         self.log('self.name:', self.name)
+        # A job of option --daemon streams its output to its client, and keeps the connection
+        # pools and files of the daemon open between jobs.
+        self.job = driver.kwargs.get('job')
+        self.shared = driver.kwargs.get('shared')
         self.parse_arguments()
+        if self.job is not None:
+            self.job.attach(self.parser)
         self.log('self.parse_args:', self.parse_args)
         self.log('before self.parser.parse_args()')
         self.options = self.parser.parse_args(self.parse_args).__dict__
+        if self.job is None:
+            try:
+                LOGGER.configure(path=self.options.get('output_log'),
+                                 json_lines=self.options.get('log_json'))
+            except OSError as error:
+                self.parser.error('option -ol: {}'.format(error))
+        self.check_options()
         self.log('after self.parser.parse_args()')
         self.log('prog:', self.prog)
     
-    def log(self, *args, ending='\n', flush=True):
-        '''Log the messages provided by args. If DEBUG is True, this method will print out the
-        messages provided by args onto stdout.
+    def log(self, *args, ending='\n', flush=True):  # pylint: disable=unused-argument
+        '''Log the messages provided by args. If DEBUG is True, the messages are formatted and
+        written out by the background writer of `LOGGER`; otherwise nothing is done at all.
         '''
-        if not self.debug:
+        if self.debug:
+            LOGGER.debug(self.filename, args, ending)
+    
+    def write(self, *args, ending='\n', flush=True):  # pylint: disable=unused-argument
+        '''Write args as a prettyfied string to stdout, or to the file of option -ol. The string
+        is formatted and written out in batches by the background writer of `LOGGER`. The
+        messages of a daemon job are streamed to its client instead.
+        '''
+        if self.job is not None:
+            self.job.message(args)
             return
-        if self.log_ending != '':
-            print('{:>{spacing}} {} | ' \
-                  .format('({})'.format(self.log_counter),
-                          self.filename,
-                          spacing=self.log_spacing),
-                  end='', flush=flush)
-        self.log_ending = ending
-        spacer = ''
-        for arg in args:
-            try:
-                if isinstance(arg, (list, tuple, dict)):
-                    printed = pformat(arg)
-                    print('{}{}'.format(spacer, printed), end='', flush=flush)
-                else:
-                    print('{}{}'.format(spacer, arg), end='', flush=flush)
-            except:
-                printed = pformat(arg)
-                print('{}{}'.format(spacer, printed), end='', flush=flush)
-            if spacer == '':
-                spacer = ' '
-        print('', end=ending, flush=True)
-        if self.log_ending != '':
-            self.log_counter += 1
-    
-    def write(self, *args, ending='\n', flush=True):
-        '''Write args as a prettyfied string to stdout.
-        
-        TODO: Implement the passing of a `file`-like object in as an argument for custom output.
+        LOGGER.info(self.filename, args, ending)
+    
+    def result(self, url, status, path=None, size=None, detail=None):
+        '''Record the outcome `status` of the resource at `url`, such as 'saved' or 'skipped',
+        in the `ResultSink` of options -rf and -ro. Resources timed in `self.started` get their
+        start time and elapsed time recorded as well.
         '''
-        spacer = ''
-        for arg in args:
-            try:
-                if isinstance(arg, (list, tuple, dict)):
-                    printed = pformat(arg)
-                    self.stdout.write('{}{}'.format(spacer, printed))
-                else:
-                    self.stdout.write('{}{}'.format(spacer, arg))
-            except:
-                printed = pformat(arg)
-                self.stdout.write('{}{}'.format(spacer, printed))
-            self.stdout.write(ending)
-            if flush:
-                self.stdout.flush()
-            if spacer == '':
-                spacer = ' '
+        started = self.started.get(url) if self.started else None
+        result = Result(url, status, path, size, started,
+                        None if started is None else time.time() - started, detail)
+        if self.results is None:
+            self.write(format_text(result))
+        else:
+            self.results.add(result)
+        if self.metrics is not None:
+            reason = status
+            if status in ('filtered', 'skipped'):
+                reason = '{}:{}'.format(status, detail)
+            self.metrics.count('results', urlsplit(url).hostname if url else '', reason)
     
     def parse_arguments(self):
         '''Get the arguments parser and add arguments to it. Then parse `args` with the parser
@@ -112,6 +187,41 @@ class TemplateScraper:
                                      dest='user_agent', default='ScraperBot',
                                      help=('''\
 The user agent to report when downloading resources.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('-b', '--batch', metavar='BATCH_FILE', type=str,
+                                     dest='batch',
+                                     help=('''\
+Batch mode. Read the URIs to scrape from BATCH_FILE,
+or from stdin if BATCH_FILE is -, one per line, after
+those given on the command line. A URI may be
+followed by overrides of the scraper and of option
+-l for that URI alone, as in:
+  cars scraper=tumblr limit=50
+or be given as a JSON object, as in:
+  {"uri": "cars", "scraper": "tumblr", "limit": 50}
+The URIs are scraped in shards of option -bs URIs by
+option -bw worker processes, and one report of the
+results (and of --stats) is written at the end.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('-bs', '--batch-size', metavar='BATCH_SIZE', type=int,
+                                     dest='batch_size', default=32,
+                                     help=('''\
+Number of URIs of option -b each worker process
+scrapes at once, sharing its connections and the
+downloads of option -R. Default is 32.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('-bw', '--batch-workers', metavar='BATCH_WORKERS', type=int,
+                                     dest='batch_workers',
+                                     help=('''\
+Number of worker processes of option -b. The rate
+limit of option -rl is shared out between them.
+Default is one per core.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -128,7 +238,8 @@ stored in memory.'''))
                                      dest='cert_file',
                                      help=('''\
 Used to authenticate a connection between an https,
-ftps, or ssh resource.'''))
+ftps, or ssh resource. For sftp and ssh URIs, the
+private key to log in with, once per server.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -137,6 +248,31 @@ ftps, or ssh resource.'''))
                                      help=('''\
 Use the configuration in the %(metavar)s in order
 to avoid using command line options.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--coordinator', metavar='ADDRESS', type=str,
+                                     dest='coordinator',
+                                     help=('''\
+Coordinate a recursive crawl of the URIs by workers
+started with --worker, on this or other machines.
+Listens on ADDRESS, as [HOST:]PORT (default host is
+127.0.0.1; use 0.0.0.0 to accept other machines, on
+a trusted network only). The coordinator keeps the
+frontier, options -s, -w, and -l, and the filters of
+the crawl; workers lease batches of URLs from it.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--daemon', metavar='ADDRESS', type=str,
+                                     dest='daemon',
+                                     help=('''\
+Run as a daemon serving scrape jobs until stopped,
+instead of scraping URIs given on the command line.
+Listens on ADDRESS, the path of a Unix socket, or
+[HOST:]PORT to serve HTTP (default host is
+127.0.0.1). Each job gives its own options and URIs,
+and shares the warm connection pools of the daemon.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -167,6 +303,55 @@ space) to limit the scraper to. One or more of:
 bmp, gif, jpg, jpeg, png, svg, psd, xcf. Example:
 jpg,gif,png limit scraper to these file Extensions.
 Default is all extensions.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--lease-size', metavar='LEASE_SIZE', type=int,
+                                     dest='lease_size', default=64,
+                                     help=('''\
+Most URLs the coordinator of --coordinator leases to
+a worker at once. Default is 64.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--lease-timeout', metavar='LEASE_TIMEOUT', type=float,
+                                     dest='lease_timeout', default=30.0,
+                                     help=('''\
+Seconds after which the URLs leased to a worker of
+--coordinator that stopped sending heartbeats are
+handed to other workers. Default is 30.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('-hrl', '--host-rate-limit', metavar='HOST_RATE_LIMIT',
+                                     type=str, dest='host_rate_limit',
+                                     help=('''\
+Rate limit the downloads from each host to N<units>,
+on top of the overall limit of option -rl. Units are
+the same as for option -rl.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--http2', action='store_true',
+                                     dest='http2',
+                                     help=('''\
+Offer HTTP/2 on https connections. Each host that
+accepts it gets one connection, over which all of its
+requests are multiplexed, and the R of option -R is
+then the number of streams in flight. Other hosts,
+and http URIs, use HTTP/1.1. Requires h2.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('-I', '--incremental', action='store_true',
+                                     dest='incremental',
+                                     help=('''\
+Incremental mode. Pages and stylesheets that have not
+changed since the last run, according to the metadata
+file in option -od, are not downloaded or parsed
+again; all the links recorded for them last time are
+followed instead. Images are always revalidated with
+conditional requests and skipped when unchanged.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -175,7 +360,17 @@ Default is all extensions.'''))
                                      help=('''\
 Limit the scraper to N number of total downloads for
 the given URI resources. Each URI resource has their
-their own download count.'''))
+their own download count. A URI resource stops being
+scraped once it reaches the limit.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('-lj', '--log-json', action='store_true',
+                                     dest='log_json',
+                                     help=('''\
+Write the output of the scraper, and its debug log
+with option --debug, as JSON lines with the fields
+time, level, source, and message.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -230,7 +425,21 @@ Download images that have a maximum height of H pixels.'''))
 Regular expression of a filename to limit the
 Scraper to. Does not include extension. See option -e
 for limiting the scraper to specific extensions.
-Default is all filenames.'''))
+Default is all filenames. Both options are checked
+against the URL before anything is downloaded, then
+against the Content-Type and the leading bytes of the
+body.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('-nd', '--no-dedup', action='store_true',
+                                     dest='no_dedup',
+                                     help=('''\
+Do not deduplicate downloaded images. By default each
+distinct body is stored once in the `.objects'
+directory inside option -dd, and every saved filename
+is a reflink or hardlink to it, so mirrors of the same
+images cost their disk space only once.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -266,16 +475,16 @@ current working directory. '''))
                                      help=('''\
 Filename used to log all activity by the scraper.
 Default is no log file, just display output on
-stdout.'''))
+stdout. The log file is appended to.'''))
         except argparse.ArgumentError:
             pass
         try:
             self.parser.add_argument('-of', '--output-filename', metavar='OUTPUT_FILENAME',
-                                     type=str, dest='output_log',
+                                     type=str, dest='output_filename',
                                      help=('''\
 Filename template string to rename downloaded images
 as. If a duplicate filename already exists when
-saving the resource, an ncremental placeholder will
+saving the resource, an incremental suffix will
 be added to the end of the filename.
 
 Note: Specifying a file extension other than %%e will
@@ -316,6 +525,27 @@ Placeholders include:
                     reference to Python's time
                     formatting documentation.
   %%e             Original file extension.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--profile', action='store_const', const='full',
+                                     dest='profile',
+                                     help=('''\
+Profile the run with cProfile and tracemalloc, phase
+by phase: argument parsing, scraping (discovery and
+fetching), and post-processing. A .pstats file per
+phase and a summary of the slowest functions and the
+top allocations are written to OUTPUT_DIR.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--profile-sample', action='store_const', const='sample',
+                                     dest='profile',
+                                     help=('''\
+Like --profile, but sample the stack every 5 ms
+instead, which is cheap enough for production runs.
+The samples of each phase are written to OUTPUT_DIR
+as folded stacks, for flame graph tools.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -324,9 +554,10 @@ Placeholders include:
                                      help=('''\
 Password used to access the URI resource. Not used
 when URI resource is a directory. Do not use a
-password for anonymous ftp(s) URIs. If this option is
-not passed in, then if option -un is set, obtain the
-password from interactive input.'''))
+password for anonymous ftp(s) URIs. For sftp and ssh
+URIs with option -C, the passphrase of the key. If
+this option is not passed in, then if option -un is
+set, obtain the password from interactive input.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -338,10 +569,13 @@ Scrape URIs recursively'''))
             pass
         try:
             self.parser.add_argument('-R', '--num-resources', metavar='NUM_RESOURCES', type=int,
-                                     choices=range(1, 10), dest='num_resources',
+                                     dest='num_resources', default=4,
                                      help=('''\
-Download R number of resources at once, where R is an
-integer between 1 and 10, inclusive.'''))
+Download R number of resources at once, where R is a
+positive integer. Connections are kept alive and
+reused for each host, so R may be in the hundreds.
+With option --http2, R counts streams rather than
+connections. Default is 4.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -350,7 +584,21 @@ integer between 1 and 10, inclusive.'''))
                                      help=('''\
 Resize images to XxY, where X is the width in pixels
 and Y is the height in pixels, keeping aspect
-ratio if option -nr is not invoked.'''))
+ratio if option -nr is not invoked. Images are resized
+in place after they are saved, by one worker process
+per core. Requires Pillow.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('-rf', '--result-format', metavar='RESULT_FORMAT', type=str,
+                                     dest='result_format', default='text',
+                                     choices=('text', 'jsonl', 'binary'),
+                                     help=('''\
+Format of the result recorded for each resource: one
+of text, jsonl (JSON lines with the URL, status,
+path, size, and timings), or binary (compact binary
+records, requires option -ro). Results are buffered
+and written out in batches. Default is text.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -361,7 +609,18 @@ Rate limit scraper and its simultaneous downloads to
 N<units>. Units may be one of b for bytes, k for
 kilobytes, m for megabytes, and g for gigabytes.
 all units are per second. Example: 256k to rate
-limit scraper to 256 kilobytes per second.'''))
+limit scraper to 256 kilobytes per second. The limit
+is shared by all downloads and metered as each chunk
+arrives. See option -hrl to limit each host.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('-ro', '--result-file', metavar='RESULT_FILE', type=str,
+                                     dest='result_file',
+                                     help=('''\
+Append the result of each resource to RESULT_FILE, in
+the format of option -rf, instead of writing it to
+stdout or the file of option -ol.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -369,7 +628,47 @@ limit scraper to 256 kilobytes per second.'''))
                                      dest='sleep',
                                      help=('''\
 Randomly sleep between 0 and N seconds before
-recursing into the next sub-level of resources.'''))
+recursing into the next sub-level of resources. The
+sleep only delays the host being recursed into;
+other hosts carry on meanwhile.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--stats', action='store_true',
+                                     dest='stats',
+                                     help=('''\
+Print a summary of the run at exit: requests, bytes,
+results by reason, and connect, time to first byte,
+transfer, parse, disk write, and resize latencies,
+per host.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--stats-file', metavar='STATS_FILE', type=str,
+                                     dest='stats_file',
+                                     help=('''\
+Write the per-host counters and latency histograms of
+--stats to STATS_FILE every --stats-interval seconds
+and at exit, in the format of --stats-format. The
+file is replaced atomically on every write.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--stats-format', metavar='STATS_FORMAT', type=str,
+                                     dest='stats_format', default='json',
+                                     choices=('json', 'prometheus'),
+                                     help=('''\
+Format of --stats-file: json, or prometheus for the
+Prometheus text exposition format, as read by the
+node exporter textfile collector. Default is json.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--stats-interval', metavar='STATS_INTERVAL', type=float,
+                                     dest='stats_interval', default=10.0,
+                                     help=('''\
+Seconds between the writes of --stats-file. Default
+is 10.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -378,7 +677,8 @@ recursing into the next sub-level of resources.'''))
                                      help=('''\
 Username used to access the URI resource. Not used
 when the URI resource is a directory. Use "anonymous"
-for anonymous ftp(s).'''))
+for anonymous ftp(s). Defaults to the local user for
+sftp and ssh URIs.'''))
         except argparse.ArgumentError:
             pass
         try:
@@ -393,13 +693,27 @@ Display the version of the scraper application and exit.'''))
                                      dest='wait',
                                      help=('''\
 Randomly wait between 0 and N seconds before
-downloading the next resource.'''))
+downloading the next resource from the same host.
+Downloads from other hosts are not held up.'''))
+        except argparse.ArgumentError:
+            pass
+        try:
+            self.parser.add_argument('--worker', metavar='ADDRESS', type=str,
+                                     dest='worker',
+                                     help=('''\
+Work for the coordinator of --coordinator listening
+on ADDRESS, as [HOST:]PORT, instead of scraping URIs
+given on the command line. Downloads go to this
+worker's own option -dd; the filters of the crawl
+are those of the coordinator.'''))
         except argparse.ArgumentError:
             pass
         try:
-            self.parser.add_argument('uri', metavar='URI', type=str, nargs='+',
+            self.parser.add_argument('uri', metavar='URI', type=str, nargs='*',
                                      help=('''\
 The URI to scrape. Separate multiple URIs by spaces.
+Required unless option -b, --daemon, or --worker is
+given.
 The type of connection to the URI will depend on the
 format of the URI. Formats for URI:
     {sep}path{sep}to{sep}directory (directory resource).
@@ -412,21 +726,1315 @@ format of the URI. Formats for URI:
         except argparse.ArgumentError:
             pass
     
+    def check_options(self):
+        '''Report the option values that can not be parsed as usage errors, before anything is
+        started.
+        '''
+        self.get_rates()
+        self.get_resize()
+        self.get_candidates()
+    
+    def get_data_dir(self):
+        '''Return the directory downloaded resources are saved to, creating it if needed. When
+        option -dd is not given, a random directory inside the current working directory is used.
+        '''
+        if self.data_dir is None:
+            data_dir = self.options.get('data_dir')
+            if data_dir:
+                os.makedirs(data_dir, exist_ok=True)
+            else:
+                data_dir = tempfile.mkdtemp(prefix='scraper-', dir=os.getcwd())
+            self.data_dir = data_dir
+            self.log('self.data_dir:', self.data_dir)
+        return self.data_dir
+    
+    def get_template(self):
+        '''Return the `FilenameTemplate` compiled from option -of, or None if it is not set.'''
+        if self.template is None and self.options.get('output_filename'):
+            try:
+                self.template = FilenameTemplate(self.options['output_filename'])
+            except ValueError as error:
+                self.parser.error('option -of: {}'.format(error))
+        return self.template
+    
+    def get_names(self):
+        '''Return the `NameIndex` of the data directory, scanning the directory on first use.'''
+        if self.names is None:
+            if self.shared is not None and self.options.get('data_dir'):
+                self.names = self.shared.get_names(self.get_data_dir())
+            else:
+                self.names = NameIndex(self.get_data_dir())
+        return self.names
+    
+    def get_save_path(self, url, dimensions=None, modified=None):
+        '''Return a path inside the data directory to save the resource at `url` to, named after
+        the template of option -of if it is set. The image `dimensions` and the last modification
+        time `modified` fill in its placeholders, when known. If the name is already taken, an
+        incremental `_N` suffix is added. The name is reserved until the end of the run. Raises
+        OSError if it can not be reserved.
+        '''
+        name = os.path.basename(unquote(urlsplit(url).path)) or 'index'
+        template = self.get_template()
+        if template is not None:
+            root, ext = os.path.splitext(name)
+            name = template.render(root, ext[1:], dimensions, modified)
+        return os.path.join(self.get_data_dir(), self.get_names().reserve(name))
+    
+    def get_fetcher(self):
+        '''Return a new `Fetcher` configured from the command line options. The fetchers of
+        daemon jobs share the connection pools of the daemon.
+        '''
+        limiter = RateLimiter(*self.get_rates())
+        http2 = bool(self.options.get('http2'))
+        if http2 and load_h2() is None:
+            self.write('Error: option --http2 requires h2, HTTP/1.1 is used instead')
+            http2 = False
+        cert_file = self.get_client_cert()
+        pool = None
+        if self.shared is not None:
+            pool = self.shared.get_pool(cert_file, http2)
+        return Fetcher(num_resources=self.options.get('num_resources'),
+                       user_agent=self.options.get('user_agent'),
+                       cert_file=cert_file,
+                       limiter=limiter,
+                       log=self.log,
+                       metrics=self.metrics,
+                       pool=pool,
+                       http2=http2)
+    
+    def get_rates(self):
+        '''Return the overall and per-host rates of options -rl and -hrl in bytes per second,
+        each None if the option is not set.
+        '''
+        rates = []
+        for flag, name in (('-rl', 'rate_limit'), ('-hrl', 'host_rate_limit')):
+            try:
+                rates.append(parse_rate(self.options.get(name)))
+            except ValueError as error:
+                self.parser.error('option {}: {}'.format(flag, error))
+        return rates
+    
+    def get_client_cert(self):
+        '''Return the file of option -C if it is a TLS client certificate, else None. A private
+        key without a certificate is the key of sftp and ssh URIs, and is not presented to https
+        hosts.
+        '''
+        cert_file = self.options.get('cert_file')
+        if not cert_file:
+            return None
+        try:
+            with open(cert_file, 'rb') as fd:
+                if b'-----BEGIN CERTIFICATE-----' not in fd.read():
+                    return None
+        except OSError:
+            pass
+        return cert_file
+    
+    def get_headers(self, referrer=None):
+        '''Return the extra request headers for a resource linked from `referrer`.'''
+        headers = {}
+        if referrer and not self.options.get('no_follow'):
+            headers['Referer'] = referrer
+        return headers
+    
+    def resolve_uri(self, uri):
+        '''Turn a URI as given on the command line into the URL to scrape. Derived classes
+        override this to accept shorthand URIs, such as a blog or profile name.
+        '''
+        return uri
+    
+    def get_candidates(self):
+        '''Return the `CandidateFilter` compiled from options -e and -n.'''
+        if self.candidates is None:
+            try:
+                self.candidates = CandidateFilter(extensions=self.options.get('extensions'),
+                                                  names=self.options.get('names'))
+            except re.error as error:
+                self.parser.error('option -n: {}'.format(error))
+        return self.candidates
+    
+    async def check_candidate(self, url, response, part=None):
+        '''Check the image candidate `response` for `url` against the headers and content stages
+        of the `CandidateFilter`, peeking at the first bytes of the body for the latter. Returns
+        True if it passes. When `response` resumes the `PartFile` `part`, the first bytes are
+        those already in the part.
+        '''
+        candidates = self.get_candidates()
+        if not candidates.check_headers(url, response):
+            self.result(url, 'filtered', detail='headers')
+            self.log('Content-Type:', response.content_type,
+                     'Content-Length:', response.content_length)
+            return False
+        if part is not None:
+            head = part.head(candidates.sniff_size)
+        else:
+            head = await response.peek(candidates.sniff_size)
+        if not candidates.check_content(head):
+            self.result(url, 'filtered', detail='content')
+            return False
+        return True
+    
+    @staticmethod
+    def is_directory(uri):
+        '''Return True if `uri` names a local directory, as a path or a `file:` URI.'''
+        if urlsplit(uri).scheme == 'file':
+            return True
+        return os.path.isdir(uri)
+    
     @staticmethod
-    def sub_parser(subparsers):
-        '''A subparser is passed in as `subparsers`. Add a new subparser to the `subparsers` object
-        then return that subparser. See `argparse.ArgumentParser` for details.
+    def is_ftp(uri):
+        '''Return True if `uri` names a file or directory on an FTP or FTPS server.'''
+        return urlsplit(uri).scheme.lower() in ('ftp', 'ftps')
+    
+    @staticmethod
+    def is_sftp(uri):
+        '''Return True if `uri` names a file or directory on an SSH server.'''
+        return urlsplit(uri).scheme.lower() in ('sftp', 'ssh')
+    
+    def get_credentials(self, uri):
+        '''Return the (username, password) to log in to the server of `uri` with: those in the
+        URI, else those of options -un and -pw. When -un is given without -pw, the password is
+        read from interactive input, once per run, unless an SSH server is logged in to with
+        the key of option -C.
+        '''
+        parts = urlsplit(uri)
+        if parts.username:
+            return unquote(parts.username), unquote(parts.password or '') or None
+        username = self.options.get('username')
+        password = self.options.get('password')
+        if self.is_sftp(uri) and self.options.get('cert_file'):
+            return username, password
+        if username and username != 'anonymous' and password is None and self.job is None \
+                and sys.stdin.isatty():
+            password = self.options['password'] = getpass.getpass(
+                'Password for {}: '.format(username))
+        return username, password
+    
+    def is_image(self, url, response):
+        '''Return True if `response` for `url` looks like an image resource.'''
+        if response.content_type.startswith('image/'):
+            return True
+        ext = os.path.splitext(urlsplit(url).path)[1].lstrip('.').lower()
+        return ext in IMAGE_EXTENSIONS
+    
+    def get_results(self):
+        '''Return the `ResultSink` for options -rf and -ro. Text results without option -ro go
+        through `LOGGER`, alongside the other messages of the scraper. The results of a daemon
+        job without option -ro are streamed to its client.
+        '''
+        result_format = self.options.get('result_format') or 'text'
+        result_file = self.options.get('result_file')
+        if result_format == 'binary':
+            if not result_file:
+                self.parser.error('option -rf binary requires option -ro')
+            return ResultSink(BinaryTarget(open(result_file, 'ab')))
+        if result_file:
+            stream = open(result_file, 'a', encoding='utf-8')
+        elif self.job is not None:
+            return ResultSink(self.job)
+        elif result_format == 'text':
+            return ResultSink(LogTarget(self.filename))
+        else:
+            stream = sys.stdout
+        if result_format == 'jsonl':
+            return ResultSink(JsonLinesTarget(stream))
+        return ResultSink(TextTarget(stream))
+    
+    def scrape(self, uris):
+        '''Scrape each of `uris` with the asyncio download engine, blocking until all of them are
+        done. With option -b, the URIs of the batch file are scraped as well, in worker processes.
+        '''
+        modes = ('batch', 'coordinator', 'daemon', 'worker')
+        if len([mode for mode in modes if self.options.get(mode)]) > 1:
+            self.parser.error('options -b, --coordinator, --daemon, and --worker exclude each '
+                              'other')
+        if self.options.get('daemon') and uris:
+            self.parser.error('option --daemon: URIs are given with each job, not on the '
+                              'command line')
+        if not uris and not any(self.options.get(mode) for mode in ('batch', 'daemon', 'worker')):
+            self.parser.error('the following arguments are required: URI')
+        self.profile_phase('scrape')
+        try:
+            if self.options.get('batch'):
+                self.scrape_batch(uris)
+            elif self.options.get('coordinator'):
+                self.coordinate([self.resolve_uri(uri) for uri in uris])
+            elif self.options.get('daemon'):
+                self.serve_jobs()
+            elif self.options.get('worker'):
+                self.work()
+            else:
+                asyncio.run(self.scrape_uris([self.resolve_uri(uri) for uri in uris]))
+        finally:
+            self.report_profile()
+    
+    def scrape_batch(self, uris):
+        '''Run the batch job of option -b: scrape `uris`, then the URIs read from the batch file
+        as it is read, in the worker processes of a `BatchRunner`. Writes the merged report of the
+        job at the end.
+        '''
+        try:
+            from scrapers.BatchRunner import BatchItem, BatchRunner, read_batch
+        except ImportError:
+            from BatchRunner import BatchItem, BatchRunner, read_batch
+        path = self.options['batch']
+        try:
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        except OSError as error:
+            self.parser.error('option -b: {}'.format(error))
+        try:
+            # Opening the sink checks options -rf and -ro, and starts a binary result file, once,
+            # before the workers append to it.
+            self.get_results().close()
+            self.metrics = self.get_metrics()
+            try:
+                runner = BatchRunner(self, workers=self.options.get('batch_workers'),
+                                     batch_size=self.options.get('batch_size'))
+            except ValueError as error:
+                self.parser.error('option -rl: {}'.format(error))
+            started = time.monotonic()
+            items = itertools.chain((BatchItem(uri, None, None) for uri in uris),
+                                    read_batch(stream, runner.reject))
+            runner.run(items)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.profile_phase('post-process')
+        for line in runner.summary(time.monotonic() - started):
+            self.write(line)
+        if self.candidates is not None and sum(self.candidates.rejected.values()):
+            self.write('Filtered (rejected/checked): {}'.format(self.candidates.summary()))
+        if self.metrics is not None:
+            self.report_stats()
+    
+    def coordinate(self, uris):
+        '''Run the coordinator of option --coordinator: crawl `uris` recursively with the workers
+        of option --worker that connect to it, then write the report of the crawl.
+        '''
+        try:
+            from scrapers.Coordinator import Coordinator, parse_address
+        except ImportError:
+            from Coordinator import Coordinator, parse_address
+        for uri in uris:
+            if self.is_directory(uri):
+                self.parser.error('option --coordinator: local directories can not be crawled '
+                                  'by workers: {}'.format(uri))
+        try:
+            address = parse_address(self.options['coordinator'])
+        except ValueError as error:
+            self.parser.error('option --coordinator: {}'.format(error))
+        coordinator = Coordinator(self, uris, address,
+                                  lease_size=self.options.get('lease_size') or 64,
+                                  lease_timeout=self.options.get('lease_timeout') or 30.0)
+        started = time.monotonic()
+        asyncio.run(coordinator.run())
+        self.profile_phase('post-process')
+        for line in coordinator.summary(time.monotonic() - started):
+            self.write(line)
+    
+    def work(self):
+        '''Run a worker of option --worker, crawling the URLs leased from its coordinator until
+        the crawl is over. Exits with status 1 if the coordinator can not be reached.
+        '''
+        try:
+            from scrapers.Coordinator import CrawlWorker, parse_address
+        except ImportError:
+            from Coordinator import CrawlWorker, parse_address
+        try:
+            address = parse_address(self.options['worker'])
+        except ValueError as error:
+            self.parser.error('option --worker: {}'.format(error))
+        try:
+            asyncio.run(CrawlWorker(self, address).run())
+        except (OSError, EOFError) as error:
+            self.write('Error: lost the coordinator at {}:{}: {}'.format(*address, error))
+            LOGGER.flush()
+            sys.exit(1)
+    
+    def serve_jobs(self):
+        '''Run the daemon of option --daemon, serving scrape jobs until it is stopped with an
+        interrupt or SIGTERM, then write the report of the jobs served. Exits with status 1 if it
+        can not listen on its address.
+        '''
+        try:
+            from scrapers.Daemon import Daemon, parse_daemon_address
+        except ImportError:
+            from Daemon import Daemon, parse_daemon_address
+        try:
+            address = parse_daemon_address(self.options['daemon'])
+        except ValueError as error:
+            self.parser.error('option --daemon: {}'.format(error))
+        daemon = Daemon(self, address)
+        try:
+            asyncio.run(daemon.run())
+        except OSError as error:
+            self.write('Error: could not listen on {}: {}'.format(self.options['daemon'], error))
+            LOGGER.flush()
+            sys.exit(1)
+        self.profile_phase('post-process')
+        for line in daemon.summary():
+            self.write(line)
+    
+    def scrape_shard(self, items):
+        '''Scrape a shard of the batch job of option -b, in a worker process: the list of (url,
+        limit) tuples `items`, where limit overrides option -l for that URL unless it is None.
+        Returns the result counts, the `Metrics` (or None), and the rejected and checked counts
+        of the candidate filter, for the parent process to merge.
+        '''
+        self.candidates = None
+        limits = {url: limit for url, limit in items if limit is not None}
+        asyncio.run(self.scrape_uris([url for url, _ in items], limits))
+        LOGGER.flush()
+        candidates = self.get_candidates()
+        return self.results.counts, self.metrics, candidates.rejected, candidates.checked
+    
+    def profile_phase(self, name):
+        '''Start the phase `name` of option --profile, if it is set.'''
+        if self.driver.profiler is not None:
+            self.driver.profiler.start(name)
+    
+    def report_profile(self):
+        '''Write the profile of option --profile to the output directory and list its files.'''
+        if self.driver.profiler is not None:
+            for path in self.driver.profiler.close(self.get_output_dir()):
+                self.write('Profile: {}'.format(path))
+    
+    async def scrape_uris(self, uris, limits=None):
+        '''Coroutine that scrapes all of `uris` concurrently, sharing one `Fetcher` (and so one
+        set of connection pools) between them. With option -r, the URIs are crawled recursively.
+        Local directories and FTP directories are always scraped recursively, and SFTP
+        directories with option -r, alongside the other URIs. `limits` maps URIs to a download
+        limit that overrides option -l for them.
+        '''
+        directories = [uri for uri in uris if self.is_directory(uri)]
+        trees = [uri for uri in uris if self.is_ftp(uri) or self.is_sftp(uri)]
+        uris = [uri for uri in uris if uri not in directories and uri not in trees]
+        async with self.engine(limits):
+            jobs = [self.scrape_directory(uri) for uri in directories]
+            jobs.extend(self.scrape_server(uri) for uri in trees)
+            if uris and self.options.get('recursive'):
+                jobs.append(self.crawl(uris))
+            elif uris:
+                gate = FairGate(self.fetcher.num_resources)
+                jobs.extend(self.scrape_uri(uri, gate) for uri in uris)
+            await asyncio.gather(*jobs)
+    
+    @contextlib.asynccontextmanager
+    async def engine(self, limits=None):
+        '''Async context manager that sets up the download engine: the `Fetcher`, `Scheduler`,
+        result sink, metrics, and resizer, with `limits` passed on to the `Scheduler`. On a clean
+        exit it waits for the resizes and writes the final reports; it always closes everything.
+        '''
+        self.results = self.get_results()
+        self.started = {}
+        self.downloads = {}
+        self.sources = {}
+        self.get_template()
+        self.metrics = self.get_metrics()
+        self.fetcher = self.get_fetcher()
+        self.log('self.fetcher:', self.fetcher)
+        self.scheduler = Scheduler(sleep=self.options.get('sleep'),
+                                   wait=self.options.get('wait'),
+                                   limit=self.options.get('limit'),
+                                   limits=limits)
+        self.resizer = self.get_resizer()
+        timers = [asyncio.ensure_future(self.results.run_timer())]
+        if self.options.get('stats_file') and not self.batch_worker:
+            timers.append(asyncio.ensure_future(self.run_dumper()))
+        try:
+            yield
+            self.profile_phase('post-process')
+            if self.resizer is not None:
+                await self.resizer.join()
+            self.results.flush()
+            if not self.batch_worker and self.candidates is not None and \
+                    sum(self.candidates.rejected.values()):
+                self.write('Filtered (rejected/checked): {}'.format(self.candidates.summary()))
+        finally:
+            for timer in timers:
+                timer.cancel()
+            await self.fetcher.close()
+            for source in self.sources.values():
+                source.close()
+            self.sources = None
+            if self.resizer is not None:
+                self.resizer.close()
+            self.results.close()
+            if self.store is not None:
+                if self.shared is None or not self.shared.holds(self.store):
+                    self.store.close()
+                self.store = None
+            if self.metadata is not None:
+                if self.shared is None or not self.shared.holds(self.metadata):
+                    self.metadata.close()
+                else:
+                    self.metadata.commit()
+                self.metadata = None
+            if self.metrics is not None and not self.batch_worker:
+                self.report_stats()
+    
+    def get_metrics(self):
+        '''Return a `Metrics` for options --stats and --stats-file, or None if neither is set.'''
+        if self.options.get('stats') or self.options.get('stats_file'):
+            return Metrics()
+        return None
+    
+    def report_stats(self):
+        '''Print the summary of option --stats, and write the final snapshot of option
+        --stats-file.
+        '''
+        if self.options.get('stats_file'):
+            self.dump_stats()
+        if self.options.get('stats'):
+            for line in self.metrics.summary():
+                self.write(line)
+    
+    def dump_stats(self):
+        '''Write a snapshot of the metrics to the file of option --stats-file.'''
+        try:
+            self.metrics.dump(self.options['stats_file'], self.options.get('stats_format'))
+        except OSError as error:
+            self.write('Error: could not write stats: {}'.format(error))
+    
+    async def run_dumper(self):
+        '''Coroutine that writes a snapshot of the metrics to the file of option --stats-file
+        every --stats-interval seconds until cancelled. A snapshot that can not be written is
+        reported, and the next one is tried at the next interval.
+        '''
+        interval = self.options.get('stats_interval') or 10.0
+        while True:
+            await asyncio.sleep(interval)
+            self.dump_stats()
+    
+    async def scrape_directory(self, uri):
+        '''Scrape the images out of the local directory `uri` and all of its subdirectories. The
+        filename filters apply while the directories are listed, and the dimension filters to the
+        leading bytes of each file, before anything is copied. A file saved by an earlier run is
+        skipped if its size and modification time have not changed.
+        '''
+        root = uri
+        if urlsplit(uri).scheme == 'file':
+            from urllib.request import url2pathname
+            root = url2pathname(urlsplit(uri).path)
+        source = DirectorySource(workers=self.fetcher.num_resources,
+                                 accept_name=self.get_candidates().accept_name)
+        walk = source.walk(root)
+        tasks = set()
+        try:
+            async for files in walk:
+                for path, stat in files:
+                    if self.scheduler.exhausted(uri):
+                        break
+                    if len(tasks) >= self.fetcher.num_resources * 2:
+                        _, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    tasks.add(asyncio.ensure_future(self.copy_file(source, uri, path, stat)))
+                if self.scheduler.exhausted(uri):
+                    # Option -l is reached: the rest of the tree is not listed.
+                    break
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            await walk.aclose()
+            source.close()
+    
+    async def copy_file(self, source, uri, path, stat):
+        '''Copy the local file at `path`, found under the directory `uri`, into the data
+        directory. Returns the saved path, or None if the file was not saved.
+        '''
+        url = Path(os.path.abspath(path)).as_uri()
+        metadata = self.get_metadata()
+        record = metadata.get(url)
+        if metadata.is_file_unchanged(record, stat):
+            self.result(url, 'unchanged', record.path, stat.st_size)
+            return record.path
+        if not await self.scheduler.claim(uri):
+            return None
+        save_path = None
+        self.started[url] = time.time()
+        try:
+            probe = self.get_probe()
+            if probe is not None:
+                if not await source.run(source.read_head, path, probe):
+                    self.result(url, 'rejected', detail='{}x{}'.format(*probe.dimensions))
+                    return None
+                candidates = self.get_candidates()
+                if not candidates.check_content(bytes(probe.buffer[:candidates.sniff_size])):
+                    self.result(url, 'filtered', detail='content')
+                    return None
+            save_path = self.get_save_path(url, probe.dimensions if probe is not None else None,
+                                           stat.st_mtime)
+            started = time.monotonic()
+            try:
+                await source.run(source.copy, path, save_path, stat.st_size)
+                if self.metrics is not None:
+                    self.metrics.observe('write', '', time.monotonic() - started)
+            except OSError:
+                self.release_save_path(save_path)
+                raise
+            self.result(url, 'saved', save_path, stat.st_size)
+            metadata.update_file(url, stat, save_path)
+            if self.resizer is not None:
+                await self.resizer.submit(save_path)
+            return save_path
+        except OSError as error:
+            save_path = None
+            self.result(url, 'error', detail=error)
+            return None
+        finally:
+            self.started.pop(url, None)
+            await self.scheduler.release(uri, saved=save_path is not None)
+    
+    def get_source(self, uri):
+        '''Return the `FtpSource` or `SftpSource` for the server of `uri`, shared by every URI
+        on the same server with the same credentials for the rest of the run, so that each
+        server is logged in to once. Returns None for SSH servers when paramiko is not
+        installed.
+        '''
+        parts = urlsplit(uri)
+        scheme = parts.scheme.lower()
+        username, password = self.get_credentials(uri)
+        key = ('sftp' if self.is_sftp(uri) else scheme, parts.hostname, parts.port, username,
+               password)
+        source = self.sources.get(key)
+        if source is not None:
+            return source
+        if self.is_sftp(uri):
+            if load_paramiko() is None:
+                return None
+            source_class = SftpSource
+        else:
+            source_class = FtpSource
+        source = self.sources[key] = source_class(
+            scheme, parts.hostname, parts.port, username=username, password=password,
+            cert_file=self.options.get('cert_file'), workers=self.fetcher.num_resources,
+            accept_name=self.get_candidates().accept_name, timeout=self.fetcher.timeout,
+            limiter=self.fetcher.limiter)
+        return source
+    
+    async def scrape_server(self, uri):
+        '''Scrape the images out of the directory `uri` on an FTP, FTPS, or SSH server, or the
+        single file `uri`, over up to option -R connections (FTP) or channels of one SSH session
+        (SFTP) at once. Subdirectories of FTP directories are always scraped, and those of SFTP
+        directories with option -r. The filename filters apply while the directories are listed,
+        and the dimension filters to the leading bytes of each file, before the rest of it is
+        transferred. A file saved by an earlier run is skipped if its size and modification time
+        on the server have not changed. The transfers keep to the rate limits of options -rl and
+        -hrl, and to the delays of options -w and -s between the files of a server.
+        '''
+        source = self.get_source(uri)
+        if source is None:
+            self.result(uri, 'error', detail='{} URIs require paramiko'.format(
+                urlsplit(uri).scheme.lower()))
+            return
+        root = unquote(urlsplit(uri).path) or '/'
+        recursive = self.is_ftp(uri) or bool(self.options.get('recursive'))
+        walk = source.walk(root, recursive)
+        tasks = set()
+        try:
+            async for files in walk:
+                for path, stat in files:
+                    if self.scheduler.exhausted(uri):
+                        break
+                    if len(tasks) >= self.fetcher.num_resources * 2:
+                        _, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    tasks.add(asyncio.ensure_future(self.retrieve_file(source, uri, path, stat)))
+                if self.scheduler.exhausted(uri):
+                    # Option -l is reached: the rest of the tree is not listed.
+                    break
+        except SOURCE_ERRORS as error:
+            self.result(source.url(root), 'error', detail=error)
+        finally:
+            await walk.aclose()
+        if tasks:
+            await asyncio.gather(*tasks)
+    
+    async def retrieve_file(self, source, uri, path, stat):
+        '''Retrieve the file at `path` on the server of the `FtpSource` or `SftpSource` `source`,
+        found under the URI `uri`, into the data directory. The file is written to a `.part` file
+        and renamed into place once complete. Returns the saved path, or None if the file was
+        not saved. A local file that can not be written is reported like a failed transfer, and
+        its part is thrown away.
+        '''
+        url = source.url(path)
+        metadata = self.get_metadata()
+        record = metadata.get(url)
+        if stat.st_mtime and metadata.is_file_unchanged(record, stat):
+            self.result(url, 'unchanged', record.path, stat.st_size)
+            return record.path
+        root = unquote(urlsplit(uri).path) or '/'
+        await self.scheduler.wait_turn(url, depth=posixpath.relpath(path, root).count('/') + 1)
+        if not await self.scheduler.claim(uri):
+            return None
+        save_path = None
+        self.started[url] = time.time()
+        try:
+            probe = self.get_probe()
+            started = time.monotonic()
+            async with source.slot:
+                transfer = await source.run(source.retrieve, path, probe, stat.st_size)
+                if transfer is None:
+                    self.result(url, 'rejected', detail='{}x{}'.format(*probe.dimensions))
+                    return None
+                if probe is not None:
+                    candidates = self.get_candidates()
+                    if not candidates.check_content(transfer.head[:candidates.sniff_size]):
+                        await source.run(transfer.abort)
+                        self.result(url, 'filtered', detail='content')
+                        return None
+                part = PartFile(self.get_data_dir(), url)
+                try:
+                    part.reserve()
+                except OSError:
+                    await source.run(transfer.abort)
+                    raise
+                try:
+                    size = await source.run(transfer.save, part.path)
+                    save_path = self.get_save_path(url, probe.dimensions if probe is not None
+                                                   else None, stat.st_mtime or None)
+                    part.commit(save_path)
+                except (*SOURCE_ERRORS, OSError):
+                    part.discard()
+                    if save_path is not None:
+                        os.unlink(save_path)
+                        self.get_names().discard(os.path.basename(save_path))
+                    raise
+            if self.metrics is not None:
+                self.metrics.count('bytes', source.host, amount=size)
+                self.metrics.observe('transfer', source.host, time.monotonic() - started)
+            self.result(url, 'saved', save_path, size)
+            metadata.update_file(url, stat, save_path)
+            if self.resizer is not None:
+                await self.resizer.submit(save_path)
+            return save_path
+        except (*SOURCE_ERRORS, OSError) as error:
+            save_path = None
+            self.result(url, 'error', detail=error)
+            return None
+        finally:
+            self.started.pop(url, None)
+            await self.scheduler.release(uri, saved=save_path is not None)
+    
+    async def scrape_uri(self, uri, gate=None):
+        '''Scrape a single URI resource without recursing: download it if it is an image, or
+        download the images it links to if it is a page. Each image starts downloading as soon as
+        it is found, while the rest of the page is still arriving.
         
-        Base class stub. Needs to be implemented.
+        The URI resources of a job take turns at the download slots of the `FairGate` `gate`.
+        '''
+        seen = set()
+        tasks = []
+        gate = gate or FairGate(self.fetcher.num_resources)
+        
+        async def fetch(url, kind):
+            if self.scheduler.exhausted(uri):
+                return
+            await self.scheduler.wait_turn(url, depth=1)
+            async with gate.slot(uri):
+                if kind == IMAGE:
+                    await self.download(url, referrer=uri, root=uri)
+                else:
+                    await self.scrape_stylesheet(url, referrer=uri, on_links=on_links)
+        
+        async def on_links(links):
+            for url, kind in links:
+                if url in seen or kind == PAGE:
+                    continue
+                seen.add(url)
+                if kind == IMAGE and not self.get_candidates().check_url(url):
+                    continue
+                tasks.append(asyncio.ensure_future(fetch(url, kind)))
+        
+        await self.scheduler.wait_turn(uri)
+        async with gate.slot(uri):
+            await self.scrape_page(uri, on_links=on_links)
+        while tasks:
+            pending = list(tasks)
+            del tasks[:]
+            await asyncio.gather(*pending)
+    
+    async def scrape_page(self, url, referrer=None, on_links=None):
+        '''Fetch the resource at `url`. An image is saved into the data directory; a page is
+        streamed through a `ResourceExtractor`, and the coroutine function `on_links` is awaited
+        with each list of (url, kind) tuples found while the page is still downloading.
+        
+        With option -I, a page that has not changed since the last run is not downloaded or
+        parsed again; the links recorded for it last time, of every kind, are passed to
+        `on_links` instead, so that its images and stylesheets are still revalidated.
+        An image an earlier run left unfinished is resumed, as in `download()`.
+        '''
+        metadata = self.get_metadata()
+        record = metadata.get(url)
+        revalidate = record is not None and (record.path or self.options.get('incremental'))
+        headers = self.get_headers(referrer)
+        part = self.find_part(url)
+        if part is not None:
+            revalidate = False
+            headers.update(part.range_headers())
+        elif revalidate:
+            headers.update(metadata.conditional_headers(record))
+        async with self.fetcher.slot:
+            try:
+                response, part = await self.get_resumed(url, headers, part)
+            except FetchError as error:
+                self.result(url, 'error', detail=error)
+                return
+            try:
+                if part is not None:
+                    if await self.check_candidate(url, response, part):
+                        await self.save_image(url, response, headers, part=part)
+                    else:
+                        part.discard()
+                elif revalidate and metadata.is_unchanged(record, response):
+                    response.close()
+                    self.result(url, 'unchanged', record.path)
+                    if on_links is not None:
+                        await on_links(metadata.get_links(url))
+                elif response.status != 200:
+                    self.result(url, 'skipped', detail=response.status)
+                elif self.is_image(url, response):
+                    if await self.check_candidate(url, response):
+                        await self.save_image(url, response, headers)
+                elif response.content_type in HTML_TYPES:
+                    extractor = ResourceExtractor(response.url, response.charset)
+                    found_links = []
+                    size = 0
+                    parsing = 0.0
+                    async for chunk in response.iter_chunks():
+                        size += len(chunk)
+                        started = time.monotonic()
+                        links = extractor.feed(chunk)
+                        parsing += time.monotonic() - started
+                        found_links.extend(links)
+                        if links and on_links is not None:
+                            await on_links(links)
+                    links = extractor.close()
+                    found_links.extend(links)
+                    if links and on_links is not None:
+                        await on_links(links)
+                    metadata.update(url, response, size=size)
+                    metadata.set_links(url, found_links)
+                    if self.metrics is not None:
+                        host = urlsplit(url).hostname
+                        self.metrics.observe('parse', host, parsing)
+                        self.metrics.count('links', host, amount=len(found_links))
+                else:
+                    self.log('Not a page or image:', url, response.content_type)
+            except (FetchError, OSError) as error:
+                self.result(url, 'error', detail=error)
+            finally:
+                response.close()
+    
+    async def scrape_stylesheet(self, url, referrer=None, on_links=None):
+        '''Stream the stylesheet at `url` through a `CssExtractor`, awaiting the coroutine function
+        `on_links` with each list of (url, kind) tuples of the images and imported stylesheets it
+        references.
+        
+        With option -I, a stylesheet is revalidated with a conditional request like a page, and
+        if it has not changed, the links recorded for it last time are passed to `on_links`.
+        '''
+        metadata = self.get_metadata()
+        record = metadata.get(url) if self.options.get('incremental') else None
+        headers = self.get_headers(referrer)
+        if record is not None:
+            headers.update(metadata.conditional_headers(record))
+        async with self.fetcher.slot:
+            try:
+                response = await self.fetcher.get(url, headers=headers)
+            except FetchError as error:
+                self.result(url, 'error', detail=error)
+                return
+            try:
+                if record is not None and metadata.is_unchanged(record, response):
+                    self.result(url, 'unchanged')
+                    if on_links is not None:
+                        await on_links(metadata.get_links(url))
+                    return
+                if response.status != 200:
+                    self.result(url, 'skipped', detail=response.status)
+                    return
+                extractor = CssExtractor(response.url, response.charset)
+                found_links = []
+                size = 0
+                async for chunk in response.iter_chunks():
+                    size += len(chunk)
+                    links = extractor.feed(chunk)
+                    found_links.extend(links)
+                    if links and on_links is not None:
+                        await on_links(links)
+                links = extractor.close()
+                found_links.extend(links)
+                if links and on_links is not None:
+                    await on_links(links)
+                metadata.update(url, response, size=size)
+                metadata.set_links(url, found_links)
+            except FetchError as error:
+                self.result(url, 'error', detail=error)
+            finally:
+                response.close()
+    
+    async def download(self, url, referrer=None, root=None):
+        '''Download the image at `url`, found under the URI resource `root`, into the data
+        directory. Returns the saved path, or None if the resource was not saved. Once `root` has
+        reached the download limit of option -l, nothing more is downloaded for it.
         
-        sub_parser() should be implemented like so:
+        An image saved by an earlier run is revalidated with a conditional request and skipped if
+        the server answers 304, or if its size matches what was recorded. With any of the options
+        -minw, -maxw, -minh, or -maxh, the dimensions of the image are read from its leading bytes
+        and the download is abandoned as soon as they fail the filters.
+        
+        A download an earlier run left unfinished in a `.part` file is resumed with a Range
+        request, which the server only honours if the image has not changed since. When another
+        URI resource links the same image while it is downloading, the second download waits for
+        the first and then revalidates what it saved.
+        '''
+        async with self.download_lock(url):
+            metadata = self.get_metadata()
+            record = metadata.get(url)
+            headers = self.get_headers(referrer)
+            probe = self.get_probe()
+            part = self.find_part(url)
+            if part is not None:
+                record = None
+                headers.update(part.range_headers())
+            else:
+                headers.update(metadata.conditional_headers(record))
+                if probe is not None and self.fetcher.accepts_ranges(url):
+                    headers['Range'] = 'bytes=0-{}'.format(self.probe_size - 1)
+            if not await self.scheduler.claim(root):
+                return None
+            path = None
+            try:
+                path = await self.fetch_image(url, headers, record, probe, part)
+            finally:
+                await self.scheduler.release(root, saved=path is not None)
+            return path
+    
+    @contextlib.asynccontextmanager
+    async def download_lock(self, url):
+        '''Async context manager that holds the download of `url` until the downloads of it
+        started before are done.
+        '''
+        entry = self.downloads.get(url)
+        if entry is None:
+            entry = self.downloads[url] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.downloads[url]
+    
+    def find_part(self, url):
+        '''Return the `PartFile` an earlier run left unfinished for `url`, or None. Only the data
+        directory of option -dd is looked in, as without it every run saves to a new one.
+        '''
+        data_dir = self.options.get('data_dir')
+        if not data_dir:
+            return None
+        return PartFile.find(data_dir, url)
+    
+    async def get_resumed(self, url, headers, part):
+        '''Request `url` with `headers`, which ask for the rest of the body of the `PartFile`
+        `part` if it is not None. Returns the response and the part it resumes. The part is
+        discarded, and None returned in its place, if the response carries the whole body: the
+        image changed, or the server ignores ranges. A range past the end of the image (416) is
+        asked for again without it.
+        '''
+        response = await self.fetcher.get(url, headers=headers)
+        if part is None or part.resumes(response):
+            return response, part
+        part.discard()
+        if response.status == 416:
+            response.close()
+            headers = {name: value for name, value in headers.items()
+                       if name not in ('Range', 'If-Range')}
+            response = await self.fetcher.get(url, headers=headers)
+        return response, None
+    
+    async def fetch_image(self, url, headers, record, probe, part=None):
+        '''Fetch and save the image at `url` for `download()`, revalidating the metadata `record`
+        of an earlier run, or resuming the `PartFile` `part`. Returns the saved path, or None if
+        the resource was not saved.
+        '''
+        metadata = self.get_metadata()
+        self.started[url] = time.time()
+        try:
+            async with self.fetcher.slot:
+                try:
+                    response, part = await self.get_resumed(url, headers, part)
+                except FetchError as error:
+                    self.result(url, 'error', detail=error)
+                    return None
+                try:
+                    if metadata.is_unchanged(record, response):
+                        response.close()
+                        self.result(url, 'unchanged', record.path, record.size)
+                        return record.path
+                    if response.status not in (200, 206):
+                        self.result(url, 'skipped', detail=response.status)
+                        return None
+                    if not await self.check_candidate(url, response, part):
+                        if part is not None:
+                            part.discard()
+                        return None
+                    return await self.save_image(url, response, headers, probe, part)
+                except (FetchError, OSError) as error:
+                    self.result(url, 'error', detail=error)
+                    return None
+                finally:
+                    response.close()
+        finally:
+            self.started.pop(url, None)
+    
+    async def save_image(self, url, response, headers, probe=None, part=None):
+        '''Save the image `response` fetched from `url` with `headers`, once it has passed the
+        dimension filters, and record it in the metadata file. Returns the saved path, or None if
+        the image was rejected. When `response` resumes the `PartFile` `part`, the dimensions are
+        read from the bytes already in the part.
+        '''
+        first = response
+        prefix = b''
+        if probe is None:
+            probe = self.get_probe()
+        try:
+            if probe is not None and part is not None:
+                if not probe.feed(part.head(probe.max_bytes)):
+                    probe.finish()
+                if not probe.accepted:
+                    part.discard()
+                    self.result(url, 'rejected', detail='{}x{}'.format(*probe.dimensions))
+                    return None
+            elif probe is not None:
+                accepted, response = await self.probe_response(url, response, probe, headers)
+                if not accepted:
+                    self.result(url, 'rejected', detail='{}x{}'.format(*probe.dimensions))
+                    return None
+                prefix = probe.buffer
+            path = await self.save_response(
+                url, response, prefix=prefix,
+                dimensions=probe.dimensions if probe is not None else None,
+                modified=parse_modified(first.headers.get('last-modified')), part=part)
+        finally:
+            if response is not None:
+                response.close()
+        self.get_metadata().update(url, response or first, path, os.path.getsize(path))
+        if self.resizer is not None:
+            await self.resizer.submit(path)
+        return path
+    
+    def get_resizer(self):
+        '''Return a `Resizer` for option -re, or None if the option is not set or Pillow is not
+        installed.
+        '''
+        size = self.get_resize()
+        if size is None:
+            return None
+        if not Resizer.available():
+            self.write('Error: option -re requires Pillow, images will not be resized')
+            return None
+        return Resizer(size, keep_ratio=not self.options.get('no_ratio'),
+                       workers=self.resize_workers, on_done=self.resized, metrics=self.metrics)
+    
+    def get_resize(self):
+        '''Return the (width, height) of option -re, or None if it is not set.'''
+        try:
+            return parse_size(self.options.get('resize'))
+        except ValueError as error:
+            self.parser.error('option -re: {}'.format(error))
+    
+    def resized(self, path, sizes, error):
+        '''Report the outcome of resizing the image at `path`.'''
+        if error is not None:
+            self.result(None, 'error', path, detail='could not resize {}: {}'.format(path, error))
+        elif sizes is not None:
+            detail = '{}x{} -> {}x{}'.format(*sizes[0], *sizes[1])
+            self.result(None, 'resized', path, os.path.getsize(path), detail)
+    
+    def get_probe(self):
+        '''Return a new `ImageProbe` for the dimension filters, or for the placeholders %w and %h
+        of option -of. Returns None if neither is used.
+        '''
+        probe = ImageProbe(min_width=self.options.get('min_width'),
+                           max_width=self.options.get('max_width'),
+                           min_height=self.options.get('min_height'),
+                           max_height=self.options.get('max_height'))
+        template = self.get_template()
+        if probe.active or (template is not None and template.needs_dimensions):
+            return probe
+        return None
+    
+    async def probe_response(self, url, response, probe, headers):
+        '''Feed the leading bytes of `response` to `probe` until the dimension filters can accept
+        or reject the image. Returns a 2-tuple of whether the image was accepted and the response
+        carrying the rest of the body after `probe.buffer`, which is None when the whole body has
+        already been read.
         
-        >>> def sub_parser(subparsers):
-        >>>     parser = subparsers.add_parser('name_of_scraper',
-        >>>                                    help=('Command line help text for the scraper.'))
-        >>>     return parser
+        A 206 response to the ranged request sent by `download()` is read whole; if the image is
+        accepted, the rest of it is requested with a second ranged request that is only honoured
+        if the resource has not changed in between.
         '''
-        raise NotImplementedError('sub_parser() needs to be implemented.')
+        if response.status == 206:
+            probe.feed(await response.read())
+            total = response.total_length
+            if probe.accepted is False:
+                return False, None
+            if total is not None and len(probe.buffer) >= total:
+                probe.finish()
+                return probe.accepted, None
+            validator = response.headers.get('etag') or response.headers.get('last-modified')
+            headers = {name: value for name, value in headers.items()
+                       if name not in ('Range', 'If-None-Match', 'If-Modified-Since')}
+            if validator:
+                headers['Range'] = 'bytes={}-'.format(len(probe.buffer))
+                headers['If-Range'] = validator
+            response = await self.fetcher.get(url, headers=headers)
+            if response.status == 200:
+                probe.reset()
+            elif response.status != 206:
+                response.close()
+                raise FetchError('Unexpected status {} resuming {}'.format(response.status, url))
+        if not probe.done:
+            async for chunk in response.iter_chunks():
+                if probe.feed(chunk):
+                    break
+            else:
+                probe.finish()
+        return probe.accepted, response
+    
+    def get_store(self):
+        '''Return the `DedupStore` of the data directory, or None with option -nd.'''
+        if self.store is None and not self.options.get('no_dedup'):
+            if self.shared is not None and self.options.get('data_dir'):
+                self.store = self.shared.get_store(self.get_data_dir())
+            else:
+                self.store = DedupStore(self.get_data_dir())
+        return self.store
+    
+    async def save_response(self, url, response, prefix=b'', dimensions=None, modified=None,
+                            part=None):
+        '''Stream `prefix`, the part of the body already read, followed by the rest of the body of
+        `response` into the data directory. `response` may be None if `prefix` holds the whole
+        body. The image `dimensions` and last modification time `modified` are passed on to
+        `get_save_path()`. Returns the saved path.
+        
+        The body is written to a `PartFile`, `part` when it resumes a download left unfinished,
+        and renamed into place once complete. If the transfer fails, the part is kept for the
+        next run to resume when the response had a validator. If the body can not be written
+        locally, the part and the saved name are thrown away and the OSError is raised.
+        
+        Unless option -nd is set, the body is hashed as it streams and the part is moved into
+        the `DedupStore`, the saved path being linked to the stored copy. A body the store
+        already holds for `url`, sent with the same size and the same strong ETag or
+        Last-Modified date, is not transferred again.
+        '''
+        store = self.get_store()
+        if store is not None and part is None and response is not None:
+            size = response.total_length
+            digest = store.lookup(url, size, PartFile.get_validator(response))
+            if digest is not None:
+                response.close()
+                path = self.get_save_path(url, dimensions, modified)
+                try:
+                    store.link(digest, path)
+                except OSError:
+                    self.release_save_path(path)
+                    raise
+                self.result(url, 'linked', path, size)
+                return path
+        if part is None:
+            part = PartFile(self.get_data_dir(), url)
+        writing = time.monotonic()
+        try:
+            part.open(response)
+            part.write(prefix)
+            writing = time.monotonic() - writing
+            if response is not None:
+                async for chunk in response.iter_chunks():
+                    started = time.monotonic()
+                    part.write(chunk)
+                    writing += time.monotonic() - started
+        except OSError:
+            # What made it to disk can not be vouched for after a failed local write.
+            part.discard()
+            raise
+        except BaseException:
+            part.suspend()
+            raise
+        started = time.monotonic()
+        size = part.offset
+        path = None
+        try:
+            if store is None:
+                path = self.get_save_path(url, dimensions, modified)
+                part.commit(path)
+            else:
+                digest = part.close()
+                store.adopt(part.path, digest, size)
+                part.remove_sidecar()
+                store.record(url, digest, part.validator)
+                path = self.get_save_path(url, dimensions, modified)
+                store.link(digest, path)
+        except OSError:
+            part.discard()
+            if path is not None:
+                self.release_save_path(path)
+            raise
+        if self.metrics is not None:
+            self.metrics.observe('write', urlsplit(url).hostname,
+                                 writing + time.monotonic() - started)
+        self.result(url, 'saved', path, size)
+        return path
+    
+    def release_save_path(self, path):
+        '''Remove the file reserved at `path` by `get_save_path()`, after saving to it failed,
+        and free its name.
+        '''
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.get_names().discard(os.path.basename(path))
+    
+    def get_output_dir(self):
+        '''Return the directory the metadata files are written to (option -od), creating it if
+        needed. Default is the current working directory.
+        '''
+        output_dir = self.options.get('output_dir') or os.getcwd()
+        os.makedirs(output_dir, exist_ok=True)
+        return output_dir
+    
+    def get_metadata(self):
+        '''Return the `Metadata` file of the output directory, opening it on first use.'''
+        if self.metadata is None:
+            path = os.path.join(self.get_output_dir(), 'scraper-metadata.sqlite')
+            if self.shared is not None:
+                self.metadata = self.shared.get_metadata(path)
+            else:
+                self.metadata = Metadata(path, commit_every=1 if self.batch_worker else None)
+            self.log('self.metadata:', path)
+        return self.metadata
+    
+    def get_frontier(self, uris):
+        '''Return the `Frontier` for a recursive crawl of `uris`. The frontier file is named after
+        the scraper and the URIs, so that running the same job again resumes the same crawl.
+        '''
+        digest = hashlib.sha1('\n'.join(sorted(uris)).encode('utf-8')).hexdigest()[:12]
+        path = os.path.join(self.get_output_dir(),
+                            '{}-frontier-{}.sqlite'.format(self.name, digest))
+        return Frontier(path)
+    
+    def in_scope(self, url, root):
+        '''Return True if the page at `url` lies under the URI resource `root`, and so may be
+        recursed into.
+        '''
+        root = canonicalize_url(root)
+        scope = root if root.endswith('/') else root.rsplit('/', 1)[0] + '/'
+        url = canonicalize_url(url)
+        return url == root or url.startswith(scope)
+    
+    async def crawl(self, uris):
+        '''Recursively scrape `uris`, keeping the pending and visited URLs in a disk-backed
+        `Frontier`. An interrupted crawl is resumed the next time the same job is run.
+        
+        The URI resources take turns at the frontier, and a URL whose host is still waiting out
+        option -s or -w is set aside until its turn comes while the workers move on to others.
+        '''
+        frontier = self.get_frontier(uris)
+        if frontier.resumed:
+            self.write('Resuming crawl from {}'.format(frontier.path))
+        else:
+            for uri in uris:
+                frontier.add(uri, depth=0, root=uri)
+        self.crawl_active = 0
+        self.crawl_changed = asyncio.Condition()
+        complete = False
+        try:
+            await asyncio.gather(*(self.crawl_worker(frontier)
+                                   for _ in range(self.fetcher.num_resources)))
+            complete = True
+        finally:
+            frontier.close(complete=complete)
+    
+    async def crawl_worker(self, frontier):
+        '''Take items from `frontier` until it is empty and no other worker can add to it.'''
+        while True:
+            item = self.next_crawl_item(frontier)
+            if item is None:
+                async with self.crawl_changed:
+                    if self.crawl_active == 0 and not self.scheduler.deferred:
+                        self.crawl_changed.notify_all()
+                        return
+                    try:
+                        await asyncio.wait_for(self.crawl_changed.wait(),
+                                               self.scheduler.next_due())
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+            self.crawl_active += 1
+            try:
+                await self.crawl_item(frontier, item)
+                frontier.done(item.url)
+            except Exception:
+                frontier.done(item.url)
+                raise
+            finally:
+                # An item cancelled partway, as on Ctrl-C, stays leased, so that the frontier
+                # makes it pending again when the crawl is resumed.
+                self.crawl_active -= 1
+                async with self.crawl_changed:
+                    self.crawl_changed.notify_all()
+    
+    def next_crawl_item(self, frontier):
+        '''Return the next `FrontierItem` whose host may be fetched now, or None. Items whose
+        host must still wait are deferred in the `Scheduler`, and items of URI resources that
+        reached the download limit are dropped.
+        '''
+        scheduler = self.scheduler
+        item = scheduler.pop_due()
+        while item is None and not scheduler.full:
+            item = frontier.pop()
+            if item is None:
+                break
+            if scheduler.exhausted(item.root):
+                frontier.done(item.url)
+                item = None
+                continue
+            due = scheduler.reserve(item.url, item.depth)
+            if due > time.monotonic():
+                scheduler.defer(item, due)
+                item = None
+        return item
+    
+    async def crawl_item(self, frontier, item):
+        '''Scrape a single `FrontierItem`, adding the links it contains to `frontier` as soon as
+        they are found so that idle workers can start on them.
+        '''
+        if self.scheduler.exhausted(item.root):
+            return
+        if item.kind == IMAGE:
+            await self.download(item.url, referrer=item.referrer, root=item.root)
+            return
+        
+        async def on_links(links):
+            depth = item.depth + 1
+            candidates = self.get_candidates()
+            frontier.add_many([link for link, kind in links
+                               if kind == IMAGE and candidates.check_url(link)],
+                              depth, item.root, kind=IMAGE, referrer=item.url)
+            frontier.add_many([link for link, kind in links if kind == STYLESHEET], depth,
+                              item.root, kind=STYLESHEET, referrer=item.url)
+            frontier.add_many([link for link, kind in links
+                               if kind == PAGE and self.in_scope(link, item.root)],
+                              depth, item.root, kind=PAGE, referrer=item.url)
+            async with self.crawl_changed:
+                self.crawl_changed.notify_all()
+        
+        if item.kind == STYLESHEET:
+            await self.scrape_stylesheet(item.url, referrer=item.referrer, on_links=on_links)
+        else:
+            await self.scrape_page(item.url, referrer=item.referrer, on_links=on_links)
     
     def handle(self):
         '''Main class method that drives the work on scraping the images for this derived class
@@ -434,7 +2042,7 @@ format of the URI. Formats for URI:
         
         Base class stub. Needs to be implemented.
         
-        sub_parser() should be implemented like so:
+        handle() should be implemented like so:
         
         >>> def handle():
         >>>     # main code to do work on scraping the images for this specific parser
@@ -39,24 +39,20 @@ class TumblrScraper(TemplateScraper):
                                        'from each blog.'))
         super().parse_arguments()
     
-    @staticmethod
-    def sub_parser(subparsers):
-        '''A subparser is passed in as `subparsers`. Add a new subparser to the `subparsers` object
-        then return that subparser. See `argparse.ArgumentsParser` for details.
+    def resolve_uri(self, uri):
+        '''Turn a blog name, such as `cars`, into the URL of that tumblr blog. Full URLs are
+        passed through unchanged.
         '''
-        parser = subparsers.add_parser('tumblr',
-                                       help=('Invoke the tumblr scraper to scrape images off '
-                                             'of tumblr.com'))
-        return parser
+        if '://' in uri or '.' in uri:
+            return uri if '://' in uri else 'https://' + uri
+        return 'https://{}.tumblr.com/'.format(uri)
     
     def handle(self):
         '''Main class method that drives the work on scraping the images for this TumblrScraper.
         '''
-        self.write('Args:', self.args)
-        self.write('Parser:', self.parser)
-        self.write('Parsed options:', self.options)
-        self.write('')
-        self.write('This is the TumblrScraper.')
+        self.log('Args:', self.args)
+        self.log('Parsed options:', self.options)
+        self.scrape(self.options.get('uri'))
 
 
 if __name__ == '__main__':
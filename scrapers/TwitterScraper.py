@@ -46,23 +46,20 @@ class TwitterScraper(TemplateScraper):
                                        'their modification date to be less than END_DATE'))
         super().parse_arguments()
     
-    @staticmethod
-    def sub_parser(subparsers):
-        '''A subparser is passed in as `subparsers`. Add a new subparser to the `subparsers` object
-        then return that subparser. See `argparse.ArgumentsParser` for details.
+    def resolve_uri(self, uri):
+        '''Turn a profile name, such as `billgates`, into the URL of that profile's media
+        timeline. Full URLs are passed through unchanged.
         '''
-        parser = subparsers.add_parser('twitter', help=('Invoke the twitter scraper to scrape '
-                                                        'images off of twitter.com'))
-        return parser
+        if '://' in uri:
+            return uri
+        return 'https://twitter.com/{}/media'.format(uri.lstrip('@'))
     
     def handle(self):
         '''Main class method that drives the work on scraping the images for this GenericScraper.
         '''
-        self.write('Args:', self.args)
-        self.write('Parser:', self.parser)
-        self.write('Parsed options:', self.options)
-        self.write('')
-        self.write('This is the TwitterScraper.')
+        self.log('Args:', self.args)
+        self.log('Parsed options:', self.options)
+        self.scrape(self.options.get('uri'))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+'''Tests of `FilenameTemplate` and `NameIndex`.
+
+   usage:
+       $ python -m unittest tests.test_filename_template
+'''
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from scrapers.FilenameTemplate import FilenameTemplate, NAME_MAX, NameIndex, sanitize_name
+
+
+class FilenameTemplateTest(unittest.TestCase):
+    """Templates of option -of."""
+    
+    def test_placeholders(self):
+        '''The name, extension, dimensions, and counter are filled in.'''
+        template = FilenameTemplate('%n_%wx%h_##.%e')
+        self.assertTrue(template.needs_dimensions)
+        self.assertEqual(template.render('photo', 'jpg', (640, 480)), 'photo_640x480_01.jpg')
+        self.assertEqual(template.render('photo', 'jpg'), 'photo_x_02.jpg')
+    
+    def test_dates(self):
+        '''%fd is the last modification date, or today if unknown; %% is a literal %.'''
+        modified = datetime.datetime(2017, 12, 29, 10, 30).timestamp()
+        template = FilenameTemplate('%fd(%Y%m%d)_100%%.%e')
+        self.assertFalse(template.needs_dimensions)
+        self.assertEqual(template.render('a', 'png', modified=modified), '20171229_100%.png')
+        today = datetime.datetime.now().strftime('%Y%m%d')
+        self.assertEqual(template.render('a', 'png'), '{}_100%.png'.format(today))
+    
+    def test_unknown_placeholder(self):
+        '''An unknown placeholder is a ValueError.'''
+        with self.assertRaises(ValueError):
+            FilenameTemplate('%q.%e')
+    
+    def test_render_sanitized(self):
+        '''Path separators and control characters never make it into a name.'''
+        template = FilenameTemplate('%n.%e')
+        self.assertEqual(template.render('a/b\0c', 'png'), 'a_bc.png')
+        self.assertEqual(FilenameTemplate('..').render('photo', 'jpg'), 'photo')
+
+
+class SanitizeNameTest(unittest.TestCase):
+    """Names made safe to use as filenames."""
+    
+    def test_characters(self):
+        '''NUL and control characters are dropped, and trailing dots and spaces stripped.'''
+        self.assertEqual(sanitize_name('a\x00b\x1f\x7f.png'), 'ab.png')
+        self.assertEqual(sanitize_name('name. .'), 'name')
+        self.assertEqual(sanitize_name('..'), '')
+    
+    def test_length(self):
+        '''Long names are cut to NAME_MAX bytes, keeping the extension and whole characters.'''
+        name = sanitize_name('x' * 400 + '.png')
+        self.assertEqual(len(name), NAME_MAX)
+        self.assertTrue(name.endswith('x.png'))
+        name = sanitize_name('é' * 200 + '.jpg')
+        self.assertLessEqual(len(name.encode('utf-8')), NAME_MAX)
+        self.assertTrue(name.endswith('é.jpg'))
+
+
+class NameIndexTest(unittest.TestCase):
+    """Free filenames handed out in a directory."""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='test-names-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+    
+    def test_suffixes(self):
+        '''Taken names get an incremental suffix, and each name is claimed on disk.'''
+        with open(os.path.join(self.directory, 'img.jpg'), 'w'):
+            pass
+        names = NameIndex(self.directory)
+        self.assertEqual(names.reserve('img.jpg'), 'img_1.jpg')
+        self.assertEqual(names.reserve('img.jpg'), 'img_2.jpg')
+        self.assertEqual(names.reserve('other.jpg'), 'other.jpg')
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['img.jpg', 'img_1.jpg', 'img_2.jpg', 'other.jpg'])
+    
+    def test_claimed_elsewhere(self):
+        '''A name claimed by another process since the scan is skipped.'''
+        names = NameIndex(self.directory)
+        with open(os.path.join(self.directory, 'img.jpg'), 'w'):
+            pass
+        self.assertEqual(names.reserve('img.jpg'), 'img_1.jpg')
+    
+    def test_discard(self):
+        '''A discarded name is handed out again once its file is gone.'''
+        names = NameIndex(self.directory)
+        name = names.reserve('img.jpg')
+        os.unlink(os.path.join(self.directory, name))
+        names.discard(name)
+        self.assertEqual(names.reserve('img.jpg'), 'img.jpg')
+    
+    def test_unsafe_names(self):
+        '''Names with NUL bytes or over NAME_MAX bytes, suffixed or not, can be created.'''
+        names = NameIndex(self.directory)
+        self.assertEqual(names.reserve('a\x00b.png'), 'ab.png')
+        long_name = 'x' * 300 + '.png'
+        first = names.reserve(long_name)
+        second = names.reserve(long_name)
+        self.assertEqual(len(first), NAME_MAX)
+        self.assertEqual(len(second), NAME_MAX)
+        self.assertTrue(second.endswith('_1.png'))
+        self.assertEqual(names.reserve(''), 'index')
+    
+    def test_unwritable(self):
+        '''A name that can not be created raises OSError and is not kept as taken.'''
+        names = NameIndex(self.directory)
+        shutil.rmtree(self.directory)
+        with self.assertRaises(OSError):
+            names.reserve('img.jpg')
+        os.mkdir(self.directory)
+        self.assertEqual(names.reserve('img.jpg'), 'img.jpg')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+'''Tests of `PartFile`, of concurrent downloads of the same URL through `scraper.py`, and of a
+crawl that goes on past an image that can not be written.
+
+   usage:
+       $ python -m unittest tests.test_part_file
+'''
+
+import errno
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.site_generator import make_image
+from scrapers.PartFile import PartFile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URL = 'http://127.0.0.1/big.png'
+
+
+class PartFileTest(unittest.TestCase):
+    """Downloads of the same URL at once each write a part of their own."""
+    
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix='test-part-')
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+    
+    def test_concurrent_parts(self):
+        '''Two parts of the same URL open at once are committed side by side.'''
+        first = PartFile(self.data_dir, URL)
+        second = PartFile(self.data_dir, URL)
+        first.open()
+        second.open()
+        self.assertNotEqual(first.path, second.path)
+        first.validator = second.validator = '"v"'
+        first.write(b'a' * 10)
+        second.write(b'b' * 20)
+        first.checkpoint()
+        second.checkpoint()
+        first.commit(os.path.join(self.data_dir, 'first.png'))
+        second.commit(os.path.join(self.data_dir, 'second.png'))
+        with open(os.path.join(self.data_dir, 'first.png'), 'rb') as fd:
+            self.assertEqual(fd.read(), b'a' * 10)
+        with open(os.path.join(self.data_dir, 'second.png'), 'rb') as fd:
+            self.assertEqual(fd.read(), b'b' * 20)
+        self.assertEqual(sorted(os.listdir(self.data_dir)), ['first.png', 'second.png'])
+    
+    def test_resume_claimed_once(self):
+        '''A part left behind is resumed by only one of two downloads looking for it.'''
+        part = PartFile(self.data_dir, URL)
+        part.open()
+        part.validator = '"v"'
+        part.write(b'a' * 10)
+        part.suspend()
+        first = PartFile.find(self.data_dir, URL)
+        second = PartFile.find(self.data_dir, URL)
+        self.assertIsNotNone(first)
+        self.assertIsNone(second)
+        self.assertEqual(first.range_headers(), {'Range': 'bytes=10-', 'If-Range': '"v"'})
+        first.open()
+        first.write(b'b' * 5)
+        first.commit(os.path.join(self.data_dir, 'big.png'))
+        with open(os.path.join(self.data_dir, 'big.png'), 'rb') as fd:
+            self.assertEqual(fd.read(), b'a' * 10 + b'b' * 5)
+        self.assertEqual(os.listdir(self.data_dir), ['big.png'])
+    
+    def test_stale_part_removed(self):
+        '''A part no sidecar names, left by a run killed before its first checkpoint, is removed
+        when a new part of the URL is created, while parts still open and the resumable part
+        are kept.
+        '''
+        active = PartFile(self.data_dir, URL)
+        active.open()
+        resumable = PartFile(self.data_dir, URL)
+        resumable.open()
+        resumable.validator = '"v"'
+        resumable.write(b'b' * 10)
+        resumable.suspend()
+        stale = PartFile(self.data_dir, URL)
+        stale.open()
+        stale.write(b'a' * 10)
+        stale.fd.close()
+        fresh = PartFile(self.data_dir, URL)
+        fresh.open()
+        self.assertEqual(fresh.path, stale.path)
+        self.assertEqual(sorted(os.listdir(self.data_dir)),
+                         sorted(os.path.basename(part.path) for part in
+                                (fresh, resumable, active)) + [os.path.basename(fresh.sidecar)])
+        self.assertIsNotNone(PartFile.find(self.data_dir, URL))
+    
+    def test_find_unwritable(self):
+        '''A part left behind is not resumed when no part can be created in its place.'''
+        part = PartFile(self.data_dir, URL)
+        part.open()
+        part.validator = '"v"'
+        part.write(b'a' * 10)
+        part.suspend()
+        with mock.patch.object(PartFile, 'reserve',
+                               side_effect=OSError(errno.EROFS, 'Read-only file system')):
+            self.assertIsNone(PartFile.find(self.data_dir, URL))
+        self.assertIsNotNone(PartFile.find(self.data_dir, URL))
+
+
+class ConcurrentDownloadTest(unittest.TestCase):
+    """Two pages embedding the same image, scraped at once."""
+    
+    def run_scraper(self, *options):
+        '''Scrape both pages with `options`. Returns the process and the saved files.'''
+        rng = random.Random(1)
+        page = b'<html><body><img src="/big.png"></body></html>'
+        resources = {'/a.html': page, '/b.html': page,
+                     '/big.png': make_image('png', 800, 600, 2 ** 21, rng)}
+        work_dir = tempfile.mkdtemp(prefix='test-part-')
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        data_dir = os.path.join(work_dir, 'data')
+        with FixtureServer(resources, latency=0.05) as server:
+            process = subprocess.run(
+                [sys.executable, 'scraper.py', 'generic', '-R', '4', '-od', work_dir,
+                 '-dd', data_dir] + list(options) + [server.url('/a.html'),
+                                                      server.url('/b.html')],
+                cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+        with open(os.path.join(data_dir, 'big.png'), 'rb') as fd:
+            self.assertEqual(fd.read(), resources['/big.png'])
+        return process, [name for name in os.listdir(data_dir) if not name.startswith('.')]
+    
+    def test_dedup(self):
+        '''The image is saved once, without leaving parts behind.'''
+        process, names = self.run_scraper()
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(names, ['big.png'])
+    
+    def test_no_dedup(self):
+        '''The same holds with option -nd.'''
+        process, names = self.run_scraper('-nd')
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(names, ['big.png'])
+
+
+# Run scraper.py with the writes of the part of 07.png failing as on a full disk.
+FAILING_WRITE = '''
+import errno, runpy, sys
+from scrapers.PartFile import PartFile
+write = PartFile.write
+def failing_write(self, data):
+    if self.url.endswith('/07.png') and data:
+        raise OSError(errno.ENOSPC, 'No space left on device')
+    write(self, data)
+PartFile.write = failing_write
+sys.argv = ['scraper.py'] + sys.argv[1:]
+runpy.run_path('scraper.py', run_name='__main__')
+'''
+
+
+class FailingWriteTest(unittest.TestCase):
+    """A crawl in which one image can not be written to disk."""
+    
+    def run_scraper(self, *options):
+        '''Crawl a page of 20 images with `options`. Returns the process, the saved files, and
+        the files the images were written to.
+        '''
+        rng = random.Random(1)
+        names = ['{:02}.png'.format(index) for index in range(20)]
+        page = ''.join('<img src="/{}">'.format(name) for name in names).encode('ascii')
+        resources = {'/index.html': b'<html><body>' + page + b'</body></html>'}
+        resources.update(('/' + name, make_image('png', 64, 64, 4096, rng)) for name in names)
+        work_dir = tempfile.mkdtemp(prefix='test-part-')
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        data_dir = os.path.join(work_dir, 'data')
+        with FixtureServer(resources) as server:
+            process = subprocess.run(
+                [sys.executable, '-c', FAILING_WRITE, 'generic', '-r', '-R', '4',
+                 '-od', work_dir, '-dd', data_dir] + list(options) +
+                [server.url('/index.html')],
+                cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, timeout=60)
+        saved = sorted(name for name in os.listdir(data_dir) if not name.startswith('.'))
+        return process, saved, names
+    
+    def check_crawl(self, *options):
+        '''The crawl reports the error and saves every other image, leaving no part behind.'''
+        process, saved, names = self.run_scraper(*options)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(saved, [name for name in names if name != '07.png'])
+        self.assertIn('Error: [Errno {}]'.format(errno.ENOSPC), process.stdout)
+    
+    def test_dedup(self):
+        '''The other images are saved through the dedup store.'''
+        self.check_crawl()
+    
+    def test_no_dedup(self):
+        '''The other images are saved with option -nd.'''
+        self.check_crawl('-nd')
+
+
+if __name__ == '__main__':
+    unittest.main()
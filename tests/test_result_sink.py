@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+'''Tests of the targets of `ResultSink`.
+
+   usage:
+       $ python -m unittest tests.test_result_sink
+'''
+
+import io
+import json
+import unittest
+
+from scrapers.Fetcher import FetchError
+from scrapers.ResultSink import JsonLinesTarget, Result, ResultSink
+
+
+class JsonLinesTargetTest(unittest.TestCase):
+    """Results written as JSON lines."""
+    
+    def test_error_result(self):
+        '''The exception of an error result is written as its string.'''
+        stream = io.StringIO()
+        sink = ResultSink(JsonLinesTarget(stream))
+        sink.add(Result('http://127.0.0.1/img.png', 'saved', 'img.png', 1024, 0.0, 0.2))
+        sink.add(Result('http://127.0.0.1/missing.png', 'error',
+                        detail=FetchError('Timed out fetching http://127.0.0.1/missing.png')))
+        sink.add(Result('http://127.0.0.1/gone.png', 'skipped', detail=404))
+        sink.flush()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line['status'] for line in lines], ['saved', 'error', 'skipped'])
+        self.assertEqual(lines[0]['size'], 1024)
+        self.assertEqual(lines[1]['detail'], 'Timed out fetching http://127.0.0.1/missing.png')
+        self.assertEqual(lines[2]['detail'], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()